@@ -1,53 +1,59 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+from prometheus_client import CONTENT_TYPE_LATEST
 import os
-import asyncio
-import threading
-import requests
-from mediasoup import Demo  
-from urllib.parse import urlparse, parse_qs
-from aiortc.contrib.media import MediaPlayer, MediaBlackhole
-import subprocess
-
-def get_video_duration(video_url):
-    result = subprocess.run([
-        'ffprobe', '-v', 'error', '-show_entries',
-        'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', video_url
-    ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    return float(result.stdout)
+import math
+import uuid
+import multiprocessing
+from batch import BatchManager, template_urls
+from engine import SessionEngine, EngineFull
+from startup import notify, run_batch_peer, run_demo, report_lost_session, warm_up
+from supervisor import Supervisor
+import metrics
 
 app = Flask(__name__)
 
-# Environment variable for default video source URL
-DEFAULT_VIDEO_SRC_URL = os.getenv('DEFAULT_VIDEO_SRC_URL', 'https://sample-videos.com/video321/mp4/720/big_buck_bunny_720p_1mb.mp4')
 PORT= os.getenv('PORT',5000)
+# Admission control: sessions running at once and sessions waiting for a slot
+# (per worker process in supervisor mode)
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', 8))
+MAX_QUEUED_SESSIONS = int(os.getenv('MAX_QUEUED_SESSIONS', 32))
+# Number of worker processes; 0 runs every session in this process, -1 starts
+# one worker per CPU core
+WORKERS = int(os.getenv('WORKERS', 0))
+# Import and initialize the session stack (codecs, a Device, the default
+# media) in the background as soon as the service starts; /ready answers 200
+# once that is done. With 0 the first session does it
+WARMUP = os.getenv('WARMUP', '1') == '1'
+# /join-calls: most peers one batch may start, and how many it starts per
+# second unless the request sets "ramp" (0 starts them as fast as there are
+# slots)
+MAX_BATCH_PEERS = int(os.getenv('MAX_BATCH_PEERS', 1000))
+BATCH_RAMP = float(os.getenv('BATCH_RAMP', 10))
 
-def run_demo(ws_url, success_url, failure_url):
-    player = MediaPlayer(DEFAULT_VIDEO_SRC_URL)
-    recorder = MediaBlackhole()
-    
-    video_duration = get_video_duration(DEFAULT_VIDEO_SRC_URL)
+def session_done(session_id, failed):
+    batches.on_done(session_id, failed)
 
-    print('*** video duration: ', video_duration)
+def session_lost(session_id, *args):
+    # Batch peers are reported in their batch's summary
+    if not batches.owns(session_id):
+        report_lost_session(session_id, *args)
 
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    print('**** ws_url:', ws_url)
-    try:
-        # Execute the Demo logic using asyncio
-        demo = Demo(uri=ws_url, player=player, recorder=recorder, loop=loop, time=video_duration + 5)
-        result = loop.run_until_complete(demo.run())
-        
-        # Notify success_url if provided
-        if success_url:
-            requests.put(success_url, json={"status": "success"})
-        
-        print('Demo completed successfully.')
-    except Exception as e:
-        # Notify failure_url if provided
-        if failure_url:
-            requests.put(failure_url, json={"status": "failure"})        
-        print(f'Error during demo execution: {str(e)}')
+def create_engine():
+    if WORKERS:
+        return Supervisor(
+            workers=WORKERS if WORKERS > 0 else None,
+            max_sessions=MAX_SESSIONS,
+            max_queue=MAX_QUEUED_SESSIONS,
+            on_lost=session_lost,
+            warmup=warm_up if WARMUP else None,
+            on_done=session_done,
+        )
+    # All sessions share one long-lived event loop
+    return SessionEngine(max_sessions=MAX_SESSIONS, max_queue=MAX_QUEUED_SESSIONS, on_done=session_done, warmup=warm_up if WARMUP else None)
+
+# Spawned worker processes import this module again; only the parent serves HTTP
+engine = create_engine() if multiprocessing.current_process().name == 'MainProcess' else None
+batches = BatchManager(engine, run_batch_peer, notify) if engine is not None else None
 
 @app.route('/join-call', methods=['POST'])
 def join_call():
@@ -59,13 +65,111 @@ def join_call():
     if not ws_url:
         return jsonify(error="ws_url parameter is required"), 400
 
-   
-    
-    # Run demo in a separate thread
-    thread = threading.Thread(target=run_demo, args=(ws_url, success_url, failure_url))
-    thread.start()
-    
-    return jsonify(status="success"), 200
+    # Queue the session and answer right away
+    try:
+        session_id = engine.submit(run_demo, ws_url, success_url, failure_url, info={"ws_url": ws_url})
+    except EngineFull as e:
+        return jsonify(error=f"Too many sessions: {e}"), 429
+
+    return jsonify(status="success", session_id=session_id), 200
+
+@app.route('/join-calls', methods=['POST'])
+def join_calls():
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify(error="Expected a JSON object"), 400
+    template = data.get('template')
+    try:
+        ramp = float(data.get('ramp', BATCH_RAMP))
+    except (TypeError, ValueError):
+        ramp = math.nan
+    if not math.isfinite(ramp):
+        return jsonify(error="ramp must be a number"), 400
+    success_url = data.get('success_url')
+    failure_url = data.get('failure_url')
+
+    batch_id = uuid.uuid4().hex
+    if template:
+        if not isinstance(template, dict):
+            return jsonify(error="template must be an object"), 400
+        if not template.get('server') or not template.get('peers'):
+            return jsonify(error="template needs server and peers"), 400
+        if not isinstance(template['server'], str) or not isinstance(template.get('room') or '', str):
+            return jsonify(error="template server and room must be strings"), 400
+        try:
+            peers = int(template['peers'])
+        except (TypeError, ValueError):
+            return jsonify(error="template peers must be an integer"), 400
+        if peers <= 0:
+            return jsonify(error="template peers must be positive"), 400
+        if peers > MAX_BATCH_PEERS:
+            return jsonify(error=f"At most {MAX_BATCH_PEERS} peers per batch"), 400
+        ws_urls = template_urls(template['server'], template.get('room') or batch_id[:8], peers, batch_id[:8])
+    else:
+        ws_urls = data.get('ws_urls')
+    if not ws_urls:
+        return jsonify(error="ws_urls or template parameter is required"), 400
+    if not isinstance(ws_urls, list) or not all(isinstance(url, str) and url for url in ws_urls):
+        return jsonify(error="ws_urls must be a list of URLs"), 400
+    if len(ws_urls) > MAX_BATCH_PEERS:
+        return jsonify(error=f"At most {MAX_BATCH_PEERS} peers per batch"), 400
+    if ramp < 0:
+        return jsonify(error="ramp must not be negative"), 400
+
+    # Peers are started in the background at the ramp rate
+    batches.submit(ws_urls, ramp, success_url, failure_url, batch_id=batch_id)
+    return jsonify(status="success", batch_id=batch_id, peers=len(ws_urls)), 200
+
+@app.route('/batches', methods=['GET'])
+def list_batches():
+    return jsonify(batches=batches.batches()), 200
+
+@app.route('/batches/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    batch = batches.batch(batch_id, sessions=request.args.get('sessions') == '1')
+    if batch is None:
+        return jsonify(error="Unknown batch"), 404
+    return jsonify(batch), 200
+
+@app.route('/batches/<batch_id>', methods=['DELETE'])
+def cancel_batch(batch_id):
+    # Peers not started yet are dropped, running ones tear down in the background
+    if not batches.cancel(batch_id):
+        return jsonify(error="Unknown batch"), 404
+    return jsonify(status="cancelling", batch_id=batch_id), 202
+
+@app.route('/sessions', methods=['GET'])
+def list_sessions():
+    return jsonify(sessions=engine.sessions()), 200
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = engine.session(session_id)
+    if session is None:
+        return jsonify(error="Unknown session"), 404
+    return jsonify(session), 200
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def cancel_session(session_id):
+    # The session tears down in the background and reports to failure_url
+    if not engine.cancel(session_id):
+        return jsonify(error="Unknown session"), 404
+    return jsonify(status="cancelling", session_id=session_id), 202
+
+@app.route('/status', methods=['GET'])
+def status():
+    return jsonify(engine.stats()), 200
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    # Readiness probe: sessions start without paying for first-time set-up
+    if not engine.ready:
+        return jsonify(ready=False), 503
+    return jsonify(ready=True), 200
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(engine), mimetype=CONTENT_TYPE_LATEST)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=PORT)
@@ -0,0 +1,289 @@
+import time
+import uuid
+import heapq
+import threading
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+from engine import EngineFull
+
+# Sends a batch summary: (url, payload)
+BatchNotify = Callable[[str, dict], None]
+
+# How long a batch waits before submitting again when the engine is full
+# (seconds)
+RETRY_INTERVAL = 0.1
+# Finished batches kept for GET /batches/<id>, oldest dropped first
+MAX_FINISHED_BATCHES = 100
+
+
+def template_urls(server: str, room: str, peers: int, prefix: str) -> List[str]:
+    """The ws_url of each of ``peers`` peers joining ``room`` on ``server``."""
+    separator = "&" if "?" in server else "?"
+    return [
+        f"{server}{separator}{urlencode({'roomId': room, 'peerId': f'{prefix}-{n}'})}"
+        for n in range(peers)
+    ]
+
+
+class _Peer:
+    def __init__(self, ws_url: str):
+        self.ws_url = ws_url
+        self.session_id: Optional[str] = None
+        # "pending" until submitted to the engine, then "submitted" until it
+        # is "completed", "failed" or "cancelled"
+        self.state = "pending"
+        self.submitted_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "ws_url": self.ws_url,
+            "state": self.state,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class _Batch:
+    def __init__(self, batch_id: str, peers: List[_Peer], ramp: float, success_url, failure_url):
+        self.batch_id = batch_id
+        self.peers = peers
+        self.ramp = ramp
+        self.success_url = success_url
+        self.failure_url = failure_url
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        # Index of the next peer to submit
+        self.next = 0
+        # When the next peer is due (monotonic)
+        self.due = time.monotonic()
+
+    @property
+    def done(self) -> bool:
+        return all(peer.state not in ("pending", "submitted") for peer in self.peers)
+
+
+class BatchManager:
+    """
+    Starts batches of sessions through a SessionEngine or Supervisor from a
+    single scheduler thread.
+
+    Each batch's peers are submitted one every ``1 / ramp`` seconds, so they
+    join the server staggered rather than all at once; with ``ramp`` 0 they
+    are submitted back to back. While the engine is full the batch waits and
+    then carries on at its ramp rate. The engine must report every session's
+    end to ``on_done``.
+
+    ``batch`` returns a batch's aggregated progress. Once every peer ended,
+    one summary is sent to the batch's ``success_url`` when they all
+    completed, or to its ``failure_url`` otherwise, through ``notify``.
+    """
+
+    def __init__(self, engine, factory, notify: Optional[BatchNotify] = None):
+        self._engine = engine
+        # Called as factory(session id, ws_url, batch id) by the engine
+        self._factory = factory
+        self._notify = notify
+        self._lock = threading.Condition()
+        self._batches: Dict[str, _Batch] = {}
+        # session id -> (batch, peer)
+        self._sessions: Dict[str, tuple] = {}
+        # (due, sequence, batch id) of batches with peers left to submit
+        self._schedule: List[tuple] = []
+        self._sequence = 0
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        ws_urls: List[str],
+        ramp: float,
+        success_url: Optional[str] = None,
+        failure_url: Optional[str] = None,
+        batch_id: Optional[str] = None,
+    ) -> str:
+        batch_id = batch_id or uuid.uuid4().hex
+        batch = _Batch(batch_id, [_Peer(url) for url in ws_urls], ramp, success_url, failure_url)
+        with self._lock:
+            self._batches[batch_id] = batch
+            self._push(batch)
+            self._lock.notify()
+        return batch_id
+
+    def owns(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def batch(self, batch_id: str, sessions: bool = False) -> Optional[dict]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            peers = [peer.as_dict() for peer in batch.peers]
+        # Queued and running as the engine last saw them
+        for peer in peers:
+            if peer["state"] == "submitted":
+                session = self._engine.session(peer["session_id"])
+                if session is not None:
+                    peer["state"] = session["state"]
+        counts: Dict[str, int] = {}
+        for peer in peers:
+            counts[peer["state"]] = counts.get(peer["state"], 0) + 1
+        result = {
+            "batch_id": batch.batch_id,
+            "state": self._state(batch),
+            "peers": len(peers),
+            "ramp": batch.ramp,
+            "created_at": batch.created_at,
+            "finished_at": batch.finished_at,
+            **{
+                state: counts.get(state, 0)
+                for state in ("pending", "submitted", "queued", "running", "completed", "failed", "cancelled")
+            },
+        }
+        if sessions:
+            result["sessions"] = peers
+        return result
+
+    def batches(self) -> List[dict]:
+        with self._lock:
+            batch_ids = list(self._batches)
+        return [self.batch(batch_id) for batch_id in batch_ids]
+
+    def cancel(self, batch_id: str) -> bool:
+        """
+        Stops submitting the batch's peers and cancels the ones submitted;
+        returns False if the batch is unknown or over.
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None or batch.finished_at is not None:
+                return False
+            batch.cancelled = True
+            submitted = []
+            for peer in batch.peers:
+                if peer.state == "pending":
+                    peer.state = "cancelled"
+                    peer.finished_at = time.time()
+                elif peer.state == "submitted":
+                    submitted.append(peer.session_id)
+            finished = self._finish(batch)
+        for session_id in submitted:
+            self._engine.cancel(session_id)
+        if finished:
+            self._send_summary(batch)
+        return True
+
+    def on_done(self, session_id: str, failed: bool):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return
+            batch, peer = entry
+            if batch.cancelled and failed:
+                peer.state = "cancelled"
+            else:
+                peer.state = "failed" if failed else "completed"
+            peer.finished_at = time.time()
+            finished = self._finish(batch)
+        if finished:
+            self._send_summary(batch)
+
+    @staticmethod
+    def _state(batch: _Batch) -> str:
+        if batch.finished_at is not None:
+            return "cancelled" if batch.cancelled else "done"
+        if batch.cancelled:
+            return "cancelling"
+        return "ramping" if batch.next < len(batch.peers) else "running"
+
+    def _push(self, batch: _Batch):
+        self._sequence += 1
+        heapq.heappush(self._schedule, (batch.due, self._sequence, batch.batch_id))
+
+    def _finish(self, batch: _Batch) -> bool:
+        # Called with the lock held; True the first time the batch is over
+        if batch.finished_at is not None or not batch.done:
+            return False
+        batch.finished_at = time.time()
+        return True
+
+    def _prune(self, keep: _Batch):
+        # Drops the batches that finished first beyond MAX_FINISHED_BATCHES,
+        # never the one just summarised
+        with self._lock:
+            finished = sorted(
+                (other for other in self._batches.values() if other.finished_at is not None and other is not keep),
+                key=lambda other: other.finished_at,
+            )
+            for other in finished[: max(len(finished) + 1 - MAX_FINISHED_BATCHES, 0)]:
+                del self._batches[other.batch_id]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._schedule:
+                    self._lock.wait()
+                due, _, batch_id = self._schedule[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    # Woken early by a new batch, which may be due first
+                    self._lock.wait(delay)
+                    continue
+                heapq.heappop(self._schedule)
+                batch = self._batches.get(batch_id)
+                if batch is None or batch.cancelled or batch.next >= len(batch.peers):
+                    continue
+                peer = batch.peers[batch.next]
+            self._start(batch, peer)
+
+    def _start(self, batch: _Batch, peer: _Peer):
+        # Outside the lock: the engine may report the session done before
+        # submit returns
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = (batch, peer)
+        try:
+            self._engine.submit(
+                self._factory,
+                peer.ws_url,
+                batch.batch_id,
+                session_id=session_id,
+                info={"ws_url": peer.ws_url, "batch_id": batch.batch_id},
+            )
+        except EngineFull:
+            with self._lock:
+                self._sessions.pop(session_id, None)
+                batch.due = time.monotonic() + RETRY_INTERVAL
+                self._push(batch)
+            return
+        with self._lock:
+            if peer.state == "pending":
+                peer.state = "submitted"
+            peer.session_id = session_id
+            peer.submitted_at = time.time()
+            batch.next += 1
+            if batch.next < len(batch.peers):
+                # At the ramp rate from the previous peer's slot, so peers held
+                # back by a full engine do not start in a burst
+                interval = 1 / batch.ramp if batch.ramp > 0 else 0
+                batch.due = max(batch.due + interval, time.monotonic())
+                self._push(batch)
+            # Cancelled while it was being submitted
+            cancelled = batch.cancelled
+        if cancelled:
+            self._engine.cancel(session_id)
+
+    def _send_summary(self, batch: _Batch):
+        # Built before older batches are pruned, so this one is still known
+        summary = self.batch(batch.batch_id, sessions=True)
+        self._prune(batch)
+        if summary is None:
+            return
+        ok = summary["completed"] == summary["peers"]
+        url = batch.success_url if ok else batch.failure_url
+        if url and self._notify is not None:
+            self._notify(url, {"status": "success" if ok else "failure", **summary})
@@ -0,0 +1,316 @@
+import time
+import struct
+import asyncio
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+# Every load message starts with its sequence number and the sender's wall
+# clock time (so one-way latency needs the two ends' clocks in sync, as they
+# are within one host); the rest is padding up to the configured size
+HEADER = struct.Struct("!Qd")
+
+# Upper bounds (ms) of the one-way latency histogram buckets; the last bucket
+# counts everything above
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+@dataclass
+class DataLoad:
+    # Bytes per message, header included
+    size: int = 1024
+    # Messages per second; 0 sends as fast as the channel drains
+    rate: float = 0
+    ordered: bool = True
+    # Partial reliability: give up on a message after this many milliseconds
+    # or retransmissions; either one makes the channel unordered
+    maxPacketLifeTime: Optional[int] = None
+    maxRetransmits: Optional[int] = None
+    # The mediasoup demo server forwards "chat" data producers to every other
+    # peer in the room
+    label: str = "chat"
+    # Sending pauses while more than highWater bytes are buffered and resumes
+    # once the buffer drained below lowWater
+    highWater: int = 1 << 20
+    lowWater: int = 256 << 10
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class DataChannelSender:
+    """
+    Sends ``load`` over a DataProducer (or a plain RTCDataChannel) until the
+    channel closes or the task is cancelled, pacing to ``load.rate`` and
+    backing off while the channel's buffered amount is above the high water
+    mark.
+    """
+
+    # Messages sent back to back before yielding to the event loop
+    BURST = 32
+
+    def __init__(self, channel, load: DataLoad):
+        self.channel = channel
+        self.load = load
+        self.sent = 0
+        self.bytes = 0
+        # Times sending paused on a full buffer, and seconds spent paused
+        self.stalls = 0
+        self.stalled = 0.0
+        self._started: Optional[float] = None
+        self._stopped: Optional[float] = None
+        self._drained = asyncio.Event()
+        channel.bufferedAmountLowThreshold = load.lowWater
+        channel.on("bufferedamountlow", self._drained.set)
+
+    async def run(self):
+        if self.channel.readyState != "open":
+            opened = asyncio.Event()
+            self.channel.once("open", opened.set)
+            await opened.wait()
+
+        load = self.load
+        payload = bytearray(max(load.size, HEADER.size))
+        interval = 1 / load.rate if load.rate else 0
+        self._started = nextAt = time.monotonic()
+        burst = 0
+        try:
+            while self.channel.readyState == "open":
+                self._drained.clear()
+                if self.channel.bufferedAmount > load.highWater:
+                    self.stalls += 1
+                    started = time.monotonic()
+                    await self._drained.wait()
+                    self.stalled += time.monotonic() - started
+                    burst = 0
+                    continue
+                if interval:
+                    nextAt += interval
+                    delay = nextAt - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                        burst = 0
+                if burst >= self.BURST:
+                    await asyncio.sleep(0)
+                    burst = 0
+                HEADER.pack_into(payload, 0, self.sent, time.time())
+                self.channel.send(bytes(payload))
+                self.sent += 1
+                self.bytes += len(payload)
+                burst += 1
+        finally:
+            self._stopped = time.monotonic()
+
+    def as_dict(self) -> dict:
+        end = self._stopped or time.monotonic()
+        seconds = end - self._started if self._started is not None else 0
+        return {
+            "label": self.load.label,
+            "messages": self.sent,
+            "bytes": self.bytes,
+            "throughput_kbps": self.bytes * 8 / seconds / 1000 if seconds else 0,
+            "stalls": self.stalls,
+            "stalled_s": self.stalled,
+            "buffered": self.channel.bufferedAmount,
+        }
+
+
+class DataChannelCounters:
+    """
+    Fixed-size receive statistics of one data consumer, updated per message:
+    throughput, one-way latency and loss and reordering from the sequence
+    numbers. Messages that do not carry a load header (e.g. chat text from
+    other clients) are only counted.
+    """
+
+    __slots__ = (
+        "label",
+        "messages",
+        "bytes",
+        "foreign",
+        "reordered",
+        "latency_sum",
+        "latency_min",
+        "latency_max",
+        "latencies",
+        "_min_seq",
+        "_max_seq",
+        "_first_arrival",
+        "_last_arrival",
+    )
+
+    def __init__(self, label: str):
+        self.label = label
+        self.messages = 0
+        self.bytes = 0
+        self.foreign = 0
+        self.reordered = 0
+        # One-way latency, in seconds
+        self.latency_sum = 0.0
+        self.latency_min: Optional[float] = None
+        self.latency_max = 0.0
+        self.latencies = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._min_seq: Optional[int] = None
+        self._max_seq = 0
+        self._first_arrival: Optional[float] = None
+        self._last_arrival: Optional[float] = None
+
+    def on_message(self, message):
+        arrival = time.time()
+        if not isinstance(message, bytes) or len(message) < HEADER.size:
+            self.foreign += 1
+            return
+        seq, sent = HEADER.unpack_from(message)
+        self.messages += 1
+        self.bytes += len(message)
+        if self._first_arrival is None:
+            self._first_arrival = arrival
+        self._last_arrival = arrival
+
+        # A consumer created after its producer started sees the stream from
+        # the middle
+        if self._min_seq is None:
+            self._min_seq = self._max_seq = seq
+        elif seq > self._max_seq:
+            self._max_seq = seq
+        else:
+            self.reordered += 1
+            if seq < self._min_seq:
+                self._min_seq = seq
+
+        latency = max(0.0, arrival - sent)
+        self.latency_sum += latency
+        if self.latency_min is None or latency < self.latency_min:
+            self.latency_min = latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+        latency_ms = latency * 1000
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS_MS) and latency_ms > LATENCY_BUCKETS_MS[bucket]:
+            bucket += 1
+        self.latencies[bucket] += 1
+
+    @property
+    def expected(self) -> int:
+        if self._min_seq is None:
+            return 0
+        return self._max_seq - self._min_seq + 1
+
+    @property
+    def lost(self) -> int:
+        return max(0, self.expected - self.messages)
+
+    def as_dict(self) -> dict:
+        seconds = (
+            self._last_arrival - self._first_arrival
+            if self._first_arrival is not None
+            else 0
+        )
+        return {
+            "label": self.label,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "lost": self.lost,
+            "loss_pct": self.lost / self.expected * 100 if self.expected else 0,
+            "reordered": self.reordered,
+            "foreign": self.foreign,
+            "throughput_kbps": self.bytes * 8 / seconds / 1000 if seconds else 0,
+            "latency_ms": {
+                "mean": self.latency_sum / self.messages * 1000 if self.messages else 0,
+                "min": (self.latency_min or 0) * 1000,
+                "max": self.latency_max * 1000,
+            },
+            "latencies": dict(
+                zip([f"<={limit}ms" for limit in LATENCY_BUCKETS_MS] + ["more"], self.latencies)
+            ),
+        }
+
+
+class DataChannelLoad:
+    """
+    The data channel load of one session: a DataChannelSender per data
+    producer and a DataChannelCounters per data consumer.
+    """
+
+    def __init__(self, load: DataLoad):
+        self.load = load
+        self.senders: List[DataChannelSender] = []
+        self._counters: Dict[str, DataChannelCounters] = {}
+
+    def add_producer(self, producer) -> DataChannelSender:
+        if self.load.maxRetransmits is not None:
+            # pymediasoup signals maxRetransmits to the server but does not
+            # pass it on to the aiortc channel, which reads it per message
+            producer._dataChannel._RTCDataChannel__parameters.maxRetransmits = (
+                self.load.maxRetransmits
+            )
+        sender = DataChannelSender(producer, self.load)
+        self.senders.append(sender)
+        return sender
+
+    def add_consumer(self, consumer, label: Optional[str] = None) -> DataChannelCounters:
+        counters = self._counters[consumer.id] = DataChannelCounters(label or "")
+        consumer.on("message", counters.on_message)
+        return counters
+
+    def stats(self) -> dict:
+        return {
+            "sent": [sender.as_dict() for sender in self.senders],
+            "received": {name: counters.as_dict() for name, counters in self._counters.items()},
+        }
+
+    def summary(self) -> dict:
+        """Totals over every data producer and data consumer."""
+        sent = [sender.as_dict() for sender in self.senders]
+        received = list(self._counters.values())
+        messages = sum(counters.messages for counters in received)
+        expected = sum(counters.expected for counters in received)
+        lost = sum(counters.lost for counters in received)
+        latencies = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for counters in received:
+            for bucket, count in enumerate(counters.latencies):
+                latencies[bucket] += count
+        return {
+            "load": self.load.as_dict(),
+            "sent": {
+                "producers": len(sent),
+                "messages": sum(item["messages"] for item in sent),
+                "bytes": sum(item["bytes"] for item in sent),
+                "throughput_kbps": sum(item["throughput_kbps"] for item in sent),
+                "stalls": sum(item["stalls"] for item in sent),
+            },
+            "received": {
+                "consumers": len(received),
+                "messages": messages,
+                "bytes": sum(counters.bytes for counters in received),
+                "lost": lost,
+                "loss_pct": lost / expected * 100 if expected else 0,
+                "reordered": sum(counters.reordered for counters in received),
+                "throughput_kbps": sum(
+                    counters.as_dict()["throughput_kbps"] for counters in received
+                ),
+                "latency_mean_ms": (
+                    sum(counters.latency_sum for counters in received) / messages * 1000
+                    if messages
+                    else 0
+                ),
+                "latency_max_ms": max(
+                    (counters.latency_max for counters in received), default=0
+                ) * 1000,
+                "latency_p95_ms": latency_percentile(latencies, 95),
+            },
+        }
+
+
+def latency_percentile(latencies: List[int], p: float) -> Optional[float]:
+    """Upper bound (ms) of the histogram bucket holding the p-th percentile;
+    None when it falls in the open-ended last bucket or there is no data."""
+    total = sum(latencies)
+    if not total:
+        return None
+    rank = total * p / 100
+    seen = 0
+    for bucket, count in enumerate(latencies):
+        seen += count
+        if seen >= rank:
+            return LATENCY_BUCKETS_MS[bucket] if bucket < len(LATENCY_BUCKETS_MS) else None
+    return None
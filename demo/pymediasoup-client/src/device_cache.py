@@ -0,0 +1,107 @@
+import copy
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from pymediasoup import Device
+from pymediasoup.rtp_parameters import RtpCapabilities
+
+# Device attributes set by Device.load(). pymediasoup has no public way to
+# build a loaded Device from known capabilities, so clones copy these.
+_LOADED_STATE = (
+    "_extendedRtpCapabilities",
+    "_recvRtpCapabilities",
+    "_sendRtpCapabilities",
+    "_canProduceByKind",
+    "_sctpCapabilities",
+    "_handlerName",
+)
+
+
+class _Entry:
+    def __init__(self, capabilities: dict):
+        self.capabilities = capabilities
+        self.fetched_at = time.monotonic()
+        # A Device loaded with these capabilities, cloned for new sessions
+        self.template: Optional[Device] = None
+
+
+class RouterCapabilitiesCache:
+    """
+    Caches router RTP capabilities per server, and per room when
+    ``per_room`` is set, for ``ttl`` seconds.
+
+    ``device`` returns a loaded Device for a server: the first session loads
+    one the usual way, which builds a throwaway RTCPeerConnection to get the
+    native capabilities, and keeps it as a template. Later sessions get a copy
+    of the template's state without the getRouterRtpCapabilities round trip
+    or the capability negotiation. Entries are dropped with ``invalidate``
+    when loading or joining with them fails.
+    """
+
+    def __init__(self, ttl: float = 300, per_room: bool = False):
+        self.ttl = ttl
+        self.per_room = per_room
+        self._entries: Dict[str, _Entry] = {}
+        # key -> in-flight fetch shared by concurrent callers
+        self._fetching: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, uri: str) -> str:
+        parsed = urlparse(uri)
+        if self.per_room:
+            room = parse_qs(parsed.query).get("roomId", [""])[0]
+            return f"{parsed.netloc}/{room}"
+        return parsed.netloc
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    async def capabilities(self, key: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        entry = await self._entry(key, fetch)
+        return entry.capabilities
+
+    async def device(
+        self, key: str, handlerFactory, fetch: Callable[[], Awaitable[dict]]
+    ) -> Device:
+        entry = await self._entry(key, fetch)
+        device = Device(handlerFactory=handlerFactory)
+        if entry.template is None:
+            await device.load(RtpCapabilities(**entry.capabilities))
+            # Only keep it if the entry was not invalidated meanwhile
+            if self._entries.get(key) is entry:
+                entry.template = device
+            return device
+        for name in _LOADED_STATE:
+            setattr(device, name, copy.deepcopy(getattr(entry.template, name)))
+        device._loaded = True
+        return device
+
+    async def _entry(self, key: str, fetch: Callable[[], Awaitable[dict]]) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.fetched_at < self.ttl:
+            self.hits += 1
+            return entry
+
+        if key in self._fetching:
+            return await asyncio.shield(self._fetching[key])
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._fetching[key] = fut
+        try:
+            entry = _Entry(await fetch())
+            self._entries[key] = entry
+            fut.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # Mark retrieved in case no other caller was waiting
+            fut.exception()
+            raise
+        finally:
+            del self._fetching[key]
@@ -0,0 +1,242 @@
+import time
+import uuid
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Factory receiving the session id (plus any submitted arguments) and
+# returning the coroutine to run
+SessionFactory = Callable[..., Awaitable[None]]
+# Called on the engine loop once a session ends: (session id, failed)
+DoneCallback = Callable[[str, bool], None]
+# Run on the engine loop as it starts; returns the duration of each step
+# (seconds) and the errors of the steps that failed
+Warmup = Callable[[], Awaitable[dict]]
+
+# How often the engine loop measures its own scheduling lag (seconds)
+LAG_INTERVAL = 0.5
+
+
+class EngineFull(Exception):
+    pass
+
+
+class SessionEngine:
+    """
+    Runs every session as a task on a single long-lived asyncio loop owned by
+    a background thread.
+
+    Admission control: at most ``max_sessions`` sessions run at once and at
+    most ``max_queue`` more wait for a free slot. ``submit`` is called from
+    HTTP handler threads, returns the session id immediately and raises
+    EngineFull when both are exhausted.
+
+    Every queued or running session is listed by ``sessions`` together with
+    the ``info`` it was submitted with, and can be stopped with ``cancel``,
+    which cancels its task so the session's own cleanup runs.
+
+    The loop's lag, how late a timer scheduled on it fires, is sampled every
+    LAG_INTERVAL and reported by ``stats`` as ``loop_lag_ms``.
+
+    An optional ``warmup`` coroutine function runs on the loop as soon as it
+    starts, e.g. to import and initialize what sessions use before the first
+    one arrives. ``ready`` turns true once it finished, whether or not every
+    step succeeded; sessions submitted earlier are not held back.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 8,
+        max_queue: int = 32,
+        on_done: Optional[DoneCallback] = None,
+        warmup: Optional[Warmup] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self._on_done = on_done
+        self._warmup = warmup
+        # What warmup reported, plus its total duration
+        self._warmupResult: Optional[dict] = None
+        self._warm = threading.Event()
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._loop_lag = 0.0
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # session id -> state and submit info, for queued and running sessions
+        self._sessions: Dict[str, dict] = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._slots = None
+        self._lag_task: Optional[asyncio.Task] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run_loop, name="session-engine", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._slots = asyncio.Semaphore(self.max_sessions)
+        self._lag_task = self._loop.create_task(self._measure_lag())
+        self._warmup_task = self._loop.create_task(self._warm_up())
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+
+    @property
+    def ready(self) -> bool:
+        return self._warm.is_set()
+
+    async def _warm_up(self):
+        if self._warmup is None:
+            self._warm.set()
+            return
+        start = time.monotonic()
+        try:
+            result = await self._warmup()
+        except Exception as e:
+            result = {"errors": {"warmup": f"{type(e).__name__}: {e}"}}
+        self._warmupResult = {**result, "seconds": time.monotonic() - start}
+        self._warm.set()
+
+    async def _measure_lag(self):
+        while True:
+            start = self._loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self._loop_lag = max(0.0, self._loop.time() - start - LAG_INTERVAL)
+
+    def submit(
+        self,
+        factory: SessionFactory,
+        *args,
+        session_id: Optional[str] = None,
+        info: Optional[dict] = None,
+    ) -> str:
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            if self._active + self._queued >= self.max_sessions + self.max_queue:
+                raise EngineFull(
+                    f"{self._active} sessions running and {self._queued} queued"
+                )
+            self._queued += 1
+            self._sessions[session_id] = {
+                "session_id": session_id,
+                "state": "queued",
+                "submitted_at": time.time(),
+                "started_at": None,
+                **(info or {}),
+            }
+        self._loop.call_soon_threadsafe(self._start, session_id, factory, args)
+        return session_id
+
+    def sessions(self) -> List[dict]:
+        with self._lock:
+            return [dict(session) for session in self._sessions.values()]
+
+    def session(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return dict(session) if session is not None else None
+
+    def cancel(self, session_id: str) -> bool:
+        """
+        Cancels a queued or running session; returns False if it is unknown
+        or already over. The session ends once its cleanup has run.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            session["state"] = "cancelling"
+        # Runs after _start for sessions submitted just before
+        self._loop.call_soon_threadsafe(self._cancel, session_id)
+        return True
+
+    def _cancel(self, session_id: str):
+        task = self._tasks.get(session_id)
+        if task is not None:
+            task.cancel()
+
+    def _start(self, session_id: str, factory: SessionFactory, args: tuple):
+        task = self._loop.create_task(self._run_session(session_id, factory, args))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def _run_session(self, session_id: str, factory: SessionFactory, args: tuple):
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            with self._lock:
+                self._queued -= 1
+                self._cancelled += 1
+                del self._sessions[session_id]
+            if self._on_done is not None:
+                self._on_done(session_id, True)
+            raise
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            session = self._sessions[session_id]
+            session["started_at"] = time.time()
+            if session["state"] == "queued":
+                session["state"] = "running"
+        failed = True
+        cancelled = False
+        try:
+            await factory(session_id, *args)
+            failed = False
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            print(f"Session {session_id} failed: {e}")
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._active -= 1
+                del self._sessions[session_id]
+                if cancelled:
+                    self._cancelled += 1
+                elif failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+            if self._on_done is not None:
+                self._on_done(session_id, failed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "queued": self._queued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "max_sessions": self.max_sessions,
+                "max_queue": self.max_queue,
+                "loop_lag_ms": self._loop_lag * 1000,
+                "ready": self.ready,
+                "warmup": self._warmupResult,
+            }
+
+    def shutdown(self, timeout: float = 10):
+        async def cancel_all():
+            tasks = [*self._tasks.values(), self._lag_task, self._warmup_task]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(cancel_all(), self._loop).result(timeout)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
@@ -0,0 +1,387 @@
+import os
+import time
+import fcntl
+import shutil
+import asyncio
+import hashlib
+import functools
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+import requests
+from aiortc.contrib.media import MediaPlayer, MediaRelay
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+
+class MediaCache:
+    """
+    Content-addressed on-disk cache for remote media files, shared by every
+    process that uses the same directory.
+
+    Each URL is downloaded once; the file is stored under the SHA-256 of its
+    content so identical sources share one copy. Which file a URL maps to is
+    kept next to the files, in ``.url-<SHA-256 of the URL>``, so restarts and
+    other worker processes find it without downloading again. Concurrent
+    fetches of one URL, from threads or processes, wait for a single
+    download. Local paths are returned untouched.
+
+    When the cache grows past ``max_bytes`` the least recently used files
+    are evicted under a lock on the directory. Hits refresh the modification
+    time of the URL's index, never that of the media file, so a file's mtime
+    and size only change with its content. Files used within the last ``grace`` seconds are
+    kept, so a path another process just got is not removed before it is
+    opened; files are unlinked, so players that already opened one keep
+    reading it.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30, grace: float = 60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.grace = grace
+        os.makedirs(directory, exist_ok=True)
+
+    def _files(self) -> List[str]:
+        # Cached media files; index, lock and partial download files start
+        # with a dot
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if not name.startswith(".")
+        ]
+
+    @property
+    def size(self) -> int:
+        total = 0
+        for path in self._files():
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _index_path(self, url: str) -> str:
+        return os.path.join(
+            self.directory, ".url-" + hashlib.sha256(url.encode()).hexdigest()
+        )
+
+    @contextmanager
+    def _locked(self, name: str):
+        # An exclusive lock across threads and processes
+        with open(os.path.join(self.directory, name), "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _lookup(self, index: str) -> Optional[str]:
+        try:
+            with open(index) as file:
+                path = os.path.join(self.directory, file.read().strip())
+            if not os.path.exists(path):
+                return None
+            # Recency for eviction
+            os.utime(index)
+        except FileNotFoundError:
+            # Not fetched yet, or evicted
+            return None
+        return path
+
+    def fetch(self, url: str) -> str:
+        if urlparse(url).scheme not in ("http", "https"):
+            return url
+
+        index = self._index_path(url)
+        path = self._lookup(index)
+        if path is not None:
+            return path
+        # Concurrent requests for the same url wait for a single download
+        with self._locked(os.path.basename(index) + ".lock"):
+            path = self._lookup(index)
+            if path is None:
+                path = self._download(url, index)
+        return path
+
+    async def get(self, url: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(None, self.fetch, url)
+
+    def _download(self, url: str, index: str) -> str:
+        extension = os.path.splitext(urlparse(url).path)[1]
+        sha256 = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".download-")
+        try:
+            with os.fdopen(fd, "wb") as file, requests.get(
+                url, stream=True, timeout=30
+            ) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    sha256.update(chunk)
+                    file.write(chunk)
+            name = sha256.hexdigest() + extension
+            path = os.path.join(self.directory, name)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        # Written aside and renamed, so readers never see a partial index
+        fd, tmp_index = tempfile.mkstemp(dir=self.directory, prefix=".index-")
+        with os.fdopen(fd, "w") as file:
+            file.write(name)
+        os.replace(tmp_index, index)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: str):
+        with self._locked(".lock"):
+            last_used = self._last_used()
+            entries = []
+            for path in self._files():
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                used = max(stat.st_mtime, last_used.get(os.path.basename(path), 0))
+                entries.append((used, path, stat.st_size))
+            entries.sort()
+            total = sum(size for _, _, size in entries)
+            recent = time.time() - self.grace
+            evicted = set()
+            for mtime, path, size in entries:
+                if total <= self.max_bytes:
+                    break
+                # Never evict the entry that was just added, or one in use
+                if path == keep or mtime > recent:
+                    continue
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted.add(os.path.basename(path))
+            if evicted:
+                self._drop_index(evicted)
+
+    def _indexes(self) -> List[str]:
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith(".url-") and not name.endswith(".lock")
+        ]
+
+    def _last_used(self) -> Dict[str, float]:
+        # File name -> latest hit through any of the URLs mapped to it
+        last_used: Dict[str, float] = {}
+        for index in self._indexes():
+            try:
+                with open(index) as file:
+                    name = file.read().strip()
+                mtime = os.stat(index).st_mtime
+            except FileNotFoundError:
+                continue
+            last_used[name] = max(mtime, last_used.get(name, 0))
+        return last_used
+
+    def _drop_index(self, names: Set[str]):
+        for index in self._indexes():
+            try:
+                with open(index) as file:
+                    if file.read().strip() in names:
+                        os.unlink(index)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._locked(".lock"):
+            for name in os.listdir(self.directory):
+                if name == ".lock":
+                    continue
+                path = os.path.join(self.directory, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+
+
+class LoopingPlayer:
+    """
+    Plays a file ``passes`` times over, or until closed when ``passes`` is
+    None. Exposes ``audio`` and ``video`` like a MediaPlayer.
+
+    MediaPlayer's own ``loop`` seeks back without resetting its pacing, so
+    from the second pass on frames go out as fast as they are decoded with
+    timestamps starting again at 0. Each pass here is a MediaPlayer of its
+    own, paced from its first frame, and its timestamps carry on from the
+    previous pass.
+    """
+
+    def __init__(self, file: str, passes: Optional[int] = None):
+        self._file = file
+        self._passes = passes
+        first = MediaPlayer(file)
+        self._players: Dict[int, asyncio.Future] = {}
+        self._first = first
+        self.audio = _LoopingTrack(self, "audio") if first.audio else None
+        self.video = _LoopingTrack(self, "video") if first.video else None
+
+    async def _player(self, number: int) -> Optional[MediaPlayer]:
+        if number == 0:
+            return self._first
+        if self._passes is not None and number >= self._passes:
+            return None
+        # Both tracks reach the end of a pass; only the first opens the next
+        future = self._players.get(number)
+        if future is None:
+            future = self._players[number] = asyncio.ensure_future(
+                asyncio.get_running_loop().run_in_executor(None, MediaPlayer, self._file)
+            )
+        # Every track is past the pass before last
+        self._players.pop(number - 2, None)
+        return await future
+
+    def close(self):
+        for track in (self.audio, self.video):
+            if track is not None:
+                track.stop()
+
+
+class _LoopingTrack(MediaStreamTrack):
+    def __init__(self, player: LoopingPlayer, kind: str):
+        super().__init__()
+        self.kind = kind
+        self._player = player
+        self._pass = 0
+        self._track: Optional[MediaStreamTrack] = None
+        # Added to the timestamps of the current pass
+        self._offset = 0
+        self._last: Optional[int] = None
+        self._step = 0
+
+    async def recv(self):
+        while True:
+            if self.readyState != "live":
+                raise MediaStreamError
+            if self._track is None:
+                player = await self._player._player(self._pass)
+                self._track = getattr(player, self.kind) if player else None
+                if self._track is None:
+                    self.stop()
+                    raise MediaStreamError
+            try:
+                frame = await self._track.recv()
+            except MediaStreamError:
+                # Next pass, one frame after the last one of this pass
+                self._track.stop()
+                self._track = None
+                self._pass += 1
+                if self._last is not None:
+                    self._offset = self._last + self._step
+                continue
+            pts = frame.pts + self._offset
+            if self._last is not None and pts > self._last:
+                self._step = pts - self._last
+            self._last = frame.pts = pts
+            return frame
+
+    def stop(self):
+        super().stop()
+        if self._track is not None:
+            # MediaPlayer stops decoding once all of its tracks are stopped
+            self._track.stop()
+            self._track = None
+
+
+class SharedSource:
+    """
+    One session's view of a shared source. Exposes ``audio`` and ``video``
+    like a MediaPlayer so it can be handed to Demo directly.
+    """
+
+    def __init__(self, manager: "MediaSourceManager", decoder: "_Decoder", audio, video):
+        self._manager = manager
+        self._decoder = decoder
+        self.audio = audio
+        self.video = video
+        self._closed = False
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for track in (self.audio, self.video):
+            if track is not None:
+                track.stop()
+        self._manager._release(self._decoder)
+
+
+class _Decoder:
+    def __init__(self, key: str, player: MediaPlayer):
+        self.key = key
+        self.player = player
+        self.relay = MediaRelay()
+        self.subscribers = 0
+
+    @property
+    def ended(self) -> bool:
+        return any(
+            track is not None and track.readyState == "ended"
+            for track in (self.player.audio, self.player.video)
+        )
+
+    def stop(self):
+        for track in (self.player.audio, self.player.video):
+            if track is not None:
+                track.stop()
+
+
+class MediaSourceManager:
+    """
+    Decodes each media source once per process and fans the decoded frames
+    out to every session through a MediaRelay, so N sessions cost one
+    download and one decode plus N encodes.
+
+    Sessions that open a source which is already playing join it live. The
+    decoder is stopped when its last subscriber closes, and a new one is
+    started on the next ``open`` once the source has reached its end. With
+    ``loop``, decoders start over at the end of the source instead.
+    """
+
+    def __init__(self, cache: Optional[MediaCache] = None, loop: bool = False):
+        self._cache = cache
+        self._loop = loop
+        self._decoders: Dict[str, _Decoder] = {}
+        self._lock = asyncio.Lock()
+
+    async def open(self, url: str) -> SharedSource:
+        path = await self._cache.get(url) if self._cache else url
+        async with self._lock:
+            decoder = self._decoders.get(path)
+            if decoder is None or decoder.ended:
+                player = await asyncio.get_running_loop().run_in_executor(
+                    None, functools.partial(LoopingPlayer if self._loop else MediaPlayer, path)
+                )
+                decoder = _Decoder(path, player)
+                self._decoders[path] = decoder
+            decoder.subscribers += 1
+        player = decoder.player
+        return SharedSource(
+            self,
+            decoder,
+            # Unbuffered: a session that falls behind skips frames instead
+            # of queueing decoded ones without bound
+            audio=decoder.relay.subscribe(player.audio, buffered=False) if player.audio else None,
+            video=decoder.relay.subscribe(player.video, buffered=False) if player.video else None,
+        )
+
+    def _release(self, decoder: _Decoder):
+        decoder.subscribers -= 1
+        if decoder.subscribers <= 0:
+            decoder.stop()
+            if self._decoders.get(decoder.key) is decoder:
+                del self._decoders[decoder.key]
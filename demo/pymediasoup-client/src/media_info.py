@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import asyncio
+from dataclasses import dataclass, asdict
+from fractions import Fraction
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import av
+import requests
+
+
+@dataclass
+class MediaInfo:
+    duration: Optional[float] = None
+    video_codec: Optional[str] = None
+    audio_codec: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    frame_rate: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _parse_rate(rate) -> Optional[float]:
+    try:
+        value = float(Fraction(str(rate)))
+    except (ValueError, ZeroDivisionError, TypeError):
+        return None
+    return value or None
+
+
+class MetadataService:
+    """
+    Probes media sources once and caches duration, codecs, resolution and
+    frame rate.
+
+    Entries are keyed by the source plus a validator: ETag or Last-Modified
+    for remote URLs, size and mtime for local files. A cached entry is served
+    without revalidation for ``revalidate_after`` seconds. Probing runs
+    ``ffprobe`` as an async subprocess and falls back to in-process
+    demuxing with PyAV; if both fail an empty MediaInfo is returned.
+    """
+
+    def __init__(
+        self,
+        ffprobe: str = "ffprobe",
+        timeout: float = 15,
+        revalidate_after: float = 60,
+    ):
+        self._ffprobe = ffprobe
+        self._timeout = timeout
+        self._revalidate_after = revalidate_after
+        # url -> (validator, checked at, info)
+        self._cache: Dict[str, Tuple[Optional[str], float, MediaInfo]] = {}
+        # url -> in-flight probe shared by concurrent callers
+        self._probing: Dict[str, asyncio.Future] = {}
+
+    async def probe(self, url: str) -> MediaInfo:
+        cached = self._cache.get(url)
+        if cached and time.monotonic() - cached[1] < self._revalidate_after:
+            return cached[2]
+
+        if url in self._probing:
+            return await asyncio.shield(self._probing[url])
+        fut = asyncio.get_running_loop().create_future()
+        self._probing[url] = fut
+        try:
+            validator = await self._validator(url)
+            if cached and validator is not None and cached[0] == validator:
+                info = cached[2]
+            else:
+                info = await self._probe(url)
+            self._cache[url] = (validator, time.monotonic(), info)
+            fut.set_result(info)
+            return info
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # Mark retrieved in case no other caller was waiting
+            fut.exception()
+            raise
+        finally:
+            del self._probing[url]
+
+    async def _validator(self, url: str) -> Optional[str]:
+        if urlparse(url).scheme in ("http", "https"):
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    lambda: requests.head(url, allow_redirects=True, timeout=self._timeout),
+                )
+            except requests.RequestException:
+                return None
+            return response.headers.get("ETag") or response.headers.get("Last-Modified")
+        try:
+            stat = os.stat(url)
+        except OSError:
+            return None
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    async def _probe(self, url: str) -> MediaInfo:
+        try:
+            return await self._probe_ffprobe(url)
+        except Exception as e:
+            print(f"ffprobe failed for {url}: {e}")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._probe_demux, url
+            )
+        except Exception as e:
+            print(f"Demuxing failed for {url}: {e}")
+        return MediaInfo()
+
+    async def _probe_ffprobe(self, url: str) -> MediaInfo:
+        process = await asyncio.create_subprocess_exec(
+            self._ffprobe,
+            "-v",
+            "error",
+            "-print_format",
+            "json",
+            "-show_format",
+            "-show_streams",
+            url,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(), timeout=self._timeout
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise RuntimeError(stderr.decode(errors="replace").strip())
+
+        result = json.loads(stdout)
+        info = MediaInfo()
+        duration = result.get("format", {}).get("duration")
+        info.duration = float(duration) if duration else None
+        for stream in result.get("streams", []):
+            if stream.get("codec_type") == "video" and info.video_codec is None:
+                info.video_codec = stream.get("codec_name")
+                info.width = stream.get("width")
+                info.height = stream.get("height")
+                info.frame_rate = _parse_rate(stream.get("avg_frame_rate"))
+            elif stream.get("codec_type") == "audio" and info.audio_codec is None:
+                info.audio_codec = stream.get("codec_name")
+        return info
+
+    def _probe_demux(self, url: str) -> MediaInfo:
+        with av.open(url, timeout=self._timeout) as container:
+            info = MediaInfo()
+            if container.duration is not None:
+                info.duration = container.duration / av.time_base
+            if container.streams.video:
+                stream = container.streams.video[0]
+                info.video_codec = stream.codec_context.name
+                info.width = stream.codec_context.width
+                info.height = stream.codec_context.height
+                info.frame_rate = _parse_rate(stream.average_rate)
+            if container.streams.audio:
+                info.audio_codec = container.streams.audio[0].codec_context.name
+            return info
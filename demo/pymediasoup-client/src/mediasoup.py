@@ -1,10 +1,13 @@
+import os
 import sys
-import json
+import time
+import random
 import asyncio
+import tempfile
 import argparse
 import secrets
-from typing import Optional, Dict, Awaitable, Any, TypeVar
-from asyncio.futures import Future
+import json
+from typing import Optional, Set, Tuple
 
 from pymediasoup import Device
 from pymediasoup import AiortcHandler
@@ -13,22 +16,96 @@ from pymediasoup.consumer import Consumer
 from pymediasoup.producer import Producer
 from pymediasoup.data_consumer import DataConsumer
 from pymediasoup.data_producer import DataProducer
+from pymediasoup.rtp_parameters import RtpCapabilities
 from pymediasoup.sctp_parameters import SctpStreamParameters
+from pymediasoup.models.transport import IceParameters
 
 # Import aiortc
-from aiortc import VideoStreamTrack,RTCIceServer
-from aiortc.mediastreams import AudioStreamTrack
+from aiortc import RTCIceServer
 from aiortc.contrib.media import MediaPlayer, MediaBlackhole, MediaRecorder
+import websockets
 
 # Implement simple protoo client
-import websockets
-from random import random
+from protoo import ProtooClient, ProtooClosedError, ProtooRequestError
+from timings import PhaseTimer
+from passthrough import EncodedSourceManager
+from synthetic import SyntheticAudioTrack, SyntheticVideoTrack, SyntheticSource
+from recording import SegmentedRecorder
+from receive_sink import ReceiveSink
+from stats_sampler import StatsSampler
+from datachannel import DataChannelLoad, DataLoad
+from warm_pool import WarmPool
+from signaling_trace import SignalingTrace
+from simulcast import (
+    AdaptiveEncoder,
+    ConsumerLayerControl,
+    EncodingControl,
+    ScaledVideoTrack,
+    SimulcastLayers,
+    parse_layers,
+)
+
+
+# pymediasoup does not queue transport commands like mediasoup-client does, so
+# concurrent consume()/produce() calls would interleave their SDP offer/answer
+# exchanges on the same RTCPeerConnection. Only the local negotiation is
+# serialized; the protoo round trips around it still overlap.
+def serialize_handler(transport: Transport):
+    handler = transport.handler
+    lock = asyncio.Lock()
+
+    def locked(method):
+        async def wrapper(*args, **kwargs):
+            async with lock:
+                return await method(*args, **kwargs)
+
+        return wrapper
 
-T = TypeVar("T")
+    handler.send = locked(handler.send)
+    handler.receive = locked(handler.receive)
+    handler.sendDataChannel = locked(handler.sendDataChannel)
+    handler.receiveDataChannel = locked(handler.receiveDataChannel)
+
+
+# aiortc keeps the remote ICE credentials it started with, whatever a later
+# remote description says, so the ones restartIce returns are handed to the
+# ICE agent directly; its consent checks then use them.
+def apply_ice_parameters(transport: Transport, iceParameters: IceParameters):
+    pc = getattr(transport.handler, "pc", None)
+    if pc is None:
+        return
+    for iceTransport in pc._RTCPeerConnection__iceTransports:
+        iceTransport._connection.remote_username = iceParameters.usernameFragment
+        iceTransport._connection.remote_password = iceParameters.password
 
 
 class Demo:
-    def __init__(self, uri, player=None, recorder=None, loop=None, time=None):
+    def __init__(
+        self,
+        uri,
+        player=None,
+        recorder=None,
+        loop=None,
+        time=None,
+        consume_concurrency=4,
+        request_timeout=15,
+        fast_start=False,
+        linger=0,
+        until_ended=False,
+        observer=None,
+        capabilities_cache=None,
+        stats_interval=0,
+        stats_capacity=120,
+        simulcast=None,
+        adaptive_encoding=False,
+        layer_control=False,
+        data_load: Optional[DataLoad] = None,
+        reconnect=False,
+        reconnect_attempts=5,
+        reconnect_backoff=0.5,
+        warm_pool: Optional[WarmPool] = None,
+        trace: Optional[str] = None,
+    ):
         if not loop:
             if sys.version_info.major == 3 and sys.version_info.minor == 6:
                 loop = asyncio.get_event_loop()
@@ -37,28 +114,103 @@ class Demo:
         
         print('*** Uri:', uri)
         
+        # Seconds joining and producing may take
         self._time = time
+        # Max number of newConsumer/newDataConsumer requests handled at once
+        self._consume_concurrency = consume_concurrency
+        # Run independent bring-up steps concurrently
+        self._fast_start = fast_start
+        # Seconds to stay in the room after producing before leaving; with
+        # until_ended, the longest the session stays
+        self._linger = linger
+        # Also leave as soon as every track taken from the player has ended
+        self._untilEnded = until_ended
+        # Set by the first event that ends the session's stay in the room:
+        # "ended" (the player's media), "linger", "peerLeft" or "peerClosed"
+        # (the room's last other peer), or "closed" (the websocket, for
+        # good); "timeout" or "error" when producing did not complete, and
+        # run() raises
+        self.endReason: Optional[str] = None
+        self._ending = asyncio.Event()
+        # Optional sink for phase and signaling request timings, with
+        # phase(name, seconds) and request(method, seconds, error) methods
+        self._observer = observer
+        self.timings = PhaseTimer(on_phase=observer.phase if observer else None)
+        # Optional RouterCapabilitiesCache shared between sessions
+        self._capabilitiesCache = capabilities_cache
+        # Optional WarmPool shared between sessions: pooled DTLS certificates
+        # for every peer connection and handlers with the native capabilities
+        # already known
+        self._warmPool = warm_pool
+        if warm_pool is not None:
+            warm_pool.install()
         self._loop = loop
         self._uri = uri
         self._player = player
         self._recorder = recorder
 
-        # Save answers temporarily
-        self._answers: Dict[str, Future] = {}
-        self._websocket = None
+        # Optional record of every protoo message sent and received, appended
+        # to this file; replay.py plays its server side back
+        self.trace = SignalingTrace(trace, uri) if trace else None
+
+        # Protoo signaling channel
+        self._protoo = ProtooClient(
+            uri,
+            loop=loop,
+            timeout=request_timeout,
+            on_request_done=observer.request if observer else None,
+            on_message=self.trace.record if self.trace else None,
+        )
         self._device = None
+        # Server and local media stats polled every stats_interval seconds
+        self.stats = (
+            StatsSampler(self._protoo.request, interval=stats_interval, capacity=stats_capacity)
+            if stats_interval
+            else None
+        )
+
+        # (scaleResolutionDownBy, maxBitrate) per simulcast video encoding,
+        # lowest first; None sends a single encoding
+        self._simulcast = simulcast
+        self._simulcastLayers: Optional[SimulcastLayers] = None
+        # Lower the video bitrate, then resolution, on uplink congestion
+        self._adaptiveEncoding = adaptive_encoding
+        self.adaptive: Optional[AdaptiveEncoder] = None
+        # Ask for lower consumer layers while this client is overloaded
+        self.layerControl = ConsumerLayerControl(self._protoo.request) if layer_control else None
+        # Send a DataLoad over a data producer and measure what the data
+        # consumers receive; None only prints received messages
+        self.data = DataChannelLoad(data_load) if data_load else None
+        # Reopen the websocket when it drops, or when ICE fails, and recover
+        # media with restartIce or, failing that, by joining again. Up to
+        # reconnect_attempts connection attempts per outage, the first right
+        # away and the rest after exponential backoff with full jitter
+        self._reconnect = reconnect
+        self._reconnectAttempts = reconnect_attempts
+        self._reconnectBackoff = reconnect_backoff
+        # One entry per outage: cause, result, attempts and seconds
+        self.recoveries = []
+        self._outage: Optional[Tuple[str, float]] = None
+        self._recovering: Optional[asyncio.Task] = None
+        # Tasks tied to the current producers, cancelled when they are replaced
+        self._mediaTasks = set()
 
         self._tracks = []
+        # Tracks created here rather than taken from the player; the player's
+        # tracks belong to the caller, these are stopped on close
+        self._ownedTracks = []
 
         
         if player and player.audio:
             audioTrack = player.audio
         else:
-            audioTrack = AudioStreamTrack()
+            audioTrack = SyntheticAudioTrack()
+            self._ownedTracks.append(audioTrack)
         if player and player.video:
             videoTrack = player.video
         else:
-            videoTrack = VideoStreamTrack()
+            videoTrack = SyntheticVideoTrack()
+            self._ownedTracks.append(videoTrack)
 
         self._videoTrack = videoTrack
         self._audioTrack = audioTrack
@@ -71,184 +223,426 @@ class Demo:
 
         self._producers = []
         self._consumers = []
-        self._tasks = []
+        # Background tasks owned by the session, cancelled on close
+        self._tasks = set()
+        self._joined = False
+        # Other peers joined to the room; the session leaves once the last
+        # one left, not when any of them does
+        self._peers: Set[str] = set()
+        self._leaving = False
         self._closed = False
+        # Teardown shared by every close() call
+        self._closing: Optional[asyncio.Future] = None
+
+        self._register_handlers()
 
     # websocket receive task
     async def recv_msg_task(self):
         while True:
-            await asyncio.sleep(0.5)
+            await self._protoo.run()
+            print("WebSocket connection closed.")
+            if self._leaving or self._closed:
+                return
+            if not self._reconnect:
+                self._end("closed")
+                return
+            cause, since = self._outage or ("websocket", time.monotonic())
+            self._outage = None
+            attempts = await self._reopen_signaling()
+            if attempts is None:
+                self._recovered(cause, "failed", self._reconnectAttempts, since)
+                self._end("closed")
+                return
+            if self._recovering is not None:
+                self._recovering.cancel()
+            self._recovering = self._spawn(self._recover(cause, since, attempts))
+
+    async def _reopen_signaling(self) -> Optional[int]:
+        for attempt in range(1, self._reconnectAttempts + 1):
+            if attempt > 1:
+                delay = min(10, self._reconnectBackoff * 2 ** (attempt - 2))
+                await asyncio.sleep(random.uniform(0, delay))
+            if self._closed:
+                return None
             try:
-                if self._websocket is not None:
-                    message = json.loads(await self._websocket.recv())
-                    if message.get("response"):
-                        if message.get("id") is not None:
-                            self._answers[message.get("id")].set_result(message)
-                    elif message.get("request"):
-                        if message.get("method") == "newConsumer":
-                            await self.consume(
-                                id=message["data"]["id"],
-                                producerId=message["data"]["producerId"],
-                                kind=message["data"]["kind"],
-                                rtpParameters=message["data"]["rtpParameters"],
-                            )
-                            response = {
-                                "response": True,
-                                "id": message["id"],
-                                "ok": True,
-                                "data": {},
-                            }
-                            await self._websocket.send(json.dumps(response))
-                        elif message.get("method") == "newDataConsumer":
-                            await self.consumeData(
-                                id=message["data"]["id"],
-                                dataProducerId=message["data"]["dataProducerId"],
-                                label=message["data"]["label"],
-                                protocol=message["data"]["protocol"],
-                                sctpStreamParameters=message["data"][
-                                    "sctpStreamParameters"
-                                ],
-                            )
-                            response = {
-                                "response": True,
-                                "id": message["data"]["id"],
-                                "ok": True,
-                                "data": {},
-                            }
-                            await self._websocket.send(json.dumps(response))
-                    elif message.get("notification"):
-                        if message.get("method") == "peerLeft":
-                            peer_id = message["data"]["peerId"]
-                            print(f"Peer {peer_id} has left the call.")
-                            self.close()
-                        else:
-                            print(message)
-            except websockets.ConnectionClosedOK:
-                # Handle the normal closure of the WebSocket
-                print("WebSocket connection closed normally.")
-                break  
-            except Exception as e:
-                print(f"Error in recv_msg_task: {e}")
-                break          
-
-    # wait for answer ready
-    async def _wait_for(
-        self, fut: Awaitable[T], timeout: Optional[float], **kwargs: Any
-    ) -> T:
+                with self.timings.phase("reconnect"):
+                    await self._protoo.connect()
+                return attempt
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                print(f"Reconnect attempt {attempt} failed: {e}")
+        return None
+
+    # Runs while recv_msg_task pumps the new connection's messages
+    async def _recover(self, cause, since, attempts):
+        try:
+            with self.timings.phase("recover"):
+                # A server that kept this peer's transports only needs new
+                # ICE credentials; producers and consumers are kept. A failed
+                # aiortc ICE agent cannot be restarted though
+                if cause != "ice" and await self._try_restart_ice():
+                    result = "restartIce"
+                else:
+                    await self._rejoin()
+                    result = "rejoin"
+        except ProtooClosedError as e:
+            # The websocket dropped again; recv_msg_task starts over
+            print(f"Recovery interrupted: {e}")
+            self._outage = (cause, since)
+            return
+        except Exception as e:
+            print(f"Recovery failed: {e}")
+            result = "failed"
+        self._recovered(cause, result, attempts, since)
+
+    def _recovered(self, cause, result, attempts, since):
+        seconds = time.monotonic() - since
+        self.recoveries.append(
+            {"cause": cause, "result": result, "attempts": attempts, "seconds": seconds}
+        )
+        recovery = getattr(self._observer, "recovery", None)
+        if recovery is not None:
+            recovery(cause, result, seconds)
+
+    async def _try_restart_ice(self) -> bool:
+        if self._sendTransport is None and self._recvTransport is None:
+            return False
+        try:
+            with self.timings.phase("restartIce"):
+                await self.restartIce()
+        except ProtooRequestError:
+            # The mediasoup server closes a peer's transports with its websocket
+            return False
+        return True
+
+    async def restartIce(self):
+        for transport in (self._sendTransport, self._recvTransport):
+            if transport is None or transport.closed:
+                continue
+            iceParameters = IceParameters(
+                **await self._protoo.request("restartIce", {"transportId": transport.id})
+            )
+            await transport.restartIce(iceParameters)
+            apply_ice_parameters(transport, iceParameters)
+
+    # Brings the session up again on a new server-side peer, with the loaded
+    # device, tracks and settings of the lost one
+    async def _rejoin(self):
+        with self.timings.phase("rejoin"):
+            await self._drop_media()
+            await self.createSendTransport()
+            await self.createRecvTransport()
+            await self.join()
+            await self._produce_tracks()
+            if self.data is not None:
+                await self.produceData()
+
+    async def _drop_media(self):
+        for task in list(self._mediaTasks):
+            task.cancel()
+        await asyncio.gather(*self._mediaTasks, return_exceptions=True)
+        if self._simulcastLayers is not None:
+            await self._release(self._simulcastLayers.stop)
+            self._simulcastLayers = None
+        if self.layerControl is not None:
+            for consumer in self._consumers:
+                self.layerControl.remove(consumer.id)
+        transports = (self._sendTransport, self._recvTransport)
+        self._sendTransport = self._recvTransport = None
+        self._producers = []
+        self._consumers = []
+        self._joined = False
+        for transport in transports:
+            if transport is not None:
+                await self._release(transport.close)
+
+    # aiortc cannot restart ICE once it failed, so a transport that loses its
+    # connection is replaced by rejoining through a fresh websocket
+    def _watch_transport(self, transport: Transport):
+        if not self._reconnect:
+            return
+        connected = False
+
+        @transport.on("connectionstatechange")
+        def on_connectionstatechange(state):
+            nonlocal connected
+            if state == "connected":
+                connected = True
+            elif (
+                state == "failed"
+                and connected
+                and not transport.closed
+                and not (self._leaving or self._closed)
+                and self._outage is None
+            ):
+                print(f"Transport {transport.id} failed, reconnecting")
+                self._outage = ("ice", time.monotonic())
+                self._spawn(self._protoo.close())
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _spawn_media(self, coro) -> asyncio.Task:
+        task = self._spawn(coro)
+        self._mediaTasks.add(task)
+        task.add_done_callback(self._mediaTasks.discard)
+        return task
+
+    def _register_handlers(self):
+        self._protoo.on_request(
+            "newConsumer", self._on_new_consumer, concurrency=self._consume_concurrency
+        )
+        self._protoo.on_request(
+            "newDataConsumer",
+            self._on_new_data_consumer,
+            concurrency=self._consume_concurrency,
+        )
+        self._protoo.on_notification("newPeer", self._on_new_peer)
+        self._protoo.on_notification("peerLeft", self._on_peer_left)
+        self._protoo.on_notification("peerClosed", self._on_peer_closed)
+        self._protoo.on_any_notification(self._on_notification)
+
+    async def _on_new_consumer(self, data):
+        with self.timings.phase("consume"):
+            await self.consume(
+                id=data["id"],
+                producerId=data["producerId"],
+                kind=data["kind"],
+                rtpParameters=data["rtpParameters"],
+                peerId=data.get("peerId"),
+                type=data.get("type"),
+            )
+
+    async def _on_new_data_consumer(self, data):
+        await self.consumeData(
+            id=data["id"],
+            dataProducerId=data["dataProducerId"],
+            label=data["label"],
+            protocol=data["protocol"],
+            sctpStreamParameters=data["sctpStreamParameters"],
+        )
+
+    async def _on_new_peer(self, data):
+        print(f"Peer {data['id']} has joined the call.")
+        self._peers.add(data["id"])
+
+    # The server sends peerLeft and peerClosed to every peer of the room
+    async def _on_peer_left(self, data):
+        print(f"Peer {data['peerId']} has left the call.")
+        self._peer_gone(data["peerId"], "peerLeft")
+
+    async def _on_peer_closed(self, data):
+        print(f"Peer {data['peerId']} has closed.")
+        self._peer_gone(data["peerId"], "peerClosed")
+
+    def _peer_gone(self, peerId, reason):
+        self._peers.discard(peerId)
+        if not self._peers:
+            self._end(reason)
+
+    def _end(self, reason):
+        if self.endReason is None:
+            self.endReason = reason
+        self._ending.set()
+
+    # Returns once one of the events that end the session fired; leaving and
+    # cleanup start right away, so the session's slot is not held idle
+    async def _stay(self):
+        if not self._linger and not self._untilEnded:
+            self._end("linger")
+            return
+        if self._untilEnded:
+            self._watch_tracks()
         try:
-            return await asyncio.wait_for(fut, timeout=timeout, **kwargs)
+            await asyncio.wait_for(self._ending.wait(), timeout=self._linger or None)
         except asyncio.TimeoutError:
-            print("Operation timed out")
+            self._end("linger")
+
+    def _watch_tracks(self):
+        # Tracks taken from the player; the synthetic ones never end
+        tracks = [
+            track
+            for track in (self._videoTrack, self._audioTrack)
+            if track not in self._ownedTracks
+        ]
+        live = [track for track in tracks if track.readyState == "live"]
+        if tracks and not live:
+            self._end("ended")
             return
+        remaining = len(live)
+
+        def on_ended():
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0:
+                self._end("ended")
 
-    async def _send_request(self, request):
-        self._answers[request["id"]] = self._loop.create_future()
-        await self._websocket.send(json.dumps(request))
+        for track in live:
+            track.once("ended", on_ended)
 
-    # Generates a random positive integer.
-    def generateRandomNumber(self) -> int:
-        return round(random() * 10000000)
+    async def _on_notification(self, message):
+        print(message)
 
     async def run(self):
-        self._websocket = await websockets.connect(self._uri, subprotocols=["protoo"])
-        
-        if sys.version_info < (3, 7):
-            task_run_recv_msg = asyncio.ensure_future(self.recv_msg_task())
-        else:
-            task_run_recv_msg = asyncio.create_task(self.recv_msg_task())
-        #self._tasks.append(task_run_recv_msg)
+        with self.timings.phase("connect"):
+            await self._protoo.connect()
 
-        #print('*** task:', self._tasks)
+        self._spawn(self.recv_msg_task())
+        if self.stats is not None:
+            self._spawn(self.stats.run())
+        if self.layerControl is not None:
+            self._spawn(self.layerControl.run())
 
-        await self.load()
-        await self.createSendTransport()
-        await self.createRecvTransport()
+        if self._fast_start:
+            await self._fast_bring_up()
+        else:
+            with self.timings.phase("load"):
+                await self.load()
+            with self.timings.phase("createSendTransport"):
+                await self.createSendTransport()
+            with self.timings.phase("createRecvTransport"):
+                await self.createRecvTransport()
         await self.produce()
+        print('*** timings:', self.timings.as_dict())
+        await self._stay()
+        print(f'*** leaving: {self.endReason}')
+        if self.stats is not None:
+            # A last sample, so short sessions get at least one
+            await self.stats.sample()
 
         await self.leaveRoom()
 
+    # Runs the steps that do not depend on each other concurrently: both
+    # transports are requested while the device loads, and join is sent as
+    # soon as the recv transport exists (the server only creates consumers
+    # for peers that already have one), overlapping the send side.
+    async def _fast_bring_up(self):
+        # SCTP capabilities are static for the aiortc handler, so the transport
+        # requests do not have to wait for the device to be loaded
+        handler = self._handlerFactory()()
+        sctpCapabilities = (await handler.getNativeSctpCapabilities()).dict()
+
+        async def load():
+            with self.timings.phase("load"):
+                await self.load()
+
+        loaded = asyncio.ensure_future(load())
+
+        async def send_side():
+            with self.timings.phase("createSendTransport"):
+                transportInfo = await self._request_transport(True, sctpCapabilities)
+                await loaded
+                await self.createSendTransport(transportInfo)
+
+        async def recv_side():
+            with self.timings.phase("createRecvTransport"):
+                transportInfo = await self._request_transport(False, sctpCapabilities)
+                await loaded
+                await self.createRecvTransport(transportInfo)
+
+        recvReady = asyncio.ensure_future(recv_side())
+
+        async def join():
+            await recvReady
+            with self.timings.phase("join"):
+                await self.join()
+
+        with self.timings.phase("bringUp"):
+            results = await asyncio.gather(
+                loaded, send_side(), recvReady, join(), return_exceptions=True
+            )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def _request_transport(self, producing, sctpCapabilities=None):
+        if sctpCapabilities is None:
+            sctpCapabilities = self._device.sctpCapabilities.dict()
+        return await self._protoo.request(
+            "createWebRtcTransport",
+            {
+                "forceTcp": False,
+                "producing": producing,
+                "consuming": not producing,
+                "sctpCapabilities": sctpCapabilities,
+            },
+        )
+
+    def _handlerFactory(self):
+        if self._warmPool is not None:
+            return self._warmPool.handlerFactory(tracks=self._tracks)
+        return AiortcHandler.createFactory(tracks=self._tracks)
+
     async def load(self):
+        handlerFactory = self._handlerFactory()
+        if self._capabilitiesCache is not None:
+            key = self._capabilitiesCache.key(self._uri)
+            try:
+                self._device = await self._capabilitiesCache.device(
+                    key,
+                    handlerFactory,
+                    lambda: self._protoo.request("getRouterRtpCapabilities"),
+                )
+            except Exception:
+                self._capabilitiesCache.invalidate(key)
+                raise
+            return
+
         # Init device
-        self._device = Device(
-            handlerFactory=AiortcHandler.createFactory(tracks=self._tracks)
-        )
+        self._device = Device(handlerFactory=handlerFactory)
 
         # Get Router RtpCapabilities
-        reqId = self.generateRandomNumber()
-        req = {
-            "request": True,
-            "id": reqId,
-            "method": "getRouterRtpCapabilities",
-            "data": {},
-        }
-        await self._send_request(req)
-        ans = await self._wait_for(self._answers[reqId], timeout=15)
+        routerRtpCapabilities = await self._protoo.request("getRouterRtpCapabilities")
 
         # Load Router RtpCapabilities
-        await self._device.load(ans["data"])
+        await self._device.load(RtpCapabilities(**routerRtpCapabilities))
 
-    async def createSendTransport(self):
+    async def createSendTransport(self, transportInfo=None):
         if self._sendTransport is not None:
             return
         # Send create sendTransport request
-        reqId = self.generateRandomNumber()
-        req = {
-            "request": True,
-            "id": reqId,
-            "method": "createWebRtcTransport",
-            "data": {
-                "forceTcp": False,
-                "producing": True,
-                "consuming": False,
-                "sctpCapabilities": self._device.sctpCapabilities.dict(),
-            },
-        }
-        await self._send_request(req)
-        ans = await self._wait_for(self._answers[reqId], timeout=15)
+        if transportInfo is None:
+            transportInfo = await self._request_transport(producing=True)
 
         # Create sendTransport
         self._sendTransport = self._device.createSendTransport(
-            id=ans["data"]["id"],
-            iceParameters=ans["data"]["iceParameters"],
-            iceCandidates=ans["data"]["iceCandidates"],
-            dtlsParameters=ans["data"]["dtlsParameters"],
-            sctpParameters=ans["data"]["sctpParameters"],
-            iceServers=ans["data"]["iceServers"]
+            id=transportInfo["id"],
+            iceParameters=transportInfo["iceParameters"],
+            iceCandidates=transportInfo["iceCandidates"],
+            dtlsParameters=transportInfo["dtlsParameters"],
+            sctpParameters=transportInfo["sctpParameters"],
+            iceServers=transportInfo["iceServers"]
         )
+        serialize_handler(self._sendTransport)
+        self._sample_transport("send", self._sendTransport)
+        self._watch_transport(self._sendTransport)
 
         @self._sendTransport.on("connect")
         async def on_connect(dtlsParameters):
-            reqId = self.generateRandomNumber()
-            req = {
-                "request": True,
-                "id": reqId,
-                "method": "connectWebRtcTransport",
-                "data": {
-                    "transportId": self._sendTransport.id,
-                    "dtlsParameters": dtlsParameters.dict(exclude_none=True),
-                },
-            }
-            await self._send_request(req)
-            ans = await self._wait_for(self._answers[reqId], timeout=15)
-            print(ans)
+            self.timings.mark("transportConnect")
+            with self.timings.phase("connectSendTransport"):
+                await self._protoo.request(
+                    "connectWebRtcTransport",
+                    {
+                        "transportId": self._sendTransport.id,
+                        "dtlsParameters": dtlsParameters.dict(exclude_none=True),
+                    },
+                )
 
         @self._sendTransport.on("produce")
         async def on_produce(kind: str, rtpParameters, appData: dict):
-            reqId = self.generateRandomNumber()
-            req = {
-                "id": reqId,
-                "method": "produce",
-                "request": True,
-                "data": {
+            ans = await self._protoo.request(
+                "produce",
+                {
                     "transportId": self._sendTransport.id,
                     "kind": kind,
                     "rtpParameters": rtpParameters.dict(exclude_none=True),
                     "appData": appData,
                 },
-            }
-            await self._send_request(req)
-            ans = await self._wait_for(self._answers[reqId], timeout=15)
-            return ans["data"]["id"]
+            )
+            return ans["id"]
 
         @self._sendTransport.on("producedata")
         async def on_producedata(
@@ -257,13 +651,9 @@ class Demo:
             protocol: str,
             appData: dict,
         ):
-
-            reqId = self.generateRandomNumber()
-            req = {
-                "id": reqId,
-                "method": "produceData",
-                "request": True,
-                "data": {
+            ans = await self._protoo.request(
+                "produceData",
+                {
                     "transportId": self._sendTransport.id,
                     "label": label,
                     "protocol": protocol,
@@ -272,140 +662,209 @@ class Demo:
                     ),
                     "appData": appData,
                 },
-            }
-            await self._send_request(req)
-            ans = await self._wait_for(self._answers[reqId], timeout=15)
-            return ans["data"]["id"]
+            )
+            return ans["id"]
         
+    def _sample_transport(self, direction, transport):
+        if self.stats is None:
+            return
+        self.stats.add("transport", transport.id, direction)
+        self.stats.add_local(direction, lambda: getattr(transport.handler, "pc", None))
+
     async def produce(self):
         try:
             await asyncio.wait_for(self._produce_logic(), timeout=self._time)
         except asyncio.TimeoutError:
             print("Closing the script.")
-            return
+            self._end("timeout")
+            raise
         except Exception as e:
-            # Handle other exceptions if needed
             print(f"An error occurred: {e}")
-            return
+            self._end("error")
+            raise
     
     async def _produce_logic(self):
         if self._sendTransport is None:
             await self.createSendTransport()
 
         # Join room
-        reqId = self.generateRandomNumber()
-        req = {
-            "request": True,
-            "id": reqId,
-            "method": "join",
-            "data": {
-                "displayName": "pymediasoup",
-                "device": {"flag": "python", "name": "python", "version": "0.1.0"},
-                "rtpCapabilities": self._device.rtpCapabilities.dict(exclude_none=True),
-                "sctpCapabilities": self._device.sctpCapabilities.dict(
-                    exclude_none=True
-                ),
-            },
-        }
-        await self._send_request(req)
-        ans = await self._wait_for(self._answers[reqId], timeout=15)
-        print(ans)
+        if not self._joined:
+            with self.timings.phase("join"):
+                await self.join()
 
         # produce
-        videoProducer: Producer = await self._sendTransport.produce(
-            track=self._videoTrack, stopTracks=False, appData={}
-        )
-        self._producers.append(videoProducer)
-        audioProducer: Producer = await self._sendTransport.produce(
-            track=self._audioTrack, stopTracks=False, appData={}
-        )
-        self._producers.append(audioProducer)
+        with self.timings.phase("produce"):
+            await self._produce_tracks()
 
-        return
-        # produce data
-        #await self.produceData()
+        if self.data is not None:
+            with self.timings.phase("produceData"):
+                await self.produceData()
+
+    async def _produce_tracks(self):
+        if self._fast_start:
+            await asyncio.gather(
+                self._produce_track(self._videoTrack),
+                self._produce_track(self._audioTrack),
+            )
+        else:
+            await self._produce_track(self._videoTrack)
+            await self._produce_track(self._audioTrack)
+
+    async def join(self):
+        self._peers = set()
+        try:
+            ans = await self._protoo.request(
+                "join",
+                {
+                    "displayName": "pymediasoup",
+                    "device": {"flag": "python", "name": "python", "version": "0.1.0"},
+                    "rtpCapabilities": self._device.rtpCapabilities.dict(exclude_none=True),
+                    "sctpCapabilities": self._device.sctpCapabilities.dict(
+                        exclude_none=True
+                    ),
+                },
+            )
+        except Exception:
+            # The router may have changed since its capabilities were cached
+            if self._capabilitiesCache is not None:
+                self._capabilitiesCache.invalidate(self._capabilitiesCache.key(self._uri))
+            raise
+        self._joined = True
+        # newPeer notifications may have been handled before the response
+        self._peers.update(peer["id"] for peer in ans.get("peers", []))
+        print(ans)
+
+    async def _produce_track(self, track):
+        # Pre-encoded tracks cannot be scaled
+        scalable = track.kind == "video" and getattr(track, "mimeType", None) is None
+        control = None
+        if scalable and self._simulcast:
+            layers = self._simulcastLayers = SimulcastLayers(track, self._simulcast)
+            producer: Producer = await layers.produce(
+                self._sendTransport, codec=self._codec_for(track), stopTracks=False, appData={}
+            )
+            self._spawn_media(layers.run(producer))
+            track, control = layers.track, layers.controls[-1]
+        else:
+            if scalable and self._adaptiveEncoding:
+                track = ScaledVideoTrack(track)
+                self._ownedTracks.append(track)
+            producer: Producer = await self._sendTransport.produce(
+                track=track, codec=self._codec_for(track), stopTracks=False, appData={}
+            )
+        self._producers.append(producer)
+        if scalable and self._adaptiveEncoding:
+            self.adaptive = AdaptiveEncoder(
+                control or EncodingControl(producer.rtpSender),
+                track,
+                get_score=self._producer_score(producer.id),
+            )
+            self._spawn_media(self.adaptive.run())
+        if self.stats is not None:
+            self.stats.add("producer", producer.id, producer.kind)
+        # RTP starts flowing from here once ICE/DTLS complete
+        self.timings.mark("firstProducer")
+
+    def _producer_score(self, producerId):
+        if self.stats is None:
+            return None
+        return lambda: self.stats.latest("producer", producerId, "score")
+
+    # Tracks that send pre-encoded packets (see passthrough.py) must be
+    # negotiated with the codec they carry
+    def _codec_for(self, track):
+        mimeType = getattr(track, "mimeType", None)
+        if mimeType is None:
+            return None
+        codecs = [
+            codec
+            for codec in self._device.rtpCapabilities.codecs
+            if codec.mimeType.lower() == mimeType.lower()
+        ]
+        # aiortc packetizes H.264 with FU-A/STAP-A
+        codecs.sort(key=lambda codec: codec.parameters.get("packetization-mode") != 1)
+        if not codecs:
+            raise RuntimeError(f"Router does not support {mimeType}")
+        return codecs[0]
 
     async def produceData(self):
         if self._sendTransport is None:
             await self.createSendTransport()
 
-        reqId = self.generateRandomNumber()
-        req = {
-            "request": True,
-            "id": reqId,
-            "method": "close",  
-            "data": {}
-        }
-
-        await self._send_request(req)
-
+        load = self.data.load
         dataProducer: DataProducer = await self._sendTransport.produceData(
-            ordered=False,
-            maxPacketLifeTime=5555,
-            label="chat",
+            ordered=load.ordered,
+            maxPacketLifeTime=load.maxPacketLifeTime,
+            maxRetransmits=load.maxRetransmits,
+            label=load.label,
             protocol="",
-            appData={"info": "my-chat-DataProducer"},
+            appData={},
         )
         self._producers.append(dataProducer)
-        while not self._closed:
-            await asyncio.sleep(1)
-            dataProducer.send("hello")
+        # Sends from the moment SCTP is up until the session closes
+        self._spawn_media(self.data.add_producer(dataProducer).run())
 
-    async def createRecvTransport(self):
+    async def createRecvTransport(self, transportInfo=None):
         if self._recvTransport is not None:
             return
         # Send create recvTransport request
-        reqId = self.generateRandomNumber()
-        req = {
-            "request": True,
-            "id": reqId,
-            "method": "createWebRtcTransport",
-            "data": {
-                "forceTcp": False,
-                "producing": False,
-                "consuming": True,
-                "sctpCapabilities": self._device.sctpCapabilities.dict(),
-            },
-        }
-        await self._send_request(req)
-        ans = await self._wait_for(self._answers[reqId], timeout=15)
+        if transportInfo is None:
+            transportInfo = await self._request_transport(producing=False)
 
         # Create recvTransport
         self._recvTransport = self._device.createRecvTransport(
-            id=ans["data"]["id"],
-            iceParameters=ans["data"]["iceParameters"],
-            iceCandidates=ans["data"]["iceCandidates"],
-            dtlsParameters=ans["data"]["dtlsParameters"],
-            sctpParameters=ans["data"]["sctpParameters"],
-            iceServers=ans["data"]["iceServers"]
+            id=transportInfo["id"],
+            iceParameters=transportInfo["iceParameters"],
+            iceCandidates=transportInfo["iceCandidates"],
+            dtlsParameters=transportInfo["dtlsParameters"],
+            sctpParameters=transportInfo["sctpParameters"],
+            iceServers=transportInfo["iceServers"]
         )
+        serialize_handler(self._recvTransport)
+        self._sample_transport("recv", self._recvTransport)
+        self._watch_transport(self._recvTransport)
 
         @self._recvTransport.on("connect")
         async def on_connect(dtlsParameters):
-            reqId = self.generateRandomNumber()
-            req = {
-                "request": True,
-                "id": reqId,
-                "method": "connectWebRtcTransport",
-                "data": {
-                    "transportId": self._recvTransport.id,
-                    "dtlsParameters": dtlsParameters.dict(exclude_none=True),
-                },
-            }
-            await self._send_request(req)
-            ans = await self._wait_for(self._answers[reqId], timeout=15)
-            print(ans)
+            self.timings.mark("transportConnect")
+            with self.timings.phase("connectRecvTransport"):
+                await self._protoo.request(
+                    "connectWebRtcTransport",
+                    {
+                        "transportId": self._recvTransport.id,
+                        "dtlsParameters": dtlsParameters.dict(exclude_none=True),
+                    },
+                )
 
-    async def consume(self, id, producerId, kind, rtpParameters):
+    async def consume(self, id, producerId, kind, rtpParameters, peerId=None, type=None):
         if self._recvTransport is None:
             await self.createRecvTransport()
         consumer: Consumer = await self._recvTransport.consume(
             id=id, producerId=producerId, kind=kind, rtpParameters=rtpParameters
         )
         self._consumers.append(consumer)
-        self._recorder.addTrack(consumer.track)
+        if self.stats is not None:
+            self.stats.add("consumer", consumer.id, kind)
+        if self.layerControl is not None:
+            self.layerControl.add(consumer.id, kind, type, rtpParameters)
+        self.timings.mark("firstConsumer")
+        # A SegmentedRecorder can take the encoded frames of the consumer
+        addConsumer = getattr(self._recorder, "addConsumer", None)
+        if addConsumer is not None:
+            addConsumer(consumer, peerId, receiver=self._receiver_for(consumer))
+        else:
+            self._recorder.addTrack(consumer.track)
         await self._recorder.start()
 
+    # pymediasoup does not hand the RTCRtpReceiver to the Consumer
+    def _receiver_for(self, consumer):
+        if consumer.rtpReceiver is not None:
+            return consumer.rtpReceiver
+        for transceiver in self._recvTransport.handler.pc.getTransceivers():
+            if transceiver.receiver.track is consumer.track:
+                return transceiver.receiver
+        return None
+
     async def consumeData(
         self,
         id,
@@ -415,7 +874,6 @@ class Demo:
         protocol=None,
         appData={},
     ):
-        pass
         dataConsumer: DataConsumer = await self._recvTransport.consumeData(
             id=id,
             dataProducerId=dataProducerId,
@@ -425,52 +883,70 @@ class Demo:
             appData=appData,
         )
         self._consumers.append(dataConsumer)
+        if self.data is not None:
+            self.data.add_consumer(dataConsumer, label)
+            return
 
         @dataConsumer.on("message")
         def on_message(message):
             print(f"DataChannel {label}-{protocol}: {message}")
 
     async def close(self):
-        for consumer in self._consumers:
-            print('close consumers')
-            await consumer.close()
-        for producer in self._producers:
-            print('close producer')
-            await producer.close()
-        for task in self._tasks:
-            print('close task')
-            await task.cancel()
+        # Safe to call repeatedly and concurrently (e.g. on peerLeft while the
+        # session ends); the teardown runs once and is not interrupted when a
+        # caller is cancelled
+        if self._closing is None:
+            self._closing = asyncio.ensure_future(self._timed_close())
+        await asyncio.shield(self._closing)
+
+    async def _timed_close(self):
+        with self.timings.phase("close"):
+            await self._close()
+
+    async def _close(self):
+        self._closed = True
+        if self._simulcastLayers is not None:
+            await self._release(self._simulcastLayers.stop)
+        # Closing a transport closes its RTCPeerConnection and marks its
+        # producers and consumers closed, without the per-track SDP
+        # renegotiation their own close() would do
         if self._sendTransport:
             print('close _sendTransport')
-            await self._sendTransport.close()
+            await self._release(self._sendTransport.close)
         if self._recvTransport:
             print('close _recvTransport')
-            await self._recvTransport.close()
-        
-        await self._websocket.close()
-        await self._recorder.stop()
+            await self._release(self._recvTransport.close)
+        await self._release(self._protoo.close)
+        if self.trace is not None:
+            self.trace.close()
+
+        tasks = [task for task in self._tasks if task is not asyncio.current_task()]
+        for task in tasks:
+            print('close task')
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._recorder:
+            await self._release(self._recorder.stop)
+        for track in self._ownedTracks:
+            track.stop()
+
+    # Every teardown step runs even when an earlier one fails
+    async def _release(self, close):
+        try:
+            await close()
+        except Exception as e:
+            print(f"Error during close: {e}")
 
     async def leaveRoom(self):
         try:
             print('**** Initialize leaveRoom method ****')
-            # Generate a unique request ID
-            reqId = self.generateRandomNumber()
-
-            # Create the leaveCall request
-            req = {
-                "request": True,
-                "id": reqId,
-                "method": "leaveRoom",
-                "data": {}
-            }
-
-            # Send the request to the server
-            await self._send_request(req)
-            
-            # Wait for the server response
-            ans = await self._wait_for(self._answers[reqId], timeout=15)
+            self._leaving = True
+            # Send the request to the server and wait for its response
+            with self.timings.phase("leaveRoom"):
+                await self._protoo.request("leaveRoom")
 
-            await self._websocket.close()
+            await self._protoo.close()
 
         except Exception as e:
             print(f"Error in leaveRoom: {e}")
@@ -480,8 +956,31 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="PyMediaSoup")
     parser.add_argument("room", nargs="?", help="Room ID for the WebRTC session")
     parser.add_argument("--play-from", help="Read the media from a file and send it.")
-    parser.add_argument("--record-to", help="Write received media to a file.")
+    parser.add_argument("--duration", type=float, default=0, help="Stay this many seconds at most; with --play-from, leave when the file ends.")
+    parser.add_argument("--record-to", help="Write received media to a file, or to rolling segments in a directory when it has no extension.")
+    parser.add_argument("--segment-seconds", type=float, default=60, help="Length of recorded segments (s).")
+    parser.add_argument("--record-per", choices=["consumer", "peer"], default="consumer", help="Write one series of segments per consumer or per peer.")
+    parser.add_argument("--record-queue", type=int, default=512, help="Frames the recorder may queue before dropping.")
+    parser.add_argument("--measure", action="store_true", help="Count received media without decoding it and print the counters on exit.")
+    parser.add_argument("--stats-interval", type=float, default=0, help="Poll server and local media stats every this many seconds and print a summary on exit.")
+    parser.add_argument("--simulcast", nargs="?", const="4:150000,2:500000,1:1500000", help="Send video as simulcast layers, given as scale:maxBitrate per layer, lowest first.")
+    parser.add_argument("--adaptive", action="store_true", help="Lower the video bitrate, then resolution, when the uplink shows loss or delay.")
+    parser.add_argument("--layer-control", action="store_true", help="Ask the server for lower consumer layers while this client is overloaded.")
+    parser.add_argument("--data-size", type=int, default=0, help="Send binary data channel messages of this many bytes and measure received ones; 0 disables.")
+    parser.add_argument("--data-rate", type=float, default=0, help="Data channel messages per second; 0 sends as fast as the channel drains.")
+    parser.add_argument("--data-unordered", action="store_true", help="Send data channel messages unordered.")
+    parser.add_argument("--data-lifetime", type=int, help="Give up on data channel messages after this many milliseconds.")
+    parser.add_argument("--data-retransmits", type=int, help="Give up on data channel messages after this many retransmissions.")
+    parser.add_argument("--reconnect", action="store_true", help="Reconnect and recover media when the websocket or ICE drops.")
+    parser.add_argument("--trace", help="Append every signaling message sent and received to this file, for replay.py.")
+    parser.add_argument("--warm-pool", action="store_true", help="Generate the DTLS certificate and native capabilities before connecting.")
     parser.add_argument("--wsurl", help="WebSocket URL to connect to Mediasoup server", nargs="?")
+    parser.add_argument("--fast-start", action="store_true", help="Run independent bring-up steps concurrently.")
+    parser.add_argument("--passthrough", action="store_true", help="Send --play-from without transcoding it per session.")
+    parser.add_argument("--video-size", default="640x480", help="Synthetic video size when there is no --play-from.")
+    parser.add_argument("--fps", type=int, default=30, help="Synthetic video frame rate.")
+    parser.add_argument("--pattern", choices=["bars", "black"], default="bars", help="Synthetic video pattern; black also sends silence.")
+    parser.add_argument("--tone", type=float, default=440, help="Synthetic audio tone frequency in Hz.")
     args = parser.parse_args()
 
     # Show received args
@@ -502,25 +1001,64 @@ if __name__ == "__main__":
 
     print(f"Connecting to WebSocket URI: {uri}")
 
-    if args.play_from:
+    # run event loop
+    loop = asyncio.get_event_loop()
+
+    if args.play_from and args.passthrough:
+        sources = EncodedSourceManager(os.path.join(tempfile.gettempdir(), "pymediasoup-encoded-media"))
+        player = loop.run_until_complete(sources.open(args.play_from))
+    elif args.play_from:
         player = MediaPlayer(args.play_from)
     else:
-        player = None
+        width, height = (int(size) for size in args.video_size.split("x"))
+        player = SyntheticSource(width, height, args.fps, args.pattern, frequency=args.tone)
 
     
     # create media sink
-    if args.record_to:
+    if args.record_to and not os.path.splitext(args.record_to)[1]:
+        recorder = SegmentedRecorder(
+            args.record_to,
+            segment_seconds=args.segment_seconds,
+            per=args.record_per,
+            max_queue=args.record_queue,
+        )
+    elif args.record_to:
         recorder = MediaRecorder(args.record_to)
+    elif args.measure:
+        recorder = ReceiveSink()
     else:
         recorder = MediaBlackhole()
 
-    # run event loop
-    loop = asyncio.get_event_loop()
+    data_load = None
+    if args.data_size:
+        data_load = DataLoad(
+            size=args.data_size,
+            rate=args.data_rate,
+            ordered=not args.data_unordered,
+            maxPacketLifeTime=args.data_lifetime,
+            maxRetransmits=args.data_retransmits,
+        )
+
+    warm_pool = None
+    if args.warm_pool:
+        warm_pool = WarmPool()
+        loop.run_until_complete(warm_pool.warm())
 
     try:
-        demo = Demo(uri=uri, player=player, recorder=recorder, loop=loop)
+        demo = Demo(uri=uri, player=player, recorder=recorder, loop=loop, fast_start=args.fast_start, stats_interval=args.stats_interval,
+                    simulcast=parse_layers(args.simulcast) if args.simulcast else None, adaptive_encoding=args.adaptive, layer_control=args.layer_control,
+                    data_load=data_load, reconnect=args.reconnect, warm_pool=warm_pool, trace=args.trace,
+                    linger=args.duration, until_ended=bool(args.play_from))
         loop.run_until_complete(demo.run())
     except KeyboardInterrupt:
         pass
     finally:
         loop.run_until_complete(demo.close())
+        if isinstance(recorder, ReceiveSink):
+            print(json.dumps(recorder.stats(), indent=2))
+        if demo.stats is not None:
+            print(json.dumps(demo.stats.summary(), indent=2))
+        if demo.data is not None:
+            print(json.dumps(demo.data.stats(), indent=2))
+        if demo.recoveries:
+            print(json.dumps(demo.recoveries, indent=2))
@@ -0,0 +1,169 @@
+from typing import Dict, List, Optional
+
+from prometheus_client import REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, Metric
+
+# Prometheus instrumentation for sessions. Every process records into its own
+# default registry; in supervisor mode the web process merges what the
+# workers report, labelling every sample with the process it came from.
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+SESSION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+SIGNALING_REQUEST_SECONDS = Histogram(
+    "pymediasoup_signaling_request_seconds",
+    "Time from sending a protoo request to its response",
+    ["method", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+SESSION_PHASE_SECONDS = Histogram(
+    "pymediasoup_session_phase_seconds",
+    "Duration of session lifecycle phases",
+    ["phase"],
+    buckets=LATENCY_BUCKETS,
+)
+SESSION_SECONDS = Histogram(
+    "pymediasoup_session_seconds",
+    "Duration of whole sessions",
+    ["outcome"],
+    buckets=SESSION_BUCKETS,
+)
+SESSIONS = Counter(
+    "pymediasoup_sessions",
+    "Sessions that ended, by outcome",
+    ["outcome"],
+)
+SESSION_RECOVERIES = Counter(
+    "pymediasoup_session_recoveries",
+    "Session outages (websocket or ICE) by how they ended: restartIce, rejoin or failed",
+    ["cause", "result"],
+)
+SESSION_RECOVERY_SECONDS = Histogram(
+    "pymediasoup_session_recovery_seconds",
+    "Time from losing the websocket or ICE to media being restored",
+    ["result"],
+    buckets=LATENCY_BUCKETS,
+)
+WEBHOOK_DELIVERIES = Counter(
+    "pymediasoup_webhook_deliveries",
+    "Session callbacks by final outcome: delivered, rejected, failed or dropped",
+    ["outcome"],
+)
+WEBHOOK_DELIVERY_SECONDS = Histogram(
+    "pymediasoup_webhook_delivery_seconds",
+    "Time from queueing a session callback to its final outcome, retries included",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+WEBHOOK_REQUEST_SECONDS = Histogram(
+    "pymediasoup_webhook_request_seconds",
+    "Duration of single callback attempts, by status code or error",
+    ["result"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class SessionObserver:
+    """
+    Feeds the phase and signaling request timings of a Demo into the
+    histograms above. Label children are cached so each observation is a
+    dictionary lookup plus the histogram update.
+    """
+
+    def __init__(self):
+        self._phases: Dict[str, Histogram] = {}
+        self._requests: Dict[tuple, Histogram] = {}
+
+    def phase(self, name: str, seconds: float):
+        child = self._phases.get(name)
+        if child is None:
+            child = self._phases[name] = SESSION_PHASE_SECONDS.labels(name)
+        child.observe(seconds)
+
+    def request(self, method: str, seconds: float, error: Optional[BaseException]):
+        key = (method, "ok" if error is None else type(error).__name__)
+        child = self._requests.get(key)
+        if child is None:
+            child = self._requests[key] = SIGNALING_REQUEST_SECONDS.labels(*key)
+        child.observe(seconds)
+
+    def recovery(self, cause: str, result: str, seconds: float):
+        SESSION_RECOVERIES.labels(cause, result).inc()
+        SESSION_RECOVERY_SECONDS.labels(result).observe(seconds)
+
+
+observer = SessionObserver()
+
+
+def session_done(outcome: str, seconds: float):
+    SESSIONS.labels(outcome).inc()
+    SESSION_SECONDS.labels(outcome).observe(seconds)
+
+
+def collect() -> List[Metric]:
+    # Includes the default process collector: CPU seconds and resident memory
+    return list(REGISTRY.collect())
+
+
+def _relabel(families: List[Metric], **labels) -> List[Metric]:
+    relabelled = []
+    for family in families:
+        metric = Metric(family.name, family.documentation, family.type, family.unit)
+        metric.samples = [
+            sample._replace(labels={**sample.labels, **labels})
+            for sample in family.samples
+        ]
+        relabelled.append(metric)
+    return relabelled
+
+
+def _engine_families(stats: dict) -> List[Metric]:
+    gauges = [
+        GaugeMetricFamily("pymediasoup_sessions_active", "Sessions running", labels=["process"]),
+        GaugeMetricFamily("pymediasoup_sessions_queued", "Sessions waiting for a slot", labels=["process"]),
+        GaugeMetricFamily("pymediasoup_event_loop_lag_seconds", "Lateness of timers on the session loop", labels=["process"]),
+        GaugeMetricFamily("pymediasoup_ready", "1 once the session loop finished its warm-up", labels=["process"]),
+    ]
+    for engine_stats, process in (
+        [(worker, f"worker-{worker['index']}") for worker in stats["workers"]]
+        if "workers" in stats
+        else [(stats, "main")]
+    ):
+        gauges[0].add_metric([process], engine_stats.get("active", 0))
+        gauges[1].add_metric([process], engine_stats.get("queued", 0))
+        gauges[2].add_metric([process], engine_stats.get("loop_lag_ms", 0) / 1000)
+        gauges[3].add_metric([process], 1 if engine_stats.get("ready") else 0)
+    capacity = GaugeMetricFamily("pymediasoup_sessions_capacity", "Session slots plus queue places")
+    capacity.add_metric([], stats["max_sessions"] + stats["max_queue"])
+    return gauges + [capacity]
+
+
+class _Families:
+    def __init__(self, families: List[Metric]):
+        self._families = families
+
+    def collect(self):
+        return self._families
+
+
+def render(engine) -> bytes:
+    """
+    Prometheus text exposition for this process and, when ``engine`` is a
+    Supervisor, its workers.
+    """
+    families = _relabel(collect(), process="main")
+    if hasattr(engine, "metric_families"):
+        for index, worker_families in engine.metric_families():
+            families += _relabel(worker_families, process=f"worker-{index}")
+    families += _engine_families(engine.stats())
+
+    # One family per name, with the samples of every process
+    merged: Dict[str, Metric] = {}
+    for family in families:
+        if family.name in merged:
+            merged[family.name].samples += family.samples
+        else:
+            merged[family.name] = family
+    return generate_latest(_Families(list(merged.values())))
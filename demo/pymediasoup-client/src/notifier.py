@@ -0,0 +1,177 @@
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+
+class _Delivery:
+    def __init__(self, url: str, payload: dict):
+        self.url = url
+        self.payload = payload
+        self.attempt = 0
+        self.queued_at = time.monotonic()
+
+
+class WebhookNotifier:
+    """
+    Delivers session callbacks (success_url / failure_url PUTs) in the
+    background so a slow or failing endpoint never holds up a session.
+
+    ``notify`` can be called from any thread or event loop; it only enqueues
+    and returns False when ``max_queue`` deliveries are already pending. The
+    notifier runs its own loop in a daemon thread, started on first use, and
+    ``workers`` requests at a time over a keep-alive session with a
+    connection pool per host.
+
+    Failed attempts (connection errors, timeouts, 429 and 5xx answers) are
+    retried up to ``retries`` times with exponential backoff and full jitter.
+    A delivery waiting for its retry does not occupy a worker.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 1000,
+        timeout: float = 5,
+        retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._delivered = 0
+        self._failed = 0
+        self._rejected = 0
+        self._dropped = 0
+        self._retried = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="webhook")
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(self._loop)
+                self._queue = asyncio.Queue()
+                for _ in range(self.workers):
+                    self._loop.create_task(self._worker())
+                self._loop.call_soon(ready.set)
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="webhook-notifier", daemon=True)
+            self._thread.start()
+        ready.wait()
+
+    def notify(self, url: str, payload: dict) -> bool:
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self._dropped += 1
+                metrics.WEBHOOK_DELIVERIES.labels("dropped").inc()
+                return False
+            self._pending += 1
+        self._ensure_started()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, _Delivery(url, payload))
+        return True
+
+    async def _worker(self):
+        while True:
+            delivery = await self._queue.get()
+            outcome = await self._attempt(delivery)
+            if outcome == "retry" and delivery.attempt <= self.retries:
+                delay = min(self.max_backoff, self.backoff * 2 ** (delivery.attempt - 1))
+                with self._lock:
+                    self._retried += 1
+                self._loop.call_later(
+                    random.uniform(0, delay), self._queue.put_nowait, delivery
+                )
+                continue
+
+            if outcome == "retry":
+                outcome = "failed"
+                print(f"Giving up on {delivery.url} after {delivery.attempt} attempts")
+            with self._lock:
+                self._pending -= 1
+                if outcome == "failed":
+                    self._failed += 1
+                elif outcome == "rejected":
+                    self._rejected += 1
+                else:
+                    self._delivered += 1
+            metrics.WEBHOOK_DELIVERIES.labels(outcome).inc()
+            metrics.WEBHOOK_DELIVERY_SECONDS.labels(outcome).observe(
+                time.monotonic() - delivery.queued_at
+            )
+
+    async def _attempt(self, delivery: _Delivery) -> str:
+        """Makes one attempt; returns "delivered", "rejected" or "retry"."""
+        delivery.attempt += 1
+        start = time.monotonic()
+        try:
+            response = await self._loop.run_in_executor(
+                self._executor,
+                lambda: self._session.put(
+                    delivery.url, json=delivery.payload, timeout=self.timeout
+                ),
+            )
+        except requests.RequestException as e:
+            result = type(e).__name__
+            outcome = "retry"
+        else:
+            result = str(response.status_code)
+            if response.status_code == 429 or response.status_code >= 500:
+                outcome = "retry"
+            elif response.status_code >= 400:
+                print(f"{delivery.url} rejected the notification: {response.status_code}")
+                outcome = "rejected"
+            else:
+                outcome = "delivered"
+        metrics.WEBHOOK_REQUEST_SECONDS.labels(result).observe(time.monotonic() - start)
+        return outcome
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "delivered": self._delivered,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "dropped": self._dropped,
+                "retried": self._retried,
+            }
+
+    def drain(self, timeout: float = 10) -> bool:
+        """Waits until every accepted notification was delivered or given up."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self._pending == 0:
+                    return True
+            time.sleep(0.05)
+        return False
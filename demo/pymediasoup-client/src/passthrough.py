@@ -0,0 +1,321 @@
+import os
+import re
+import time
+import fcntl
+import asyncio
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from fractions import Fraction
+from typing import Dict, List, Optional
+
+import av
+from av.bitstream import BitStreamFilterContext
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+from media_cache import MediaCache
+
+# Codecs that are sent exactly as they are stored in the container
+PASSTHROUGH_CODECS = {"vp8": "video/VP8", "h264": "video/H264", "opus": "audio/opus"}
+# H.264 without B-frames in a profile every receiver can decode
+H264_PROFILES = {"Baseline", "Constrained Baseline"}
+
+# Settings of the one-off encode for streams that cannot be sent as they are
+VIDEO_BITRATE = 1_000_000
+AUDIO_BITRATE = 64_000
+
+# Names of the files MediaCache stores: the SHA-256 of their content
+_CACHED_NAME = re.compile(r"[0-9a-f]{64}")
+
+
+class _Packets:
+    """
+    All encoded packets of one stream, in decode order. Timestamps start at
+    zero and the first video packet is a keyframe.
+    """
+
+    def __init__(self, kind: str, mimeType: str, time_base: Fraction):
+        self.kind = kind
+        self.mimeType = mimeType
+        self.time_base = time_base
+        self.data: List[bytes] = []
+        self.pts: List[int] = []
+        # Length of the stream in time_base units, added to timestamps on
+        # every loop
+        self.duration = 0
+
+
+def _can_pass_through(stream) -> bool:
+    codec = stream.codec_context
+    if codec.name not in PASSTHROUGH_CODECS:
+        return False
+    if codec.name == "h264":
+        return codec.profile in H264_PROFILES and not codec.has_b_frames
+    return True
+
+
+def _read_packets(path: str, kind: str) -> Optional[_Packets]:
+    with av.open(path) as container:
+        streams = container.streams.video if kind == "video" else container.streams.audio
+        if not streams:
+            return None
+        stream = streams[0]
+        codec = stream.codec_context.name
+        packets = _Packets(kind, PASSTHROUGH_CODECS[codec], stream.time_base)
+        # RTP carries H.264 as Annex B, MP4 and Matroska store it length-prefixed
+        bsf = BitStreamFilterContext("h264_mp4toannexb", stream) if codec == "h264" else None
+
+        def append(packet):
+            if packet.pts is None or packet.size == 0:
+                return
+            # Sessions must start on a keyframe
+            if kind == "video" and not packets.data and not packet.is_keyframe:
+                return
+            packets.data.append(bytes(packet))
+            packets.pts.append(packet.pts)
+            packets.duration = max(packets.duration, packet.pts + (packet.duration or 0))
+
+        for packet in container.demux(stream):
+            for filtered in bsf.filter(packet) if bsf else [packet]:
+                append(filtered)
+        if bsf:
+            for filtered in bsf.filter(None):
+                append(filtered)
+
+    if not packets.data:
+        return None
+    first = packets.pts[0]
+    packets.pts = [pts - first for pts in packets.pts]
+    packets.duration -= first
+    return packets
+
+
+def _transcode(path: str, kind: str, target: str):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".encode-", suffix=".webm")
+    os.close(fd)
+    try:
+        with av.open(path) as src, av.open(tmp_path, "w", format="webm") as dst:
+            if kind == "video":
+                src_stream = src.streams.video[0]
+                rate = src_stream.average_rate or 30
+                out = dst.add_stream("libvpx", rate=rate)
+                out.width = src_stream.codec_context.width
+                out.height = src_stream.codec_context.height
+                out.pix_fmt = "yuv420p"
+                out.bit_rate = VIDEO_BITRATE
+                # A keyframe every two seconds
+                out.codec_context.gop_size = int(rate * 2)
+                for index, frame in enumerate(src.decode(src_stream)):
+                    frame = frame.reformat(format="yuv420p")
+                    frame.pts = index
+                    frame.time_base = Fraction(1) / Fraction(rate)
+                    dst.mux(out.encode(frame))
+            else:
+                src_stream = src.streams.audio[0]
+                out = dst.add_stream("libopus", rate=48000)
+                out.layout = "stereo"
+                out.bit_rate = AUDIO_BITRATE
+                # 20 ms Opus frames
+                resampler = av.AudioResampler(
+                    format="s16", layout="stereo", rate=48000, frame_size=960
+                )
+                for frame in src.decode(src_stream):
+                    frame.pts = None
+                    for resampled in resampler.resample(frame):
+                        dst.mux(out.encode(resampled))
+                for resampled in resampler.resample(None):
+                    dst.mux(out.encode(resampled))
+            dst.mux(out.encode(None))
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class EncodedTrack(MediaStreamTrack):
+    """
+    Sends a session's copy of an encoded stream. ``recv`` returns
+    ``av.Packet`` objects, which aiortc packetizes into RTP as they are; the
+    sender assigns its own sequence numbers and timestamp origin.
+    """
+
+    def __init__(self, source: "EncodedSource", packets: _Packets):
+        super().__init__()
+        self.kind = packets.kind
+        self.mimeType = packets.mimeType
+        self._source = source
+        self._packets = packets
+        self._index = 0
+        # Timestamp offset of the current loop
+        self._offset = 0
+
+    async def recv(self) -> av.Packet:
+        if self.readyState != "live":
+            raise MediaStreamError
+
+        packets = self._packets
+        if self._index == len(packets.data):
+            if not self._source.loop:
+                self.stop()
+                raise MediaStreamError
+            self._index = 0
+            self._offset += packets.duration
+
+        pts = packets.pts[self._index] + self._offset
+        # Pace against the session clock shared by audio and video
+        wait = self._source.start_time() + float(pts * packets.time_base) - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        packet = av.Packet(packets.data[self._index])
+        packet.pts = pts
+        packet.time_base = packets.time_base
+        self._index += 1
+        return packet
+
+
+class EncodedSource:
+    """
+    One session's view of a pre-encoded source. Exposes ``audio`` and
+    ``video`` like a MediaPlayer so it can be handed to Demo directly.
+    """
+
+    def __init__(self, streams: Dict[str, Optional[_Packets]], loop: bool = False):
+        self.loop = loop
+        self._start: Optional[float] = None
+        self.audio = EncodedTrack(self, streams["audio"]) if streams.get("audio") else None
+        self.video = EncodedTrack(self, streams["video"]) if streams.get("video") else None
+
+    def start_time(self) -> float:
+        if self._start is None:
+            self._start = time.time()
+        return self._start
+
+    def close(self):
+        for track in (self.audio, self.video):
+            if track is not None:
+                track.stop()
+
+
+class EncodedSourceManager:
+    """
+    Prepares each media source once per process for sending without
+    transcoding: VP8, Opus and H.264 without B-frames are read from the
+    container as they are, other streams are encoded once to VP8 or Opus
+    and the result is kept in ``directory``.
+
+    The packets of every source are held in memory and each session reads
+    them through its own cursor, so N sessions cost no decode and no encode
+    at all, only packetization. Every session starts on a keyframe.
+
+    Encodes are named after the SHA-256 of the source's content, so every
+    process reuses them. Past ``max_bytes`` the least recently used ones are
+    deleted when a new one is written.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        cache: Optional[MediaCache] = None,
+        loop: bool = False,
+        max_bytes: int = 1 << 30,
+    ):
+        self.directory = directory
+        self._cache = cache
+        self._loop = loop
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._sources: Dict[str, Dict[str, Optional[_Packets]]] = {}
+        self._lock = asyncio.Lock()
+
+    async def open(self, url: str) -> EncodedSource:
+        path = await self._cache.get(url) if self._cache else url
+        async with self._lock:
+            streams = self._sources.get(path)
+            if streams is None:
+                streams = await asyncio.get_running_loop().run_in_executor(
+                    None, self._prepare, path
+                )
+                self._sources[path] = streams
+        return EncodedSource(streams, loop=self._loop)
+
+    @staticmethod
+    def _content_key(path: str) -> str:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if _CACHED_NAME.fullmatch(name):
+            return name
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @contextmanager
+    def _locked(self, name: str):
+        # An exclusive lock across threads and processes
+        with open(os.path.join(self.directory, name), "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _evict(self, key: str):
+        with self._locked(".lock"):
+            files = []
+            for name in os.listdir(self.directory):
+                if name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in files)
+            for _, size, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                # Never the encodes of the source being opened
+                if name.startswith(key):
+                    continue
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def _prepare(self, path: str) -> Dict[str, Optional[_Packets]]:
+        key = self._content_key(path)
+
+        streams = {}
+        with av.open(path) as container:
+            kinds = {
+                "video": container.streams.video[0] if container.streams.video else None,
+                "audio": container.streams.audio[0] if container.streams.audio else None,
+            }
+            sources = {}
+            for kind, stream in kinds.items():
+                if stream is None:
+                    sources[kind] = None
+                elif _can_pass_through(stream):
+                    sources[kind] = path
+                else:
+                    sources[kind] = os.path.join(self.directory, f"{key}.{kind}.webm")
+
+        for kind, source in sources.items():
+            if source is None:
+                streams[kind] = None
+                continue
+            if source != path:
+                # Other processes wait for the encode instead of repeating it
+                with self._locked(".encode.lock"):
+                    if os.path.exists(source):
+                        # Most recently used, for eviction
+                        os.utime(source)
+                    else:
+                        print(f"Encoding {kind} of {path} for passthrough")
+                        _transcode(path, kind, source)
+                        self._evict(key)
+            streams[kind] = _read_packets(source, kind)
+        return streams
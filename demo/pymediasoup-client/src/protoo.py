@@ -0,0 +1,338 @@
+import json
+import time
+import asyncio
+from itertools import count
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from asyncio.futures import Future
+
+import websockets
+
+# Handler signature for server requests and notifications: receives the
+# message "data" payload and, for requests, returns the response data.
+Handler = Callable[[dict], Awaitable[Any]]
+# Called as each client request settles: (method, seconds, error or None)
+RequestDoneCallback = Callable[[str, float, Optional[BaseException]], None]
+# Called with every message sent ("out") or received ("in"), and with
+# ("open", {"uri": ...}) as each connection opens
+MessageCallback = Callable[[str, dict], None]
+
+
+class ProtooError(Exception):
+    pass
+
+
+class ProtooTimeoutError(ProtooError, asyncio.TimeoutError):
+    def __init__(self, method: str, timeout: float):
+        super().__init__(f"request {method} timed out after {timeout}s")
+        self.method = method
+        self.timeout = timeout
+
+
+class ProtooRequestError(ProtooError):
+    def __init__(self, method: str, errorCode: int, errorReason: str):
+        super().__init__(f"request {method} failed [{errorCode}]: {errorReason}")
+        self.method = method
+        self.errorCode = errorCode
+        self.errorReason = errorReason
+
+
+class ProtooClosedError(ProtooError, ConnectionError):
+    pass
+
+
+class _Route:
+    def __init__(self, handler: Handler, concurrency: Optional[int]):
+        self.handler = handler
+        # None means unbounded: every message gets its own task right away.
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+
+class Dispatcher:
+    """
+    Event-driven protoo message pump.
+
+    Reads the websocket continuously, resolves responses into the futures
+    registered with ``expect()`` as soon as they arrive and runs server
+    requests and notifications as independent tasks through a per-method
+    handler registry, so a slow handler never delays the next frame.
+    """
+
+    def __init__(self, websocket, loop=None, on_message: Optional[MessageCallback] = None):
+        self._websocket = websocket
+        self._loop = loop or asyncio.get_event_loop()
+        self._onMessage = on_message
+
+        # Futures waiting for a response, indexed by request id
+        self._pending: Dict[Any, Future] = {}
+        self._requestRoutes: Dict[str, _Route] = {}
+        self._notificationRoutes: Dict[str, _Route] = {}
+        self._defaultNotificationHandler: Optional[Handler] = None
+        # In-flight handler tasks, kept so they are not garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def on_request(self, method: str, handler: Handler, concurrency: Optional[int] = None):
+        self._requestRoutes[method] = _Route(handler, concurrency)
+
+    def on_notification(
+        self, method: str, handler: Handler, concurrency: Optional[int] = None
+    ):
+        self._notificationRoutes[method] = _Route(handler, concurrency)
+
+    def on_any_notification(self, handler: Handler):
+        self._defaultNotificationHandler = handler
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def expect(self, id) -> Future:
+        if self._closed:
+            raise ProtooClosedError("protoo websocket closed")
+        fut = self._loop.create_future()
+        self._pending[id] = fut
+        return fut
+
+    def discard(self, id):
+        self._pending.pop(id, None)
+
+    async def send(self, message: dict):
+        if self._onMessage is not None:
+            self._onMessage("out", message)
+        await self._websocket.send(json.dumps(message))
+
+    # websocket receive task
+    async def run(self):
+        try:
+            async for raw in self._websocket:
+                try:
+                    message = json.loads(raw)
+                except ValueError as e:
+                    # One malformed frame must not fail the pending requests
+                    print(f"Skipping invalid protoo frame: {e}")
+                    continue
+                if self._onMessage is not None:
+                    self._onMessage("in", message)
+                self._dispatch(message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._closed = True
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(ProtooClosedError("protoo websocket closed"))
+            self._pending.clear()
+
+    def _dispatch(self, message: dict):
+        if message.get("response"):
+            fut = self._pending.get(message.get("id"))
+            if fut is not None and not fut.done():
+                fut.set_result(message)
+        elif message.get("request"):
+            self._spawn(self._handle_request(message))
+        elif message.get("notification"):
+            self._spawn(self._handle_notification(message))
+
+    def _spawn(self, coro):
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle_request(self, message: dict):
+        route = self._requestRoutes.get(message.get("method"))
+        try:
+            if route is None:
+                response = {
+                    "response": True,
+                    "id": message["id"],
+                    "ok": False,
+                    "errorCode": 404,
+                    "errorReason": f"unknown method {message.get('method')}",
+                }
+            else:
+                data = await self._run_route(route, message)
+                response = {
+                    "response": True,
+                    "id": message["id"],
+                    "ok": True,
+                    "data": data or {},
+                }
+        except Exception as e:
+            print(f"Error handling request {message.get('method')}: {e}")
+            response = {
+                "response": True,
+                "id": message["id"],
+                "ok": False,
+                "errorCode": 500,
+                "errorReason": str(e),
+            }
+        try:
+            await self.send(response)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _handle_notification(self, message: dict):
+        route = self._notificationRoutes.get(message.get("method"))
+        try:
+            if route is not None:
+                await self._run_route(route, message)
+            elif self._defaultNotificationHandler is not None:
+                await self._defaultNotificationHandler(message)
+        except Exception as e:
+            print(f"Error handling notification {message.get('method')}: {e}")
+
+    async def _run_route(self, route: _Route, message: dict):
+        if route.semaphore is None:
+            return await route.handler(message.get("data", {}))
+        async with route.semaphore:
+            return await route.handler(message.get("data", {}))
+
+    async def close(self):
+        # A handler may be the one closing the session (e.g. on peerLeft)
+        tasks = [task for task in self._tasks if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class ProtooClient:
+    """
+    Request/response protoo client on top of a Dispatcher.
+
+    Request ids are monotonic per connection and every pending future is
+    dropped as soon as its request settles, whether it was answered, timed
+    out or cancelled, so the pending table only ever holds in-flight
+    requests. Any number of requests may be in flight at once; an optional
+    ``max_in_flight`` bounds that pipeline. ``on_request_done`` is called with
+    (method, seconds, error or None) as every request settles, and
+    ``on_message`` with every message of every connection (e.g.
+    ``SignalingTrace.record``).
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        loop=None,
+        timeout: float = 15,
+        max_in_flight: Optional[int] = None,
+        on_request_done: Optional[RequestDoneCallback] = None,
+        on_message: Optional[MessageCallback] = None,
+    ):
+        self._uri = uri
+        self._onRequestDone = on_request_done
+        self._onMessage = on_message
+        self._loop = loop
+        self._timeout = timeout
+        self._requestIds = count(1)
+        self._inFlight = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self._websocket = None
+        self._dispatcher: Optional[Dispatcher] = None
+        # Handlers are kept here so they can be registered before connect()
+        # and carried over to every new connection
+        self._requestHandlers: Dict[str, tuple] = {}
+        self._notificationHandlers: Dict[str, tuple] = {}
+        self._defaultNotificationHandler: Optional[Handler] = None
+
+    @property
+    def dispatcher(self) -> Dispatcher:
+        if self._dispatcher is None:
+            raise ProtooClosedError("protoo client not connected")
+        return self._dispatcher
+
+    @property
+    def closed(self) -> bool:
+        return self._dispatcher is None or self._dispatcher.closed
+
+    async def connect(self):
+        self._websocket = await websockets.connect(self._uri, subprotocols=["protoo"])
+        if self._onMessage is not None:
+            self._onMessage("open", {"uri": self._uri})
+        self._dispatcher = Dispatcher(self._websocket, loop=self._loop, on_message=self._onMessage)
+        for method, (handler, concurrency) in self._requestHandlers.items():
+            self._dispatcher.on_request(method, handler, concurrency=concurrency)
+        for method, (handler, concurrency) in self._notificationHandlers.items():
+            self._dispatcher.on_notification(method, handler, concurrency=concurrency)
+        if self._defaultNotificationHandler is not None:
+            self._dispatcher.on_any_notification(self._defaultNotificationHandler)
+
+    async def run(self):
+        await self.dispatcher.run()
+
+    def on_request(self, method: str, handler: Handler, concurrency: Optional[int] = None):
+        self._requestHandlers[method] = (handler, concurrency)
+        if self._dispatcher is not None:
+            self._dispatcher.on_request(method, handler, concurrency=concurrency)
+
+    def on_notification(
+        self, method: str, handler: Handler, concurrency: Optional[int] = None
+    ):
+        self._notificationHandlers[method] = (handler, concurrency)
+        if self._dispatcher is not None:
+            self._dispatcher.on_notification(method, handler, concurrency=concurrency)
+
+    def on_any_notification(self, handler: Handler):
+        self._defaultNotificationHandler = handler
+        if self._dispatcher is not None:
+            self._dispatcher.on_any_notification(handler)
+
+    async def request(
+        self, method: str, data: Optional[dict] = None, timeout: Optional[float] = None
+    ) -> dict:
+        if self._onRequestDone is None:
+            return await self._limited_request(method, data, timeout)
+        start = time.monotonic()
+        error = None
+        try:
+            return await self._limited_request(method, data, timeout)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._onRequestDone(method, time.monotonic() - start, error)
+
+    async def _limited_request(
+        self, method: str, data: Optional[dict], timeout: Optional[float]
+    ) -> dict:
+        if self._inFlight is None:
+            return await self._request(method, data, timeout)
+        async with self._inFlight:
+            return await self._request(method, data, timeout)
+
+    async def _request(self, method: str, data: Optional[dict], timeout: Optional[float]):
+        timeout = self._timeout if timeout is None else timeout
+        dispatcher = self.dispatcher
+        id = next(self._requestIds)
+        fut = dispatcher.expect(id)
+        try:
+            await dispatcher.send(
+                {"request": True, "id": id, "method": method, "data": data or {}}
+            )
+            response = await asyncio.wait_for(fut, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise ProtooTimeoutError(method, timeout) from None
+        except websockets.ConnectionClosed as e:
+            raise ProtooClosedError(f"protoo websocket closed: {e}") from None
+        finally:
+            dispatcher.discard(id)
+
+        if not response.get("ok"):
+            raise ProtooRequestError(
+                method, response.get("errorCode"), response.get("errorReason")
+            )
+        return response.get("data") or {}
+
+    async def notify(self, method: str, data: Optional[dict] = None):
+        await self.dispatcher.send(
+            {"notification": True, "method": method, "data": data or {}}
+        )
+
+    async def close(self):
+        if self._websocket is not None:
+            await self._websocket.close()
+        if self._dispatcher is not None:
+            await self._dispatcher.close()
@@ -0,0 +1,221 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from aiortc.mediastreams import MediaStreamError
+
+from recording import KEYFRAME_TESTS, REMUX_CODECS, tap_encoded_frames
+
+# Upper bounds (ms) of the packet interarrival gap histogram buckets; the last
+# bucket counts everything above
+GAP_BUCKETS_MS = (5, 10, 20, 40, 80, 160, 320, 640)
+
+
+class ReceiveCounters:
+    """
+    Fixed-size receive statistics of one consumer, updated per RTP packet
+    and per reassembled frame.
+    """
+
+    __slots__ = (
+        "kind",
+        "codec",
+        "ssrc",
+        "packets",
+        "bytes",
+        "retransmitted",
+        "reordered",
+        "frames",
+        "keyframes",
+        "jitter",
+        "max_gap_ms",
+        "gaps",
+        "_clock",
+        "_keyframe",
+        "_base_seq",
+        "_max_seq",
+        "_cycles",
+        "_transit",
+        "_last_arrival",
+        "_first_arrival",
+    )
+
+    def __init__(self, kind: str, codec: str, clock: int, ssrc: Optional[int]):
+        self.kind = kind
+        self.codec = codec
+        self.ssrc = ssrc
+        self.packets = 0
+        self.bytes = 0
+        self.retransmitted = 0
+        self.reordered = 0
+        self.frames = 0
+        self.keyframes = 0
+        # RFC 3550 interarrival jitter, in timestamp units
+        self.jitter = 0.0
+        self.max_gap_ms = 0
+        self.gaps = [0] * (len(GAP_BUCKETS_MS) + 1)
+        self._clock = clock
+        self._keyframe = KEYFRAME_TESTS.get(codec)
+        self._base_seq: Optional[int] = None
+        self._max_seq = 0
+        self._cycles = 0
+        self._transit: Optional[float] = None
+        self._last_arrival: Optional[int] = None
+        self._first_arrival: Optional[int] = None
+
+    def on_packet(self, packet, arrival_ms: int):
+        if self.ssrc is not None and packet.ssrc != self.ssrc:
+            # RTX and other streams routed to the same receiver
+            self.retransmitted += 1
+            return
+        self.packets += 1
+        self.bytes += len(packet.payload)
+
+        seq = packet.sequence_number
+        if self._base_seq is None:
+            self._base_seq = self._max_seq = seq
+            self._first_arrival = arrival_ms
+        else:
+            delta = (seq - self._max_seq) & 0xFFFF
+            if 0 < delta < 0x8000:
+                if seq < self._max_seq:
+                    self._cycles += 0x10000
+                self._max_seq = seq
+            else:
+                self.reordered += 1
+
+        transit = arrival_ms * self._clock / 1000 - packet.timestamp
+        if self._transit is not None:
+            self.jitter += (abs(transit - self._transit) - self.jitter) / 16
+        self._transit = transit
+
+        if self._last_arrival is not None:
+            gap = arrival_ms - self._last_arrival
+            if gap > self.max_gap_ms:
+                self.max_gap_ms = gap
+            bucket = 0
+            while bucket < len(GAP_BUCKETS_MS) and gap > GAP_BUCKETS_MS[bucket]:
+                bucket += 1
+            self.gaps[bucket] += 1
+        self._last_arrival = arrival_ms
+
+    def on_frame(self, data: bytes, timestamp: int):
+        self.frames += 1
+        if self._keyframe is not None and self._keyframe(data):
+            self.keyframes += 1
+
+    @property
+    def expected(self) -> int:
+        if self._base_seq is None:
+            return 0
+        return self._cycles + self._max_seq - self._base_seq + 1
+
+    def as_dict(self) -> dict:
+        seconds = (
+            (self._last_arrival - self._first_arrival) / 1000
+            if self._first_arrival is not None
+            else 0
+        )
+        return {
+            "kind": self.kind,
+            "codec": self.codec,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "lost": max(0, self.expected - self.packets),
+            "retransmitted": self.retransmitted,
+            "reordered": self.reordered,
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "bitrate_kbps": self.bytes * 8 / seconds / 1000 if seconds else 0,
+            "jitter_ms": self.jitter / self._clock * 1000,
+            "max_gap_ms": self.max_gap_ms,
+            "gaps": dict(
+                zip([f"<={limit}ms" for limit in GAP_BUCKETS_MS] + ["more"], self.gaps)
+            ),
+        }
+
+
+class ReceiveSink:
+    """
+    Stands in for MediaBlackhole when received media only needs measuring.
+
+    ``addConsumer`` counts the consumer's RTP packets as the transport hands
+    them to its RTCRtpReceiver, and its frames once the jitter buffer has
+    reassembled them, without decoding anything. NACK, PLI and RTCP receiver
+    reports still work as usual. Tracks added with ``addTrack``, or consumers
+    whose receiver is unknown, are drained like MediaBlackhole does, which
+    decodes, and only count frames.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, ReceiveCounters] = {}
+        self._pending: Dict[ReceiveCounters, object] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def addTrack(self, track):
+        counters = self._counters[track.id] = ReceiveCounters(track.kind, "decoded", 1, None)
+        self._pending[counters] = track
+
+    def addConsumer(self, consumer, peerId: Optional[str] = None, receiver=None):
+        receiver = receiver or consumer.rtpReceiver
+        if receiver is None:
+            self.addTrack(consumer.track)
+            return
+        codec = consumer.rtpParameters.codecs[0]
+        encodings = consumer.rtpParameters.encodings
+        counters = self._counters[consumer.id] = ReceiveCounters(
+            consumer.kind,
+            REMUX_CODECS.get(codec.mimeType.lower(), codec.mimeType.lower()),
+            codec.clockRate,
+            encodings[0].ssrc if encodings else None,
+        )
+
+        handle = receiver._handle_rtp_packet
+
+        def on_rtp_packet(packet, arrival_time_ms):
+            counters.on_packet(packet, arrival_time_ms)
+            return handle(packet, arrival_time_ms=arrival_time_ms)
+
+        receiver._handle_rtp_packet = on_rtp_packet
+        tap_encoded_frames(receiver, counters.on_frame)
+
+    async def start(self):
+        for counters, track in self._pending.items():
+            self._tasks.append(asyncio.ensure_future(self._drain(counters, track)))
+        self._pending.clear()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _drain(self, counters: ReceiveCounters, track):
+        while True:
+            try:
+                await track.recv()
+            except MediaStreamError:
+                return
+            counters.frames += 1
+
+    def stats(self) -> dict:
+        return {name: counters.as_dict() for name, counters in self._counters.items()}
+
+    def summary(self) -> dict:
+        """Totals over every consumer, per kind."""
+        totals: Dict[str, dict] = {}
+        for counters in self._counters.values():
+            total = totals.setdefault(
+                counters.kind,
+                {"consumers": 0, "packets": 0, "bytes": 0, "lost": 0, "frames": 0, "keyframes": 0, "max_jitter_ms": 0.0},
+            )
+            total["consumers"] += 1
+            total["packets"] += counters.packets
+            total["bytes"] += counters.bytes
+            total["lost"] += max(0, counters.expected - counters.packets)
+            total["frames"] += counters.frames
+            total["keyframes"] += counters.keyframes
+            if counters._clock > 1:
+                total["max_jitter_ms"] = max(
+                    total["max_jitter_ms"], counters.jitter / counters._clock * 1000
+                )
+        return totals
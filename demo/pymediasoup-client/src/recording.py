@@ -0,0 +1,395 @@
+import os
+import time
+import queue
+import struct
+import asyncio
+import fractions
+import threading
+from typing import Dict, List, Optional
+
+import av
+from aiortc.mediastreams import MediaStreamError
+
+# Off-loop recording of received media: frames are handed to a writer thread
+# through a bounded queue and written as rolling, time-based segments, one
+# series of files per consumer or per peer. VP8, H.264 and Opus are written
+# as received, without decoding them; other codecs are decoded by aiortc and
+# re-encoded on the writer thread.
+
+# Received codecs written without re-encoding: mimeType -> codec name
+REMUX_CODECS = {
+    "video/vp8": "vp8",
+    "video/h264": "h264",
+    "audio/opus": "opus",
+}
+# Encoders used for decoded frames
+ENCODERS = {"video": "libvpx", "audio": "libopus"}
+
+# Opus identification header for 48 kHz stereo, required by WebM
+OPUS_HEAD = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+
+
+def _vp8_keyframe(data: bytes) -> bool:
+    return len(data) > 0 and data[0] & 1 == 0
+
+
+def _h264_keyframe(data: bytes) -> bool:
+    # aiortc reassembles H.264 frames as Annex B; look for an SPS or IDR NAL
+    for nal in data.split(b"\x00\x00\x01")[1:]:
+        if nal and nal[0] & 0x1F in (5, 7):
+            return True
+    return False
+
+
+KEYFRAME_TESTS = {"vp8": _vp8_keyframe, "h264": _h264_keyframe}
+
+
+class EncodedTap:
+    """
+    Replaces an aiortc RTCRtpReceiver's decoder queue. Complete encoded
+    frames go to the recorder instead of the decoder thread, which only gets
+    the stop sentinel, so nothing is decoded.
+    """
+
+    def __init__(self, decoder_queue: queue.Queue, on_frame):
+        self._decoder_queue = decoder_queue
+        self._on_frame = on_frame
+
+    # The decoder thread may start after the tap is installed
+    def get(self):
+        return self._decoder_queue.get()
+
+    def put(self, item):
+        if item is None:
+            self._decoder_queue.put(None)
+        else:
+            codec, encoded_frame = item
+            self._on_frame(encoded_frame.data, encoded_frame.timestamp)
+
+
+def tap_encoded_frames(receiver, on_frame):
+    """
+    Hands the complete encoded frames of an aiortc RTCRtpReceiver to
+    ``on_frame(data, timestamp)`` instead of its decoder.
+    """
+    receiver._RTCRtpReceiver__decoder_queue = EncodedTap(
+        receiver._RTCRtpReceiver__decoder_queue, on_frame
+    )
+
+
+class _Stream:
+    def __init__(self, name: str, group: "_Group", kind: str, codec: str, remux: bool):
+        self.name = name
+        self.group = group
+        self.kind = kind
+        self.codec = codec
+        self.remux = remux
+        self.keyframe = KEYFRAME_TESTS.get(codec) if remux else None
+        # Encoded video is only usable from a keyframe on: wait for one at the
+        # start and after every dropped frame
+        self.waiting = self.keyframe is not None
+        # Asks the sender for a keyframe, when the stream has a receiver
+        self.request_keyframe = None
+        self.requested = False
+        self.frames = 0
+        self.bytes = 0
+        # Frames lost to a full queue, and frames skipped while waiting for
+        # a keyframe
+        self.dropped = 0
+        self.skipped = 0
+        # Size of decoded video, known from its first frame
+        self.size: Optional[tuple] = None
+        # Writer thread state, reset for every segment; no output means the
+        # stream is not part of the current segment yet
+        self.output = None
+        self.offset: Optional[int] = None
+        self.last_pts: Optional[int] = None
+
+
+class _Group:
+    """A series of segment files holding one or more streams."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.streams: List[_Stream] = []
+        self.container = None
+        self.opened_at = 0.0
+        self.index = 0
+        # Set when a stream joins, so the next segment includes it
+        self.changed = False
+
+
+class SegmentedRecorder:
+    """
+    Records consumer tracks like aiortc's MediaRecorder, but writes on a
+    dedicated thread and rolls over to a new file every ``segment_seconds``.
+
+    Frames are passed through a queue of at most ``max_queue`` entries; when
+    the writer falls behind, new frames are dropped and counted rather than
+    blocking the event loop, and encoded video skips ahead to the next
+    keyframe. ``per`` is "consumer" for one series of files per consumer or
+    "peer" to mux all consumers of a peer together. Segments of a group with
+    video start on a keyframe.
+
+    ``addConsumer`` takes the encoded frames straight from the consumer's
+    RTCRtpReceiver when its codec is in REMUX_CODECS (and ``remux`` is set);
+    ``addTrack`` and other codecs record the decoded track.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_seconds: float = 60,
+        per: str = "consumer",
+        max_queue: int = 512,
+        remux: bool = True,
+    ):
+        if per not in ("consumer", "peer"):
+            raise ValueError(f"per must be 'consumer' or 'peer', not {per!r}")
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.per = per
+        self.remux = remux
+        self.segments: List[str] = []
+
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        # Guards group membership, changed from the event loop
+        self._lock = threading.Lock()
+        self._groups: Dict[str, _Group] = {}
+        self._streams: List[_Stream] = []
+        # Decoded tracks not yet being read, and the tasks reading them
+        self._pending: Dict[_Stream, object] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _add_stream(self, name: str, group: str, kind: str, codec: str, remux: bool) -> _Stream:
+        with self._lock:
+            if group not in self._groups:
+                self._groups[group] = _Group(group)
+            stream = _Stream(name, self._groups[group], kind, codec, remux)
+            stream.group.streams.append(stream)
+            stream.group.changed = True
+            self._streams.append(stream)
+        return stream
+
+    def addTrack(self, track):
+        stream = self._add_stream(track.id, track.id, track.kind, ENCODERS[track.kind], False)
+        self._pending[stream] = track
+
+    def addConsumer(self, consumer, peerId: Optional[str] = None, receiver=None):
+        group = peerId if self.per == "peer" and peerId else consumer.id
+        mimeType = consumer.rtpParameters.codecs[0].mimeType.lower()
+        receiver = receiver or consumer.rtpReceiver
+        if self.remux and mimeType in REMUX_CODECS and receiver is not None:
+            stream = self._add_stream(
+                consumer.id, group, consumer.kind, REMUX_CODECS[mimeType], True
+            )
+            encodings = consumer.rtpParameters.encodings
+            if stream.keyframe is not None and encodings:
+                stream.request_keyframe = lambda: asyncio.ensure_future(
+                    receiver._send_rtcp_pli(encodings[0].ssrc)
+                )
+            tap_encoded_frames(
+                receiver, lambda data, timestamp: self._enqueue(stream, (data, timestamp))
+            )
+        else:
+            stream = self._add_stream(
+                consumer.id, group, consumer.kind, ENCODERS[consumer.kind], False
+            )
+            self._pending[stream] = consumer.track
+
+    async def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="segmented-recorder", daemon=True
+            )
+            self._thread.start()
+        # Like MediaRecorder, tracks added after start() need another call
+        for stream, track in self._pending.items():
+            self._tasks.append(asyncio.ensure_future(self._read(stream, track)))
+        self._pending.clear()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._thread is not None:
+            # Writes what is still queued, then closes the open segments
+            await asyncio.get_running_loop().run_in_executor(None, self._finish)
+
+    def _finish(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "streams": {
+                stream.name: {
+                    "kind": stream.kind,
+                    "codec": stream.codec,
+                    "remux": stream.remux,
+                    "frames": stream.frames,
+                    "bytes": stream.bytes,
+                    "dropped": stream.dropped,
+                    "skipped": stream.skipped,
+                }
+                for stream in self._streams
+            },
+            "segments": len(self.segments),
+            "queued": self._queue.qsize(),
+        }
+
+    async def _read(self, stream: _Stream, track):
+        while True:
+            try:
+                frame = await track.recv()
+            except MediaStreamError:
+                return
+            self._enqueue(stream, frame)
+
+    # Runs on the event loop, for every received frame
+    def _enqueue(self, stream: _Stream, payload):
+        if stream.waiting:
+            if not stream.keyframe(payload[0]):
+                stream.skipped += 1
+                # Once per wait, so the sender is not flooded with PLIs
+                if stream.request_keyframe is not None and not stream.requested:
+                    stream.requested = True
+                    stream.request_keyframe()
+                return
+            stream.waiting = stream.requested = False
+        try:
+            self._queue.put_nowait((stream, time.monotonic(), payload))
+        except queue.Full:
+            stream.dropped += 1
+            stream.waiting = stream.keyframe is not None
+
+    # Writer thread
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                stream, arrival, payload = item
+                try:
+                    self._write(stream, arrival, payload)
+                except Exception as e:
+                    print(f"Error recording {stream.name}: {e}")
+        finally:
+            for group in self._groups.values():
+                self._close_segment(group)
+
+    def _write(self, stream: _Stream, arrival: float, payload):
+        group = stream.group
+        if stream.kind == "video" and not stream.remux and stream.size is None:
+            stream.size = (payload.width, payload.height)
+            group.changed = True
+        if group.container is None:
+            self._open_segment(group, arrival)
+        elif self._can_cut(group, stream, payload) and (
+            group.changed or arrival - group.opened_at >= self.segment_seconds
+        ):
+            self._close_segment(group)
+            self._open_segment(group, arrival)
+        if stream.output is None:
+            # Joined after the segment started; it is in the next one
+            stream.dropped += 1
+            return
+
+        if stream.remux:
+            data, timestamp = payload
+            clock = 90000 if stream.kind == "video" else 48000
+        else:
+            data = None
+            timestamp = payload.pts
+            clock = int(1 / payload.time_base)
+
+        # Place the stream's first frame in the segment by its arrival time,
+        # then follow its own timestamps
+        if stream.offset is None:
+            stream.offset = timestamp - int((arrival - group.opened_at) * clock)
+        pts = timestamp - stream.offset
+        if stream.last_pts is not None and pts <= stream.last_pts:
+            pts = stream.last_pts + 1
+        stream.last_pts = pts
+        time_base = fractions.Fraction(1, clock)
+
+        if stream.remux:
+            packet = av.Packet(data)
+            packet.stream = stream.output
+            packet.pts = packet.dts = pts
+            packet.time_base = time_base
+            group.container.mux(packet)
+            stream.bytes += len(data)
+        else:
+            payload.pts = pts
+            payload.time_base = time_base
+            for packet in stream.output.encode(payload):
+                stream.bytes += packet.size
+                group.container.mux(packet)
+        stream.frames += 1
+
+    def _can_cut(self, group: _Group, stream: _Stream, payload) -> bool:
+        # With video in the file, new segments start on a video keyframe;
+        # re-encoded video starts with one anyway
+        if any(member.kind == "video" for member in self._members(group)):
+            if stream.kind != "video":
+                return False
+            return stream.keyframe is None or stream.keyframe(payload[0])
+        return True
+
+    def _members(self, group: _Group) -> List[_Stream]:
+        with self._lock:
+            return list(group.streams)
+
+    def _open_segment(self, group: _Group, arrival: float):
+        with self._lock:
+            group.changed = False
+            # Decoded video can only be encoded once its size is known
+            streams = [
+                stream
+                for stream in group.streams
+                if stream.remux or stream.kind == "audio" or stream.size is not None
+            ]
+        extension = "ts" if any(stream.codec == "h264" for stream in streams) else "webm"
+        path = os.path.join(self.directory, f"{group.name}-{group.index:05d}.{extension}")
+        group.container = av.open(path, "w")
+        group.opened_at = arrival
+        group.index += 1
+        for stream in streams:
+            if stream.remux:
+                output = group.container.add_stream(stream.codec)
+                if stream.codec == "opus":
+                    output.rate = 48000
+                    output.codec_context.extradata = OPUS_HEAD
+            elif stream.kind == "video":
+                output = group.container.add_stream(stream.codec, rate=30)
+                output.width, output.height = stream.size
+                output.pix_fmt = "yuv420p"
+                output.codec_context.time_base = fractions.Fraction(1, 90000)
+            else:
+                output = group.container.add_stream(stream.codec, rate=48000)
+                output.layout = "stereo"
+            stream.output = output
+            stream.offset = None
+            stream.last_pts = None
+        self.segments.append(path)
+
+    def _close_segment(self, group: _Group):
+        if group.container is None:
+            return
+        for stream in self._members(group):
+            if not stream.remux and stream.output is not None:
+                try:
+                    for packet in stream.output.encode(None):
+                        group.container.mux(packet)
+                except Exception as e:
+                    print(f"Error flushing {stream.name}: {e}")
+            stream.output = None
+        group.container.close()
+        group.container = None
@@ -0,0 +1,233 @@
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, List, Optional
+
+import websockets
+
+from signaling_trace import read_trace
+
+# Replays the server side of a recorded signaling trace (see
+# signaling_trace.py) as a local protoo server, so a client can be benchmarked
+# and regression-tested against a real exchange without the mediasoup server.
+# Like the stand-in server, it routes no media.
+#
+# Each websocket that connects plays the next connection of the trace. The
+# messages the server sent are sent again in their recorded order, each one
+# once the live client sent the message it followed in the recording: a
+# response after its request, a newConsumer after the join that caused it.
+# Recorded gaps between that client message and the server's are kept,
+# divided by ``speed``; 0 sends them as soon as the client got there.
+
+
+def _match_score(recorded: dict, live: dict) -> int:
+    # Top-level fields of the request data that are the same in both
+    recorded, live = recorded.get("data") or {}, live.get("data") or {}
+    return sum(1 for key, value in live.items() if recorded.get(key) == value)
+
+
+class _Connection:
+    """The replay of one recorded connection over one live websocket."""
+
+    def __init__(self, server: "ReplayServer", websocket, number: int, events: List[dict]):
+        self.server = server
+        self.websocket = websocket
+        self.number = number
+        self.opened = time.monotonic()
+        self._events = events
+        # Recorded client messages, by index into events, and when the live
+        # client sent the message they were matched to
+        self._arrived: Dict[int, float] = {}
+        self._arrival = asyncio.Event()
+        self._unmatched = [
+            index for index, event in enumerate(events) if event["d"] == "out"
+        ]
+        # Recorded client request id -> live client request id
+        self._ids: Dict[int, int] = {}
+
+    async def play(self):
+        anchor = None
+        # Recorded client request id -> index of the request
+        requests: Dict[int, int] = {}
+        emittedAt = self.opened
+        for index, event in enumerate(self._events):
+            message = event["m"]
+            if event["d"] == "out":
+                anchor = index
+                if message.get("request"):
+                    requests[message["id"]] = index
+                continue
+            if event["d"] != "in":
+                continue
+            # A response follows its request, anything else the last client
+            # message before it
+            after = requests.get(message["id"]) if message.get("response") else anchor
+            if after is None:
+                since, recordedSince = self.opened, self._events[0]["t"]
+            else:
+                while after not in self._arrived:
+                    self._arrival.clear()
+                    await self._arrival.wait()
+                since, recordedSince = self._arrived[after], self._events[after]["t"]
+            # The recorded gap later, never before the previous server message
+            if self.server.speed:
+                dueAt = max(since + (event["t"] - recordedSince) / self.server.speed, emittedAt)
+                delay = dueAt - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if message.get("response"):
+                message = {**message, "id": self._ids[message["id"]]}
+            await self.websocket.send(json.dumps(message))
+            self.server.sent += 1
+            emittedAt = time.monotonic()
+
+    async def on_message(self, message: dict):
+        index = self._match(message)
+        if index is None:
+            self.server.divergences.append(
+                f"unexpected {self._describe(message)} on connection {self.number}"
+            )
+            if message.get("request"):
+                await self._reject(message)
+            return
+        self._unmatched.remove(index)
+        recorded = self._events[index]["m"]
+        if message.get("request"):
+            self._ids[recorded["id"]] = message["id"]
+        self._arrived[index] = time.monotonic()
+        self._arrival.set()
+
+    def _match(self, message: dict) -> Optional[int]:
+        candidates = []
+        for index in self._unmatched:
+            recorded = self._events[index]["m"]
+            if message.get("response"):
+                # Answers to the server's own requests, whose ids are replayed
+                if recorded.get("response") and recorded.get("id") == message.get("id"):
+                    return index
+            elif recorded.get("method") == message.get("method") and bool(
+                recorded.get("request")
+            ) == bool(message.get("request")):
+                candidates.append(index)
+        if not candidates:
+            return None
+        # Requests of one method may be sent in another order than recorded
+        # (e.g. the two createWebRtcTransport); take the closest one
+        return max(
+            candidates,
+            key=lambda index: (_match_score(self._events[index]["m"], message), -index),
+        )
+
+    @staticmethod
+    def _describe(message: dict) -> str:
+        if message.get("response"):
+            return f"response {message.get('id')}"
+        kind = "request" if message.get("request") else "notification"
+        return f"{kind} {message.get('method')}"
+
+    async def _reject(self, message: dict):
+        try:
+            await self.websocket.send(
+                json.dumps(
+                    {
+                        "response": True,
+                        "id": message["id"],
+                        "ok": False,
+                        "errorCode": 500,
+                        "errorReason": f"{message.get('method')} is not in the trace",
+                    }
+                )
+            )
+        except websockets.ConnectionClosed:
+            pass
+
+    @property
+    def missing(self) -> List[str]:
+        # Recorded client messages the live client did not send
+        return [self._describe(self._events[index]["m"]) for index in self._unmatched]
+
+
+class ReplayServer:
+    def __init__(
+        self,
+        trace: List[List[dict]],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        speed: float = 1.0,
+    ):
+        self.host = host
+        self.port = port
+        # Per connection, as returned by read_trace()
+        self.trace = trace
+        # 1 replays the recorded timing, 10 ten times faster, 0 without delays
+        self.speed = speed
+
+        self.connections = 0
+        # Server messages sent
+        self.sent = 0
+        # Client messages that had no counterpart in the trace, and recorded
+        # client messages that were never sent
+        self.divergences: List[str] = []
+        self._server = None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ReplayServer":
+        return cls(read_trace(path), **kwargs)
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/"
+
+    async def start(self):
+        self._server = await websockets.serve(
+            self._serve, self.host, self.port, subprotocols=["protoo"]
+        )
+        self.port = list(self._server.sockets)[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _serve(self, websocket, path=None):
+        number = self.connections
+        self.connections += 1
+        if number >= len(self.trace):
+            self.divergences.append(f"connection {number} is not in the trace")
+            await websocket.close()
+            return
+        connection = _Connection(self, websocket, number, self.trace[number])
+        player = asyncio.ensure_future(connection.play())
+        try:
+            async for raw in websocket:
+                await connection.on_message(json.loads(raw))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            player.cancel()
+            await asyncio.gather(player, return_exceptions=True)
+            self.divergences.extend(
+                f"missing {description} on connection {number}"
+                for description in connection.missing
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the server side of a signaling trace")
+    parser.add_argument("trace", help="Trace file written with --trace or SIGNALING_TRACE_DIR")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4443)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 for the recorded timing, higher to compress it, 0 without delays")
+    args = parser.parse_args()
+
+    async def main():
+        server = ReplayServer.from_file(args.trace, host=args.host, port=args.port, speed=args.speed)
+        await server.start()
+        print(f"Replaying {len(server.trace)} connection(s) of {args.trace} on {server.url}")
+        await asyncio.Future()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,95 @@
+# Router RTP capabilities with the codecs sessions send (Opus, VP8 and
+# H.264), as a mediasoup router reports them. The stand-in server answers getRouterRtpCapabilities with them and
+# the warm-up loads its throwaway Device with them, so neither needs a server.
+ROUTER_RTP_CAPABILITIES = {
+    "codecs": [
+        {
+            "kind": "audio",
+            "mimeType": "audio/opus",
+            "clockRate": 48000,
+            "channels": 2,
+            "preferredPayloadType": 100,
+            "parameters": {},
+            "rtcpFeedback": [{"type": "nack"}, {"type": "transport-cc"}],
+        },
+        {
+            "kind": "video",
+            "mimeType": "video/VP8",
+            "clockRate": 90000,
+            "preferredPayloadType": 101,
+            "parameters": {"x-google-start-bitrate": 1000},
+            "rtcpFeedback": [
+                {"type": "nack"},
+                {"type": "nack", "parameter": "pli"},
+                {"type": "ccm", "parameter": "fir"},
+                {"type": "goog-remb"},
+                {"type": "transport-cc"},
+            ],
+        },
+        {
+            "kind": "video",
+            "mimeType": "video/rtx",
+            "clockRate": 90000,
+            "preferredPayloadType": 102,
+            "parameters": {"apt": 101},
+            "rtcpFeedback": [],
+        },
+        {
+            "kind": "video",
+            "mimeType": "video/H264",
+            "clockRate": 90000,
+            "preferredPayloadType": 103,
+            "parameters": {
+                "packetization-mode": 1,
+                "profile-level-id": "42e01f",
+                "level-asymmetry-allowed": 1,
+                "x-google-start-bitrate": 1000,
+            },
+            "rtcpFeedback": [
+                {"type": "nack"},
+                {"type": "nack", "parameter": "pli"},
+                {"type": "ccm", "parameter": "fir"},
+                {"type": "goog-remb"},
+                {"type": "transport-cc"},
+            ],
+        },
+        {
+            "kind": "video",
+            "mimeType": "video/rtx",
+            "clockRate": 90000,
+            "preferredPayloadType": 104,
+            "parameters": {"apt": 103},
+            "rtcpFeedback": [],
+        },
+    ],
+    "headerExtensions": [
+        {
+            "kind": "audio",
+            "uri": "urn:ietf:params:rtp-hdrext:sdes:mid",
+            "preferredId": 1,
+            "preferredEncrypt": False,
+            "direction": "sendrecv",
+        },
+        {
+            "kind": "video",
+            "uri": "urn:ietf:params:rtp-hdrext:sdes:mid",
+            "preferredId": 1,
+            "preferredEncrypt": False,
+            "direction": "sendrecv",
+        },
+        {
+            "kind": "audio",
+            "uri": "http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time",
+            "preferredId": 4,
+            "preferredEncrypt": False,
+            "direction": "sendrecv",
+        },
+        {
+            "kind": "video",
+            "uri": "http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time",
+            "preferredId": 4,
+            "preferredEncrypt": False,
+            "direction": "sendrecv",
+        },
+    ],
+}
@@ -0,0 +1,221 @@
+import os
+import time
+import asyncio
+import functools
+from mediasoup import Demo
+from aiortc.contrib.media import MediaPlayer, MediaBlackhole
+from media_cache import LoopingPlayer, MediaCache, MediaSourceManager
+from media_info import MetadataService
+from passthrough import EncodedSourceManager
+from device_cache import RouterCapabilitiesCache
+from notifier import WebhookNotifier
+from simulcast import parse_layers
+from datachannel import DataLoad
+from receive_sink import ReceiveSink
+from warm_pool import WarmPool
+import metrics
+
+# Environment variable for default video source URL
+DEFAULT_VIDEO_SRC_URL = os.getenv('DEFAULT_VIDEO_SRC_URL', 'https://sample-videos.com/video321/mp4/720/big_buck_bunny_720p_1mb.mp4')
+# Local cache for downloaded media sources
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', '/tmp/pymediasoup-media-cache')
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', 1 << 30))
+# Decode each source once and relay its frames to every session
+SHARED_MEDIA_DECODE = os.getenv('SHARED_MEDIA_DECODE', '1') == '1'
+# Send the source without transcoding it per session; takes precedence over
+# SHARED_MEDIA_DECODE
+PASSTHROUGH_MEDIA = os.getenv('PASSTHROUGH_MEDIA', '0') == '1'
+# Where sources that need a one-off encode for passthrough are kept, and the
+# size past which the least recently used encodes are deleted
+ENCODED_MEDIA_DIR = os.getenv('ENCODED_MEDIA_DIR', '/tmp/pymediasoup-encoded-media')
+ENCODED_MEDIA_MAX_BYTES = int(os.getenv('ENCODED_MEDIA_MAX_BYTES', 1 << 30))
+# Reuse router RTP capabilities and a loaded Device per server for this many
+# seconds; 0 disables the cache
+ROUTER_CAPS_CACHE_TTL = float(os.getenv('ROUTER_CAPS_CACHE_TTL', 0))
+# Session length used when the source duration cannot be probed (seconds)
+FALLBACK_VIDEO_DURATION = float(os.getenv('FALLBACK_VIDEO_DURATION', 60))
+# Sessions leave as soon as the source ends, the other peer leaves or the
+# websocket closes. SESSION_LOOPS plays the source that many times over (the
+# players loop and the session leaves at the end of the last pass);
+# SESSION_MAX_DURATION caps the stay in the room (seconds), by default the
+# length of those passes plus a 5 s margin, or just their length for sessions
+# on a shared decode, which loops
+SESSION_LOOPS = max(1, int(os.getenv('SESSION_LOOPS', 1)))
+SESSION_MAX_DURATION = float(os.getenv('SESSION_MAX_DURATION', 0))
+# Seconds joining and producing may take before the session gives up
+SESSION_SETUP_TIMEOUT = float(os.getenv('SESSION_SETUP_TIMEOUT', 30))
+# success_url / failure_url delivery: concurrent requests, pending limit,
+# per-attempt timeout (seconds) and retries of failed attempts
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+WEBHOOK_MAX_QUEUE = int(os.getenv('WEBHOOK_MAX_QUEUE', 1000))
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', 5))
+WEBHOOK_RETRIES = int(os.getenv('WEBHOOK_RETRIES', 5))
+# What happens to received media: "measure" counts it without decoding,
+# "decode" decodes and discards it like a real client would
+RECEIVE_MODE = os.getenv('RECEIVE_MODE', 'measure')
+# Poll server and local media stats every this many seconds, keeping the last
+# STATS_SAMPLES per producer, consumer and transport; 0 disables polling
+STATS_INTERVAL = float(os.getenv('STATS_INTERVAL', 5))
+STATS_SAMPLES = int(os.getenv('STATS_SAMPLES', 120))
+# Send video as simulcast layers, "scale:maxBitrate,..." lowest first (e.g.
+# "4:150000,2:500000,1:1500000"); empty sends a single encoding
+SIMULCAST_LAYERS = parse_layers(os.getenv('SIMULCAST_LAYERS')) if os.getenv('SIMULCAST_LAYERS') else None
+# Lower the video bitrate, then resolution, when the uplink shows loss or delay
+ADAPTIVE_ENCODING = os.getenv('ADAPTIVE_ENCODING', '0') == '1'
+# Ask the server for lower consumer layers while the process is overloaded
+CONSUMER_LAYER_CONTROL = os.getenv('CONSUMER_LAYER_CONTROL', '0') == '1'
+# Reopen the websocket when it drops, or when ICE fails, and recover media
+# with restartIce or by joining again, up to RECONNECT_ATTEMPTS connection
+# attempts per outage
+RECONNECT = os.getenv('RECONNECT', '0') == '1'
+RECONNECT_ATTEMPTS = int(os.getenv('RECONNECT_ATTEMPTS', 5))
+# Send binary data channel messages of DATA_CHANNEL_SIZE bytes, at
+# DATA_CHANNEL_RATE per second (0 for as fast as the channel drains), and
+# measure the ones received; 0 disables. Lifetime (ms) or retransmits make the
+# channel partially reliable
+DATA_CHANNEL_SIZE = int(os.getenv('DATA_CHANNEL_SIZE', 0))
+DATA_CHANNEL_RATE = float(os.getenv('DATA_CHANNEL_RATE', 0))
+DATA_CHANNEL_ORDERED = os.getenv('DATA_CHANNEL_ORDERED', '1') == '1'
+DATA_CHANNEL_LIFETIME = int(os.getenv('DATA_CHANNEL_LIFETIME')) if os.getenv('DATA_CHANNEL_LIFETIME') else None
+DATA_CHANNEL_RETRANSMITS = int(os.getenv('DATA_CHANNEL_RETRANSMITS')) if os.getenv('DATA_CHANNEL_RETRANSMITS') else None
+DATA_LOAD = DataLoad(
+    size=DATA_CHANNEL_SIZE,
+    rate=DATA_CHANNEL_RATE,
+    ordered=DATA_CHANNEL_ORDERED,
+    maxPacketLifeTime=DATA_CHANNEL_LIFETIME,
+    maxRetransmits=DATA_CHANNEL_RETRANSMITS,
+) if DATA_CHANNEL_SIZE else None
+
+# Share pooled DTLS certificates between every peer connection of the process,
+# each one replaced after CERTIFICATE_LIFETIME seconds, and load devices with
+# native capabilities known in advance
+WARM_POOL = os.getenv('WARM_POOL', '0') == '1'
+CERTIFICATE_LIFETIME = float(os.getenv('CERTIFICATE_LIFETIME', 3600))
+CERTIFICATE_POOL_SIZE = int(os.getenv('CERTIFICATE_POOL_SIZE', 1))
+# Write every session's signaling messages to <dir>/<session id>.jsonl, for
+# replay.py; empty disables
+SIGNALING_TRACE_DIR = os.getenv('SIGNALING_TRACE_DIR', '')
+if SIGNALING_TRACE_DIR:
+    os.makedirs(SIGNALING_TRACE_DIR, exist_ok=True)
+
+media_cache = MediaCache(MEDIA_CACHE_DIR, max_bytes=MEDIA_CACHE_MAX_BYTES)
+# A session that starts while the source is playing joins it live, so the
+# shared decode loops rather than ending a late session early; each session
+# leaves once it was sent its own passes' worth of media
+media_sources = MediaSourceManager(media_cache, loop=True)
+# Peers of a /join-calls batch start staggered and share one looping decode
+# of their own the same way
+batch_sources = MediaSourceManager(media_cache, loop=True)
+media_info = MetadataService()
+capabilities_cache = RouterCapabilitiesCache(ttl=ROUTER_CAPS_CACHE_TTL) if ROUTER_CAPS_CACHE_TTL > 0 else None
+# Batch peers share router capabilities and a loaded Device per server even
+# without ROUTER_CAPS_CACHE_TTL
+batch_capabilities_cache = capabilities_cache or RouterCapabilitiesCache()
+encoded_sources = EncodedSourceManager(ENCODED_MEDIA_DIR, media_cache, loop=SESSION_LOOPS > 1, max_bytes=ENCODED_MEDIA_MAX_BYTES) if PASSTHROUGH_MEDIA else None
+warm_pool = WarmPool(lifetime=CERTIFICATE_LIFETIME, size=CERTIFICATE_POOL_SIZE) if WARM_POOL else None
+notifier = WebhookNotifier(workers=WEBHOOK_WORKERS, max_queue=WEBHOOK_MAX_QUEUE, timeout=WEBHOOK_TIMEOUT, retries=WEBHOOK_RETRIES)
+
+def notify(url, session_id, status, demo=None, error=None, recorder=None):
+    if not url:
+        return
+    payload = {"status": status, "session_id": session_id}
+    if demo is not None:
+        payload["timings"] = demo.timings.as_dict()
+        if demo.endReason is not None:
+            payload["end_reason"] = demo.endReason
+        if demo.stats is not None:
+            payload["stats"] = demo.stats.summary()
+        if demo.data is not None:
+            payload["data"] = demo.data.summary()
+        if demo.recoveries:
+            payload["recoveries"] = demo.recoveries
+    if isinstance(recorder, ReceiveSink):
+        payload["received"] = recorder.summary()
+    if error is not None:
+        payload["error"] = error
+    if not notifier.notify(url, payload):
+        print(f'Notification queue full, dropped {status} notification for session {session_id}')
+
+async def run_demo(session_id, ws_url, success_url, failure_url, batch_id=None):
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    outcome = "failure"
+    player = None
+    demo = None
+    recorder = None
+
+    print('**** ws_url:', ws_url)
+    # Only the first sessions of the process wait for it, overlapped with
+    # fetching the media
+    warming = asyncio.ensure_future(warm_pool.warm()) if warm_pool else None
+    try:
+        # Downloading and opening the player block, keep them off the loop
+        source_path = await media_cache.get(DEFAULT_VIDEO_SRC_URL)
+        # Probed once per source, later sessions hit the cache
+        info = await media_info.probe(source_path)
+        video_duration = info.duration or FALLBACK_VIDEO_DURATION
+        print('*** video duration: ', video_duration)
+
+        # The shared decodes loop, so their tracks never end the session
+        shared = not PASSTHROUGH_MEDIA and (batch_id is not None or SHARED_MEDIA_DECODE)
+        if PASSTHROUGH_MEDIA:
+            player = await encoded_sources.open(source_path)
+        elif batch_id is not None:
+            player = await batch_sources.open(source_path)
+        elif SHARED_MEDIA_DECODE:
+            player = await media_sources.open(source_path)
+        else:
+            player = await loop.run_in_executor(None, functools.partial(LoopingPlayer, source_path, SESSION_LOOPS) if SESSION_LOOPS > 1 else functools.partial(MediaPlayer, source_path))
+        recorder = ReceiveSink() if RECEIVE_MODE == 'measure' else MediaBlackhole()
+        if warming is not None:
+            await warming
+        if shared:
+            max_duration = SESSION_MAX_DURATION or video_duration * SESSION_LOOPS
+        else:
+            max_duration = SESSION_MAX_DURATION or video_duration * SESSION_LOOPS + 5
+        cache = batch_capabilities_cache if batch_id is not None else capabilities_cache
+
+        # Execute the Demo logic using asyncio
+        demo = Demo(uri=ws_url, player=player, recorder=recorder, loop=loop, time=SESSION_SETUP_TIMEOUT, linger=max_duration, until_ended=True, observer=metrics.observer, capabilities_cache=cache, stats_interval=STATS_INTERVAL, stats_capacity=STATS_SAMPLES, simulcast=SIMULCAST_LAYERS, adaptive_encoding=ADAPTIVE_ENCODING, layer_control=CONSUMER_LAYER_CONTROL, data_load=DATA_LOAD, reconnect=RECONNECT, reconnect_attempts=RECONNECT_ATTEMPTS, warm_pool=warm_pool, trace=os.path.join(SIGNALING_TRACE_DIR, f'{session_id}.jsonl') if SIGNALING_TRACE_DIR else None)
+        await demo.run()
+
+        # Delivered in the background, retried if the endpoint fails
+        notify(success_url, session_id, "success", demo, recorder=recorder)
+
+        outcome = "success"
+        print(f'Demo {session_id} completed successfully.')
+    except asyncio.CancelledError:
+        # Stopped through DELETE /sessions/<id> or on shutdown
+        outcome = "cancelled"
+        notify(failure_url, session_id, "failure", demo, "cancelled", recorder)
+        print(f'Demo {session_id} cancelled.')
+        raise
+    except Exception as e:
+        notify(failure_url, session_id, "failure", demo, f'{type(e).__name__}: {e}', recorder)
+        print(f'Error during demo execution: {str(e)}')
+        if batch_id is not None:
+            # The batch learns the outcome from the engine
+            raise
+    finally:
+        # Release everything the session holds, whichever way it ended
+        if demo is not None:
+            await demo.close()
+        if player is not None:
+            close_player(player)
+        metrics.session_done(outcome, time.monotonic() - started)
+
+def close_player(player):
+    if not isinstance(player, MediaPlayer):
+        # Drops this session's subscription to the shared source, or stops
+        # every pass of a LoopingPlayer
+        player.close()
+        return
+    # A MediaPlayer stops its decode thread and closes the file once all of
+    # its tracks are stopped
+    for track in (player.audio, player.video):
+        if track is not None:
+            track.stop()
+
+def report_lost_session(session_id, ws_url, success_url, failure_url):
+    # Called by the supervisor when the worker running the session died
+    notify(failure_url, session_id, "failure", error="worker process exited")
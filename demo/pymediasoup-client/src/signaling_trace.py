@@ -0,0 +1,76 @@
+import json
+import time
+from typing import List, Optional
+
+# Trace files are JSON lines. The first line is a header; every other line is
+# one event of a connection:
+#   {"t": seconds since the trace started, "c": connection number,
+#    "d": "open" | "out" | "in", "m": the protoo message, or {"uri": ...}}
+# "out" messages were sent by the client and "in" messages received by it.
+# Events are appended as they happen, so a trace is readable up to the last
+# complete line even when the process dies mid-session.
+TRACE_VERSION = 1
+_SEPARATORS = (",", ":")
+
+
+class SignalingTrace:
+    """
+    Records every protoo message a client sends and receives, with monotonic
+    timestamps, to an append-only JSON lines file. Pass ``record`` as the
+    ProtooClient's ``on_message`` callback.
+    """
+
+    def __init__(self, path: str, uri: Optional[str] = None):
+        self.path = path
+        self.events = 0
+        self._started = time.monotonic()
+        self._connection = -1
+        # Line buffered: each event reaches the file as it is recorded
+        self._file = open(path, "a", buffering=1)
+        self._write({"trace": TRACE_VERSION, "started": time.time(), "uri": uri})
+
+    def record(self, direction: str, message: dict):
+        if self._file is None:
+            return
+        if direction == "open":
+            self._connection += 1
+        self.events += 1
+        self._write(
+            {
+                "t": round(time.monotonic() - self._started, 6),
+                "c": self._connection,
+                "d": direction,
+                "m": message,
+            }
+        )
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry, separators=_SEPARATORS) + "\n")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_trace(path: str) -> List[List[dict]]:
+    """
+    The events of a trace grouped per connection, in order. A truncated last
+    line, left by a process that died while writing it, is skipped.
+    """
+    connections: List[List[dict]] = []
+    with open(path) as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if "trace" in entry:
+                if entry["trace"] != TRACE_VERSION:
+                    raise ValueError(f"unsupported trace version {entry['trace']}")
+                continue
+            if entry["d"] == "open":
+                connections.append([])
+            if connections:
+                connections[-1].append(entry)
+    return connections
@@ -0,0 +1,378 @@
+import re
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiortc import RTCRtpSender
+from aiortc.codecs import get_encoder
+from aiortc.contrib.media import MediaRelay
+from aiortc.mediastreams import MediaStreamTrack
+from aiortc.rtcrtpparameters import RTCRtcpParameters, RTCRtpSendParameters
+from aiortc.utils import random32
+from pymediasoup.rtp_parameters import RtpEncodingParameters
+
+from protoo import ProtooError
+
+# Sends a protoo request, e.g. ProtooClient.request
+Request = Callable[..., Awaitable[dict]]
+
+# (scaleResolutionDownBy, maxBitrate in bps) per encoding, lowest layer first
+Layers = List[Tuple[int, int]]
+
+DEFAULT_LAYERS: Layers = [(4, 150_000), (2, 500_000), (1, 1_500_000)]
+
+
+def parse_layers(spec: str) -> Layers:
+    """
+    Parses "scale:maxBitrate,..." (e.g. "4:150000,2:500000,1:1500000"),
+    lowest layer first.
+    """
+    layers = []
+    for item in spec.split(","):
+        scale, maxBitrate = item.split(":")
+        layers.append((int(scale), int(maxBitrate)))
+    if [scale for scale, _ in layers] != sorted((scale for scale, _ in layers), reverse=True):
+        raise ValueError(f"simulcast layers must go from the lowest resolution up: {spec}")
+    return layers
+
+
+class ScaledVideoTrack(MediaStreamTrack):
+    """
+    Passes on the frames of ``source`` downscaled by ``scale``, which may be
+    changed while the track runs; the encoder restarts at the new size.
+    Stopping it leaves ``source`` running.
+    """
+
+    kind = "video"
+
+    def __init__(self, source: MediaStreamTrack, scale: int = 1):
+        super().__init__()
+        self.source = source
+        self.scale = scale
+
+    async def recv(self):
+        frame = await self.source.recv()
+        if self.scale == 1:
+            return frame
+        scaled = frame.reformat(
+            width=max(2, (frame.width // self.scale) & ~1),
+            height=max(2, (frame.height // self.scale) & ~1),
+        )
+        scaled.pts = frame.pts
+        scaled.time_base = frame.time_base
+        return scaled
+
+
+class EncodingControl:
+    """
+    Keeps the encoder of an aiortc RTCRtpSender at or below ``max_bitrate``,
+    including after REMB feedback raised it. aiortc clamps encoder bitrates
+    to its own range (250 kbps to 1.5 Mbps for VP8).
+    """
+
+    def __init__(self, sender: RTCRtpSender, max_bitrate: Optional[int] = None):
+        self.sender = sender
+        self.max_bitrate = max_bitrate
+        next_encoded_frame = sender._next_encoded_frame
+
+        async def capped(codec):
+            encoder = sender._RTCRtpSender__encoder
+            if encoder is None:
+                # Created here rather than on the first frame, so that frame
+                # is already encoded at the capped bitrate
+                encoder = sender._RTCRtpSender__encoder = get_encoder(codec)
+            if (
+                self.max_bitrate is not None
+                and hasattr(encoder, "target_bitrate")
+                and encoder.target_bitrate > self.max_bitrate
+            ):
+                encoder.target_bitrate = self.max_bitrate
+            return await next_encoded_frame(codec)
+
+        sender._next_encoded_frame = capped
+
+    @property
+    def bitrate(self) -> Optional[int]:
+        encoder = self.sender._RTCRtpSender__encoder
+        return getattr(encoder, "target_bitrate", None)
+
+
+class SimulcastLayers:
+    """
+    Sends one video track as several simulcast encodings over a single
+    transceiver, which aiortc cannot do on its own.
+
+    The transceiver's own sender carries the highest layer; every lower
+    layer gets an extra RTCRtpSender on the same DTLS transport, fed a
+    downscaled copy of the track. The producer announces each encoding by
+    SSRC, so mediasoup sees one simulcast producer.
+    """
+
+    def __init__(self, track: MediaStreamTrack, layers: Layers):
+        self.layers = layers
+        self._relay = MediaRelay()
+        self.tracks = [
+            ScaledVideoTrack(self._relay.subscribe(track, buffered=False), scale)
+            for scale, _ in layers
+        ]
+        # (media, RTX) SSRC per layer
+        self.ssrcs = [(random32(), random32()) for _ in layers]
+        # One per layer, lowest first, as the senders are set up
+        self.controls: List[EncodingControl] = []
+        self._transceiver = None
+        self._senders: List[RTCRtpSender] = []
+
+    @property
+    def track(self) -> ScaledVideoTrack:
+        """The highest layer, handed to the transport's produce()."""
+        return self.tracks[-1]
+
+    def encodings(self) -> List[RtpEncodingParameters]:
+        return [
+            RtpEncodingParameters(
+                ssrc=ssrc,
+                rtx={"ssrc": rtxSsrc},
+                scaleResolutionDownBy=scale,
+                maxBitrate=maxBitrate,
+            )
+            for (scale, maxBitrate), (ssrc, rtxSsrc) in zip(self.layers, self.ssrcs)
+        ]
+
+    async def produce(self, transport, **kwargs):
+        """
+        Produces the layers on a pymediasoup send Transport; ``kwargs`` go to
+        Transport.produce().
+        """
+        handler = transport.handler
+        send = handler.send
+
+        async def send_layers(**options):
+            result = await send(**options)
+            if options.get("track") is not self.track:
+                return result
+            # The highest layer keeps the transceiver's sender
+            sender = result.rtpSender
+            sender._ssrc, sender._rtx_ssrc = self.ssrcs[-1]
+            self._transceiver = handler._mapMidTransceiver[result.localId]
+            for encoding in result.rtpParameters.encodings:
+                # Announced by SSRC; aiortc sends neither RIDs nor temporal
+                # layers
+                encoding.rid = None
+                encoding.scalabilityMode = "L1T1"
+            self.controls.append(EncodingControl(sender, self.layers[-1][1]))
+            return result
+
+        handler.send = send_layers
+        try:
+            producer = await transport.produce(
+                track=self.track, encodings=self.encodings(), **kwargs
+            )
+        finally:
+            handler.send = send
+        return producer
+
+    async def run(self, producer):
+        """Starts the lower layers once the transport is connected."""
+        dtlsTransport = producer.rtpSender.transport
+        while dtlsTransport.state != "connected":
+            if dtlsTransport.state in ("closed", "failed"):
+                return
+            await asyncio.sleep(0.05)
+        for index, (track, (_, maxBitrate), (ssrc, rtxSsrc)) in enumerate(
+            zip(self.tracks[:-1], self.layers[:-1], self.ssrcs[:-1])
+        ):
+            sender = RTCRtpSender(track, dtlsTransport)
+            sender._ssrc, sender._rtx_ssrc = ssrc, rtxSsrc
+            self.controls.insert(index, EncodingControl(sender, maxBitrate))
+            self._senders.append(sender)
+            await sender.send(
+                RTCRtpSendParameters(
+                    codecs=self._transceiver._codecs,
+                    headerExtensions=self._transceiver._headerExtensions,
+                    muxId=self._transceiver.mid,
+                    rtcp=RTCRtcpParameters(
+                        cname=producer.rtpParameters.rtcp.cname, ssrc=ssrc, mux=True
+                    ),
+                )
+            )
+
+    async def stop(self):
+        for sender in self._senders:
+            await sender.stop()
+        self._senders = []
+        for track in self.tracks:
+            track.stop()
+            # Unsubscribes from the relay
+            track.source.stop()
+
+
+class AdaptiveEncoder:
+    """
+    Adapts one video sender to its uplink: while the receiver reports for it
+    show loss above ``loss`` or a round-trip time above ``rtt`` (or the
+    server scores the producer below ``score``), the bitrate cap is lowered
+    step by step and, once at ``min_bitrate``, the resolution is halved, down
+    to ``1/max_scale``. After ``recover`` clean ticks it goes back up the
+    same way.
+    """
+
+    def __init__(
+        self,
+        control: EncodingControl,
+        track: ScaledVideoTrack,
+        interval: float = 2,
+        loss: float = 0.05,
+        rtt: float = 0.3,
+        score: int = 7,
+        min_bitrate: int = 250_000,
+        max_scale: int = 4,
+        recover: int = 3,
+        get_score: Optional[Callable[[], Optional[float]]] = None,
+    ):
+        self.control = control
+        self.track = track
+        self.interval = interval
+        self.loss = loss
+        self.rtt = rtt
+        self.score = score
+        self.min_bitrate = min_bitrate
+        self.max_scale = max_scale
+        self.recover = recover
+        self._get_score = get_score
+        self._base_scale = track.scale
+        self._ceiling = control.max_bitrate or 1_500_000
+        if control.max_bitrate is None:
+            control.max_bitrate = self._ceiling
+        self._clean = 0
+        # (time, action) of every change, for reporting
+        self.changes: List[Tuple[float, str]] = []
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            loss, rtt = await self._feedback()
+            score = self._get_score() if self._get_score is not None else None
+            self.step(loss, rtt, score)
+
+    async def _feedback(self) -> Tuple[Optional[float], Optional[float]]:
+        report = await self.control.sender.getStats()
+        for stats in report.values():
+            if stats.type == "remote-inbound-rtp":
+                return stats.fractionLost / 256, stats.roundTripTime
+        return None, None
+
+    def step(self, loss: Optional[float], rtt: Optional[float], score: Optional[float]) -> Optional[str]:
+        congested = (
+            (loss is not None and loss > self.loss)
+            or (rtt is not None and rtt > self.rtt)
+            or (score is not None and score < self.score)
+        )
+        if congested:
+            self._clean = 0
+            return self._down()
+        self._clean += 1
+        if self._clean >= self.recover:
+            self._clean = 0
+            return self._up()
+        return None
+
+    def _down(self) -> Optional[str]:
+        control = self.control
+        if control.max_bitrate > self.min_bitrate:
+            control.max_bitrate = max(self.min_bitrate, int(control.max_bitrate * 0.7))
+            return self._changed(f"bitrate {control.max_bitrate}")
+        if self.track.scale < self.max_scale:
+            self.track.scale *= 2
+            return self._changed(f"scale 1/{self.track.scale}")
+        return None
+
+    def _up(self) -> Optional[str]:
+        control = self.control
+        ceiling = self._ceiling // self.track.scale
+        if control.max_bitrate < ceiling:
+            control.max_bitrate = min(ceiling, int(control.max_bitrate * 1.25))
+            return self._changed(f"bitrate {control.max_bitrate}")
+        if self.track.scale > self._base_scale:
+            self.track.scale //= 2
+            return self._changed(f"scale 1/{self.track.scale}")
+        return None
+
+    def _changed(self, action: str) -> str:
+        self.changes.append((time.monotonic(), action))
+        return action
+
+
+def _layer_counts(rtpParameters: dict) -> Tuple[int, int]:
+    encodings = rtpParameters.get("encodings") or [{}]
+    match = re.match(r"[LS](\d+)T(\d+)", encodings[0].get("scalabilityMode") or "")
+    if match is None:
+        return 1, 1
+    return int(match.group(1)), int(match.group(2))
+
+
+class ConsumerLayerControl:
+    """
+    Sheds received video while this client is overloaded, i.e. while its
+    event loop runs more than ``lag`` seconds late: the simulcast and SVC
+    video consumers past the first ``keep`` are asked for their lowest
+    layers (setConsumerPreferredLayers), and the kept ones get a higher
+    priority (setConsumerPriority) so they win when bandwidth is short.
+    Everything is restored once the loop keeps up again.
+    """
+
+    def __init__(self, request: Request, interval: float = 2, lag: float = 0.05, keep: int = 1):
+        self.interval = interval
+        self.lag = lag
+        self.keep = keep
+        self.overloaded = False
+        self.errors = 0
+        self._request = request
+        # consumer id -> (spatial layers, temporal layers), in arrival order
+        self._consumers: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, consumerId: str, kind: str, type: Optional[str], rtpParameters: dict):
+        if kind == "video" and type in ("simulcast", "svc"):
+            self._consumers[consumerId] = _layer_counts(rtpParameters)
+
+    def remove(self, consumerId: str):
+        self._consumers.pop(consumerId, None)
+
+    async def run(self):
+        while True:
+            overloaded = await self._measure() > self.lag
+            if overloaded != self.overloaded:
+                self.overloaded = overloaded
+                await self.apply()
+
+    async def _measure(self) -> float:
+        # Largest lateness of short sleeps over one interval
+        worst = 0.0
+        step = self.interval / 10
+        for _ in range(10):
+            start = time.monotonic()
+            await asyncio.sleep(step)
+            worst = max(worst, time.monotonic() - start - step)
+        return worst
+
+    async def apply(self):
+        requests = []
+        for index, (consumerId, (spatial, temporal)) in enumerate(list(self._consumers.items())):
+            kept = index < self.keep
+            if self.overloaded and not kept:
+                layers = {"spatialLayer": 0, "temporalLayer": 0}
+            else:
+                layers = {"spatialLayer": spatial - 1, "temporalLayer": temporal - 1}
+            requests.append(
+                self._send("setConsumerPreferredLayers", {"consumerId": consumerId, **layers})
+            )
+            priority = 2 if self.overloaded and kept else 1
+            requests.append(
+                self._send("setConsumerPriority", {"consumerId": consumerId, "priority": priority})
+            )
+        await asyncio.gather(*requests)
+
+    async def _send(self, method: str, data: dict):
+        try:
+            await self._request(method, data)
+        except ProtooError:
+            self.errors += 1
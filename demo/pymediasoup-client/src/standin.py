@@ -0,0 +1,432 @@
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+from itertools import count
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+
+from router_capabilities import ROUTER_RTP_CAPABILITIES
+
+# Local stand-in for the mediasoup protoo server. It answers the signaling
+# requests the Python client sends with well-formed (but fake) parameters so
+# the client can be benchmarked and exercised offline. No media is routed.
+
+DTLS_FINGERPRINT = ":".join(["AB"] * 32)
+
+
+def consumer_rtp_parameters(kind: str, ssrc: int, mid: str) -> dict:
+    if kind == "audio":
+        codec = {
+            "mimeType": "audio/opus",
+            "payloadType": 100,
+            "clockRate": 48000,
+            "channels": 2,
+            "parameters": {},
+            "rtcpFeedback": [],
+        }
+    else:
+        codec = {
+            "mimeType": "video/VP8",
+            "payloadType": 101,
+            "clockRate": 90000,
+            "parameters": {},
+            "rtcpFeedback": [
+                {"type": "nack"},
+                {"type": "nack", "parameter": "pli"},
+                {"type": "ccm", "parameter": "fir"},
+            ],
+        }
+    return {
+        "mid": mid,
+        "codecs": [codec],
+        "headerExtensions": [],
+        "encodings": [{"ssrc": ssrc}],
+        "rtcp": {"cname": "standin", "reducedSize": True, "mux": True},
+    }
+
+
+class StandInPeer:
+    def __init__(
+        self,
+        server: "StandInServer",
+        websocket,
+        peerId: Optional[str] = None,
+        roomId: Optional[str] = None,
+    ):
+        self.server = server
+        self.websocket = websocket
+        self.peerId = peerId
+        self.roomId = roomId
+        self.joined = False
+        self.transports: List[str] = []
+        self.producers: Dict[str, str] = {}
+        self._requestIds = count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    async def send(self, message: dict):
+        await self.websocket.send(json.dumps(message))
+
+    async def request(self, method: str, data: dict) -> dict:
+        id = next(self._requestIds)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[id] = fut
+        try:
+            await self.send({"request": True, "id": id, "method": method, "data": data})
+            return await fut
+        finally:
+            self._pending.pop(id, None)
+
+    async def notify(self, method: str, data: dict):
+        await self.send({"notification": True, "method": method, "data": data})
+
+    def on_response(self, message: dict):
+        fut = self._pending.get(message.get("id"))
+        if fut is not None and not fut.done():
+            fut.set_result(message)
+
+
+class StandInServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        consumers: int = 0,
+        keep_transports: bool = False,
+        peer_events: bool = False,
+    ):
+        self.host = host
+        self.port = port
+        # Artificial processing delay applied to every request (seconds)
+        self.latency = latency
+        # Number of newConsumer requests pushed to every peer once it joins
+        self.consumers = consumers
+        # Whether a peer that reconnects with the same peerId gets its
+        # transports and joined state back. The mediasoup server closes a
+        # peer's transports with its websocket, so by default it starts over
+        self.keep_transports = keep_transports
+        # Whether peers learn about the other peers of their room like on the
+        # mediasoup server: listed in the join response, then newPeer,
+        # peerLeft and peerClosed notifications. By default every peer is
+        # alone in its room
+        self.peer_events = peer_events
+
+        self.peers: List[StandInPeer] = []
+        # Seconds between the first newConsumer request and the last answer,
+        # one entry per joined peer
+        self.consumeTimes: List[float] = []
+        # Websockets closed by drop_peers()
+        self.drops = 0
+        # peerId -> peer, for peers that connected with one
+        self._byId: Dict[str, StandInPeer] = {}
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/"
+
+    async def start(self):
+        self._server = await websockets.serve(
+            self._serve, self.host, self.port, subprotocols=["protoo"]
+        )
+        self.port = list(self._server.sockets)[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def drop_peers(self):
+        """Closes every peer's websocket, as a network failure would."""
+        peers = list(self.peers)
+        self.drops += len(peers)
+        await asyncio.gather(
+            *(peer.websocket.close() for peer in peers), return_exceptions=True
+        )
+
+    async def _serve(self, websocket, path=None):
+        if path is None:
+            path = getattr(getattr(websocket, "request", None), "path", "")
+        query = parse_qs(urlparse(path).query)
+        peerId = query.get("peerId", [None])[0]
+        peer = StandInPeer(self, websocket, peerId, query.get("roomId", [None])[0])
+        existing = self._byId.get(peerId) if peerId else None
+        if existing is not None:
+            if self.keep_transports:
+                peer.joined = existing.joined
+                peer.transports = existing.transports
+                peer.producers = existing.producers
+            # Like the mediasoup server, a new connection replaces the old one
+            await existing.websocket.close()
+        if peerId:
+            self._byId[peerId] = peer
+        self.peers.append(peer)
+        tasks = set()
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                if message.get("response"):
+                    peer.on_response(message)
+                elif message.get("request"):
+                    task = asyncio.ensure_future(self._handle(peer, message))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.peers.remove(peer)
+            if self.peer_events and peer.joined:
+                await self._announce(peer, "peerClosed", {"peerId": peer.peerId})
+            if not self.keep_transports and self._byId.get(peerId) is peer:
+                del self._byId[peerId]
+
+    async def _handle(self, peer: StandInPeer, message: dict):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        handler = getattr(self, f"_on_{message['method']}", None)
+        if handler is None:
+            response = {
+                "response": True,
+                "id": message["id"],
+                "ok": False,
+                "errorCode": 500,
+                "errorReason": f"unknown method \"{message['method']}\"",
+            }
+        else:
+            try:
+                response = {
+                    "response": True,
+                    "id": message["id"],
+                    "ok": True,
+                    "data": handler(peer, message.get("data") or {}) or {},
+                }
+            except Exception as e:
+                response = {
+                    "response": True,
+                    "id": message["id"],
+                    "ok": False,
+                    "errorCode": 500,
+                    "errorReason": str(e),
+                }
+        announce = self.peer_events and response["ok"]
+        if announce and message["method"] == "leaveRoom":
+            await self._announce(peer, "peerLeft", {"peerId": peer.peerId})
+        try:
+            await peer.send(response)
+        except websockets.ConnectionClosed:
+            return
+        if announce and message["method"] == "join":
+            await self._announce(peer, "newPeer", self._peer_info(peer))
+        if message["method"] == "join" and response["ok"] and self.consumers:
+            await self._push_consumers(peer)
+
+    def _room(self, peer: StandInPeer) -> List[StandInPeer]:
+        # The other joined peers of the peer's room
+        return [
+            other
+            for other in self.peers
+            if other is not peer and other.joined and other.roomId == peer.roomId
+        ]
+
+    @staticmethod
+    def _peer_info(peer: StandInPeer) -> dict:
+        return {"id": peer.peerId, "displayName": peer.peerId, "device": {"flag": "standin"}}
+
+    async def _announce(self, peer: StandInPeer, method: str, data: dict):
+        await asyncio.gather(
+            *(other.notify(method, data) for other in self._room(peer)),
+            return_exceptions=True,
+        )
+
+    async def _push_consumers(self, peer: StandInPeer):
+        start = time.monotonic()
+        await asyncio.gather(
+            *(
+                peer.request(
+                    "newConsumer",
+                    {
+                        "peerId": "standin",
+                        "producerId": str(uuid.uuid4()),
+                        "id": str(uuid.uuid4()),
+                        "kind": "video" if n % 2 == 0 else "audio",
+                        "rtpParameters": consumer_rtp_parameters(
+                            "video" if n % 2 == 0 else "audio", 100000 + n, str(n)
+                        ),
+                        "type": "simple",
+                        "appData": {},
+                        "producerPaused": False,
+                    },
+                )
+                for n in range(self.consumers)
+            )
+        )
+        self.consumeTimes.append(time.monotonic() - start)
+
+    def _on_getRouterRtpCapabilities(self, peer, data):
+        return ROUTER_RTP_CAPABILITIES
+
+    def _on_createWebRtcTransport(self, peer, data):
+        transportId = str(uuid.uuid4())
+        peer.transports.append(transportId)
+        return {
+            "id": transportId,
+            "iceParameters": {
+                "usernameFragment": uuid.uuid4().hex[:16],
+                "password": uuid.uuid4().hex,
+                "iceLite": True,
+            },
+            "iceCandidates": [
+                {
+                    "foundation": "udpcandidate",
+                    "priority": 1076302079,
+                    "ip": "127.0.0.1",
+                    "address": "127.0.0.1",
+                    "protocol": "udp",
+                    "port": 9,
+                    "type": "host",
+                }
+            ],
+            "dtlsParameters": {
+                "role": "auto",
+                "fingerprints": [{"algorithm": "sha-256", "value": DTLS_FINGERPRINT}],
+            },
+            "sctpParameters": {
+                "port": 5000,
+                "OS": 1024,
+                "MIS": 1024,
+                "maxMessageSize": 262144,
+            },
+            "iceServers": [],
+        }
+
+    def _on_connectWebRtcTransport(self, peer, data):
+        return {}
+
+    def _on_restartIce(self, peer, data):
+        if data.get("transportId") not in peer.transports:
+            raise LookupError(f"Transport with id \"{data.get('transportId')}\" not found")
+        return {
+            "usernameFragment": uuid.uuid4().hex[:16],
+            "password": uuid.uuid4().hex,
+            "iceLite": True,
+        }
+
+    def _on_join(self, peer, data):
+        if peer.joined:
+            raise RuntimeError("Peer already joined")
+        peer.joined = True
+        if not self.peer_events:
+            return {"peers": []}
+        return {"peers": [self._peer_info(other) for other in self._room(peer)]}
+
+    def _on_produce(self, peer, data):
+        producerId = str(uuid.uuid4())
+        peer.producers[producerId] = data.get("kind")
+        return {"id": producerId}
+
+    def _on_produceData(self, peer, data):
+        return {"id": str(uuid.uuid4())}
+
+    def _on_leaveRoom(self, peer, data):
+        return {}
+
+    def _on_setConsumerPreferredLayers(self, peer, data):
+        return {}
+
+    def _on_setConsumerPriority(self, peer, data):
+        return {}
+
+    # Stats shaped like mediasoup's getStats() results, with fixed values
+
+    def _on_getTransportStats(self, peer, data):
+        return [
+            {
+                "type": "webrtc-transport",
+                "transportId": data.get("transportId"),
+                "timestamp": int(time.time() * 1000),
+                "recvBitrate": 1_200_000,
+                "sendBitrate": 1_100_000,
+                "rtpRecvBitrate": 1_150_000,
+                "rtpSendBitrate": 1_050_000,
+                "availableOutgoingBitrate": 2_000_000,
+            }
+        ]
+
+    def _on_getProducerStats(self, peer, data):
+        return [
+            {
+                "type": "inbound-rtp",
+                "timestamp": int(time.time() * 1000),
+                "bitrate": 1_000_000,
+                "packetCount": 1000,
+                "packetsLost": 0,
+                "fractionLost": 0,
+                "jitter": 4,
+                "score": 10,
+                "nackCount": 0,
+                "pliCount": 0,
+            }
+        ]
+
+    def _on_getConsumerStats(self, peer, data):
+        return [
+            {
+                "type": "outbound-rtp",
+                "timestamp": int(time.time() * 1000),
+                "bitrate": 1_000_000,
+                "packetCount": 1000,
+                "packetsLost": 0,
+                "fractionLost": 0,
+                "roundTripTime": 1.5,
+                "score": 10,
+                "nackCount": 0,
+                "pliCount": 0,
+            }
+        ]
+
+
+def start_in_thread(**kwargs) -> StandInServer:
+    """
+    Starts a StandInServer on its own event loop in a daemon thread, for
+    tools that drive clients from other loops or processes.
+    """
+    server = StandInServer(**kwargs)
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in protoo server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4443)
+    parser.add_argument("--latency", type=float, default=0.0, help="Per-request delay (s)")
+    parser.add_argument("--consumers", type=int, default=0, help="newConsumer per join")
+    parser.add_argument("--peer-events", action="store_true", help="Announce peers to the other peers of their room")
+    args = parser.parse_args()
+
+    async def main():
+        server = StandInServer(args.host, args.port, args.latency, args.consumers, peer_events=args.peer_events)
+        await server.start()
+        print(f"Stand-in protoo server listening on {server.url}")
+        await asyncio.Future()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,114 @@
+import time
+import asyncio
+import fractions
+import importlib
+
+# Entry points app.py hands to the session engine, and the warm-up it runs
+# when the engine starts. This module only imports the standard library:
+# runner pulls in aiortc, pymediasoup, PyAV and requests, which take most of
+# the service's start-up time, so it is imported on first use instead, in the
+# background during warm-up or by the first session when there is none.
+
+
+def run_demo(session_id, ws_url, success_url, failure_url):
+    from runner import run_demo
+
+    return run_demo(session_id, ws_url, success_url, failure_url)
+
+
+def report_lost_session(session_id, ws_url, success_url, failure_url):
+    from runner import report_lost_session
+
+    report_lost_session(session_id, ws_url, success_url, failure_url)
+
+
+def run_batch_peer(session_id, ws_url, batch_id):
+    from runner import run_demo
+
+    # The batch sends one summary instead of a callback per peer
+    return run_demo(session_id, ws_url, None, None, batch_id=batch_id)
+
+
+def notify(url, payload):
+    from runner import notifier
+
+    if not notifier.notify(url, payload):
+        print(f'Notification queue full, dropped notification to {url}')
+
+
+def load_codecs():
+    """
+    Initializes the encoders and decoders sessions use by encoding one frame
+    with each encoder, which loads libvpx, libopus and libx264.
+    """
+    import av
+    from aiortc.codecs import get_decoder, get_encoder
+    from aiortc.rtcrtpparameters import RTCRtpCodecParameters
+
+    video = av.VideoFrame(width=320, height=240, format="yuv420p")
+    video.pts, video.time_base = 0, fractions.Fraction(1, 90000)
+    audio = av.AudioFrame(format="s16", layout="stereo", samples=960)
+    audio.sample_rate = 48000
+    audio.pts, audio.time_base = 0, fractions.Fraction(1, 48000)
+    for plane in audio.planes:
+        plane.update(bytes(plane.buffer_size))
+
+    for mimeType, clockRate, frame in (
+        ("video/VP8", 90000, video),
+        ("video/H264", 90000, video),
+        ("audio/opus", 48000, audio),
+    ):
+        codec = RTCRtpCodecParameters(mimeType=mimeType, clockRate=clockRate, payloadType=96)
+        get_encoder(codec).encode(frame)
+        get_decoder(codec)
+
+
+async def load_device(runner):
+    """Loads a throwaway Device, the same way sessions load theirs."""
+    from pymediasoup import AiortcHandler, Device
+    from pymediasoup.rtp_parameters import RtpCapabilities
+    from router_capabilities import ROUTER_RTP_CAPABILITIES
+
+    if runner.warm_pool is not None:
+        await runner.warm_pool.warm()
+        handlerFactory = runner.warm_pool.handlerFactory()
+    else:
+        handlerFactory = AiortcHandler.createFactory()
+    device = Device(handlerFactory=handlerFactory)
+    await device.load(RtpCapabilities(**ROUTER_RTP_CAPABILITIES))
+
+
+async def open_media(runner):
+    """Downloads (or finds in the cache) and probes the default source."""
+    path = await runner.media_cache.get(runner.DEFAULT_VIDEO_SRC_URL)
+    await runner.media_info.probe(path)
+
+
+async def warm_up() -> dict:
+    """
+    Imports runner and initializes what the first session would otherwise
+    set up itself. Returns the seconds each step took and the error of each
+    step that failed; the steps after a failed import are skipped.
+    """
+    loop = asyncio.get_running_loop()
+    steps = {}
+    errors = {}
+
+    async def step(name, run):
+        start = time.monotonic()
+        try:
+            return await run()
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+        finally:
+            steps[name] = time.monotonic() - start
+
+    # Off the loop, so it keeps serving sessions meanwhile
+    runner = await step("imports", lambda: loop.run_in_executor(None, importlib.import_module, "runner"))
+    if runner is not None:
+        await asyncio.gather(
+            step("codecs", lambda: loop.run_in_executor(None, load_codecs)),
+            step("device", lambda: load_device(runner)),
+            step("media", lambda: open_media(runner)),
+        )
+    return {"steps": steps, "errors": errors}
@@ -0,0 +1,245 @@
+import math
+import time
+import asyncio
+from array import array
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from protoo import ProtooError, ProtooRequestError
+
+# Sends a protoo request, e.g. ProtooClient.request
+Request = Callable[..., Awaitable[dict]]
+
+# Per entity type: the server request, the id field it takes, the stats entry
+# type the sample is read from, and the fields kept of that entry
+SERVER_STATS = {
+    "transport": (
+        "getTransportStats",
+        "transportId",
+        "webrtc-transport",
+        ("recvBitrate", "sendBitrate", "rtpRecvBitrate", "rtpSendBitrate", "availableOutgoingBitrate"),
+    ),
+    "producer": (
+        "getProducerStats",
+        "producerId",
+        "inbound-rtp",
+        ("bitrate", "packetCount", "packetsLost", "fractionLost", "jitter", "score", "nackCount", "pliCount"),
+    ),
+    "consumer": (
+        "getConsumerStats",
+        "consumerId",
+        "outbound-rtp",
+        ("bitrate", "packetCount", "packetsLost", "fractionLost", "roundTripTime", "score", "nackCount", "pliCount"),
+    ),
+}
+
+# Fields kept of aiortc's RTCPeerConnection.getStats(): per stats type, the
+# attribute read and the field it is added to (or, for RTT and loss
+# fractions, maxed into) over the connection's streams
+LOCAL_STATS = {
+    "outbound-rtp": (("bytesSent", "bytesSent"), ("packetsSent", "packetsSent")),
+    "inbound-rtp": (
+        ("bytesReceived", "bytesReceived"),
+        ("packetsReceived", "packetsReceived"),
+        ("packetsLost", "packetsLost"),
+    ),
+    # What the remote end reports about the media we send
+    "remote-inbound-rtp": (
+        ("packetsLost", "remotePacketsLost"),
+        ("fractionLost", "remoteFractionLost"),
+        ("roundTripTime", "roundTripTime"),
+    ),
+}
+LOCAL_FIELDS = tuple(field for fields in LOCAL_STATS.values() for _, field in fields)
+
+# Fields that only grow; the summary reports their last value
+CUMULATIVE = {
+    "packetCount",
+    "packetsLost",
+    "nackCount",
+    "pliCount",
+    "bytesSent",
+    "packetsSent",
+    "bytesReceived",
+    "packetsReceived",
+    "remotePacketsLost",
+}
+
+
+class StatsRing:
+    """
+    The last ``capacity`` samples of one entity. Timestamps and values live in
+    two arrays of doubles allocated up front; fields a sample lacks are NaN.
+    """
+
+    def __init__(self, fields: Tuple[str, ...], capacity: int):
+        self.fields = fields
+        self.capacity = capacity
+        self.count = 0
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._values = array("d", [math.nan]) * (capacity * len(fields))
+
+    def append(self, timestamp: float, sample: dict):
+        slot = self.count % self.capacity
+        self._timestamps[slot] = timestamp
+        offset = slot * len(self.fields)
+        for index, field in enumerate(self.fields):
+            value = sample.get(field)
+            self._values[offset + index] = math.nan if value is None else float(value)
+        self.count += 1
+
+    def rows(self) -> List[Tuple[float, Tuple[float, ...]]]:
+        """Stored samples, oldest first."""
+        size = min(self.count, self.capacity)
+        width = len(self.fields)
+        rows = []
+        for n in range(self.count - size, self.count):
+            slot = n % self.capacity
+            rows.append(
+                (self._timestamps[slot], tuple(self._values[slot * width:(slot + 1) * width]))
+            )
+        return rows
+
+    def column(self, field: str) -> List[float]:
+        index = self.fields.index(field)
+        return [
+            values[index] for _, values in self.rows() if not math.isnan(values[index])
+        ]
+
+
+class StatsSampler:
+    """
+    Polls the server's transport, producer and consumer stats of one session
+    every ``interval`` seconds, together with aiortc's local stats of the
+    session's peer connections.
+
+    Every tick sends the requests for all registered entities at once, at most
+    ``concurrency`` in flight, and stores one sample per entity in its
+    StatsRing. Entities the server no longer knows are dropped.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        interval: float = 5,
+        capacity: int = 120,
+        concurrency: int = 8,
+    ):
+        self.interval = interval
+        self.capacity = capacity
+        self._request = request
+        self._limit = asyncio.Semaphore(concurrency)
+        # (entity type, id) -> (kind, ring)
+        self._entities: Dict[Tuple[str, str], Tuple[str, StatsRing]] = {}
+        # name -> (RTCPeerConnection getter, ring)
+        self._local: Dict[str, Tuple[Callable, StatsRing]] = {}
+        self.ticks = 0
+        self.errors = 0
+
+    def add(self, entity: str, id: str, kind: str):
+        """Registers a transport, producer or consumer; ``kind`` labels it in the summary."""
+        self._entities[(entity, id)] = (kind, StatsRing(SERVER_STATS[entity][3], self.capacity))
+
+    def remove(self, entity: str, id: str):
+        self._entities.pop((entity, id), None)
+
+    def latest(self, entity: str, id: str, field: str) -> Optional[float]:
+        """The last sampled value of ``field``, if any."""
+        item = self._entities.get((entity, id))
+        if item is None:
+            return None
+        values = item[1].column(field)
+        return values[-1] if values else None
+
+    def add_local(self, name: str, get_pc: Callable):
+        # The peer connection is created lazily by pymediasoup, so it is
+        # looked up on every tick
+        self._local[name] = (get_pc, StatsRing(LOCAL_FIELDS, self.capacity))
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            await self.sample()
+            await asyncio.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+    async def sample(self):
+        timestamp = time.time()
+        await asyncio.gather(
+            *(self._sample_server(key, timestamp) for key in list(self._entities)),
+            *(self._sample_local(name, timestamp) for name in list(self._local)),
+        )
+        self.ticks += 1
+
+    async def _sample_server(self, key: Tuple[str, str], timestamp: float):
+        entity, id = key
+        method, idField, entryType, _ = SERVER_STATS[entity]
+        try:
+            async with self._limit:
+                stats = await self._request(method, {idField: id}, timeout=self.interval)
+        except ProtooError as e:
+            self.errors += 1
+            if isinstance(e, ProtooRequestError) and "not found" in str(e.errorReason):
+                self.remove(entity, id)
+            return
+        entry = next(
+            (item for item in stats or [] if item.get("type") == entryType), None
+        )
+        if entry is not None and key in self._entities:
+            self._entities[key][1].append(timestamp, entry)
+
+    async def _sample_local(self, name: str, timestamp: float):
+        get_pc, ring = self._local[name]
+        pc = get_pc()
+        if pc is None:
+            return
+        try:
+            report = await pc.getStats()
+        except Exception:
+            self.errors += 1
+            return
+        sample: Dict[str, float] = {}
+        for stats in report.values():
+            for attribute, field in LOCAL_STATS.get(stats.type, ()):
+                value = getattr(stats, attribute, None)
+                if value is None:
+                    continue
+                if field in CUMULATIVE:
+                    sample[field] = sample.get(field, 0) + value
+                else:
+                    sample[field] = max(sample.get(field, 0), value)
+        ring.append(timestamp, sample)
+
+    def summary(self) -> dict:
+        """
+        Per entity type and kind (and per local connection): the mean, min
+        and max of every field over the stored samples, and the last value
+        of cumulative counters, summed over entities.
+        """
+        groups: Dict[str, Dict[str, List[StatsRing]]] = {}
+        for (entity, _), (kind, ring) in self._entities.items():
+            groups.setdefault(f"{entity}s", {}).setdefault(kind, []).append(ring)
+        for name, (_, ring) in self._local.items():
+            groups.setdefault("local", {})[name] = [ring]
+
+        result = {"interval": self.interval, "ticks": self.ticks, "errors": self.errors}
+        for group, kinds in groups.items():
+            result[group] = {
+                kind: _summarize(rings) for kind, rings in kinds.items()
+            }
+        return result
+
+
+def _summarize(rings: List[StatsRing]) -> dict:
+    summary = {
+        "count": len(rings),
+        "samples": sum(min(ring.count, ring.capacity) for ring in rings),
+    }
+    for field in rings[0].fields:
+        if field in CUMULATIVE:
+            lasts = [value for ring in rings for value in ring.column(field)[-1:]]
+            if lasts:
+                summary[field] = sum(lasts)
+            continue
+        values = [value for ring in rings for value in ring.column(field)]
+        if values:
+            summary[field] = {"mean": sum(values) / len(values), "min": min(values), "max": max(values)}
+    return summary
@@ -0,0 +1,283 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from typing import Callable, Dict, List, Optional
+
+from engine import DoneCallback, EngineFull, SessionEngine
+import metrics
+
+# Called with (session id, *submitted args) for sessions lost with a worker
+LostCallback = Callable[..., None]
+
+# How often workers report their engine stats (seconds)
+STATS_INTERVAL = 1.0
+
+
+def worker_main(conn, max_sessions: int, max_queue: int, warmup=None):
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    engine = SessionEngine(
+        max_sessions=max_sessions,
+        max_queue=max_queue,
+        on_done=lambda session_id, failed: send(("done", session_id, failed)),
+        warmup=warmup,
+    )
+
+    def report_stats():
+        while True:
+            send(("stats", engine.stats()))
+            send(("sessions", engine.sessions()))
+            send(("metrics", metrics.collect()))
+            time.sleep(STATS_INTERVAL)
+
+    threading.Thread(target=report_stats, daemon=True).start()
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == "submit":
+            _, session_id, factory, args, info = message
+            try:
+                engine.submit(factory, *args, session_id=session_id, info=info)
+            except EngineFull:
+                send(("done", session_id, True))
+        elif message[0] == "cancel":
+            engine.cancel(message[1])
+        elif message[0] == "stop":
+            break
+    engine.shutdown()
+
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.restarts = -1
+        # session id -> submitted args, for sessions assigned to this worker
+        self.sessions: Dict[str, tuple] = {}
+        # session id -> session entry, as submitted and then as last reported
+        # by the worker's engine
+        self.entries: Dict[str, dict] = {}
+        self.stats: dict = {}
+        # Metric families last collected in the worker process
+        self.metrics: list = []
+
+
+class Supervisor:
+    """
+    Pre-forks one worker process per core, each running its own
+    SessionEngine (and therefore its own event loop and GIL).
+
+    ``submit`` routes a session to the worker with the fewest assigned
+    sessions; ``sessions`` and ``cancel`` work as on SessionEngine, with
+    session states as of the workers' last report. A worker that exits is
+    restarted and the sessions it was running are handed to ``on_lost``, so
+    callers can report them. ``on_done`` is called in the supervisor process
+    as each session ends, lost ones included (as failed). Factories and their
+    arguments must be picklable.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_sessions: int = 8,
+        max_queue: int = 32,
+        on_lost: Optional[LostCallback] = None,
+        warmup=None,
+        on_done: Optional[DoneCallback] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self._on_lost = on_lost
+        self._on_done = on_done
+        # Run by every worker's engine as it starts; must be picklable
+        self._warmup = warmup
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._workers: List[_Worker] = [
+            _Worker(index) for index in range(workers or os.cpu_count() or 1)
+        ]
+        self._closed = False
+        for worker in self._workers:
+            self._start(worker)
+
+    def _start(self, worker: _Worker):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=worker_main,
+            args=(child_conn, self.max_sessions, self.max_queue, self._warmup),
+            name=f"session-worker-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker.process = process
+        worker.conn = parent_conn
+        worker.restarts += 1
+        worker.stats = {}
+        worker.metrics = []
+        threading.Thread(
+            target=self._read, args=(worker, parent_conn), daemon=True
+        ).start()
+
+    def _read(self, worker: _Worker, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                if message[0] == "stats":
+                    worker.stats = message[1]
+                elif message[0] == "sessions":
+                    for session in message[1]:
+                        if session["session_id"] in worker.entries:
+                            worker.entries[session["session_id"]].update(session)
+                elif message[0] == "metrics":
+                    worker.metrics = message[1]
+                elif message[0] == "done":
+                    worker.sessions.pop(message[1], None)
+                    worker.entries.pop(message[1], None)
+            if message[0] == "done" and self._on_done is not None:
+                self._on_done(message[1], message[2])
+        conn.close()
+        self._on_worker_exit(worker)
+
+    def _on_worker_exit(self, worker: _Worker):
+        worker.process.join()
+        with self._lock:
+            lost = worker.sessions
+            worker.sessions = {}
+            worker.entries = {}
+            if not self._closed:
+                print(
+                    f"Worker {worker.index} exited with code {worker.process.exitcode},"
+                    f" restarting ({len(lost)} sessions lost)"
+                )
+                self._start(worker)
+        for session_id, args in lost.items():
+            if self._on_lost is not None:
+                self._on_lost(session_id, *args)
+            if self._on_done is not None:
+                self._on_done(session_id, True)
+
+    def submit(
+        self,
+        factory,
+        *args,
+        session_id: Optional[str] = None,
+        info: Optional[dict] = None,
+    ) -> str:
+        with self._lock:
+            capacity = self.max_sessions + self.max_queue
+            candidates = [
+                worker
+                for worker in self._workers
+                if worker.process.is_alive() and len(worker.sessions) < capacity
+            ]
+            if not candidates:
+                raise EngineFull(f"all {len(self._workers)} workers are at capacity")
+            worker = min(candidates, key=lambda worker: len(worker.sessions))
+            session_id = session_id or uuid.uuid4().hex
+            try:
+                worker.conn.send(("submit", session_id, factory, args, info))
+            except OSError as e:
+                raise EngineFull(f"worker {worker.index} unavailable: {e}")
+            worker.sessions[session_id] = args
+            worker.entries[session_id] = {
+                "session_id": session_id,
+                "state": "queued",
+                "submitted_at": time.time(),
+                "started_at": None,
+                **(info or {}),
+                "worker": worker.index,
+            }
+        return session_id
+
+    def sessions(self) -> List[dict]:
+        with self._lock:
+            return [
+                dict(entry)
+                for worker in self._workers
+                for entry in worker.entries.values()
+            ]
+
+    def session(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            for worker in self._workers:
+                if session_id in worker.entries:
+                    return dict(worker.entries[session_id])
+        return None
+
+    def cancel(self, session_id: str) -> bool:
+        with self._lock:
+            for worker in self._workers:
+                if session_id in worker.entries:
+                    try:
+                        worker.conn.send(("cancel", session_id))
+                    except OSError:
+                        return False
+                    worker.entries[session_id]["state"] = "cancelling"
+                    return True
+        return False
+
+    @property
+    def ready(self) -> bool:
+        # Every live worker finished its warm-up (a restarted one has not
+        # reported yet)
+        with self._lock:
+            alive = [worker for worker in self._workers if worker.process.is_alive()]
+            return bool(alive) and all(worker.stats.get("ready", False) for worker in alive)
+
+    def stats(self) -> dict:
+        with self._lock:
+            workers = [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid,
+                    "alive": worker.process.is_alive(),
+                    "restarts": worker.restarts,
+                    "sessions": len(worker.sessions),
+                    **worker.stats,
+                }
+                for worker in self._workers
+            ]
+        totals = {
+            key: sum(worker.get(key, 0) for worker in workers)
+            for key in ("active", "queued", "completed", "failed", "cancelled")
+        }
+        return {
+            **totals,
+            "max_sessions": self.max_sessions * len(workers),
+            "max_queue": self.max_queue * len(workers),
+            "ready": self.ready,
+            "workers": workers,
+        }
+
+    def metric_families(self) -> List[tuple]:
+        """
+        Returns (worker index, metric families) as last reported by each
+        worker process.
+        """
+        with self._lock:
+            return [(worker.index, worker.metrics) for worker in self._workers]
+
+    def shutdown(self, timeout: float = 10):
+        with self._lock:
+            self._closed = True
+            for worker in self._workers:
+                try:
+                    worker.conn.send(("stop",))
+                except OSError:
+                    pass
+        for worker in self._workers:
+            worker.process.join(timeout)
@@ -0,0 +1,335 @@
+import os
+import csv
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from aiortc.contrib.media import MediaBlackhole
+
+from mediasoup import Demo
+from datachannel import DataLoad
+from device_cache import RouterCapabilitiesCache
+from warm_pool import WarmPool
+from receive_sink import ReceiveSink
+from simulcast import parse_layers
+from standin import start_in_thread
+
+# Swarm load generator: runs many Demo peers spread over rooms, optionally
+# sharded across processes, and reports per-milestone latency percentiles.
+# Without --wsurl the peers connect to a local stand-in protoo server.
+
+# Milestones reported per peer, in milliseconds from the peer's start
+METRICS = [
+    "connect_ms",
+    "join_ms",
+    "transport_connect_ms",
+    "first_produce_ms",
+    "first_consume_ms",
+]
+
+# Received media per peer, counted when consumers are measured
+RECEIVED = ["received_packets", "received_bytes", "received_frames"]
+
+# Media quality per peer as reported by the server, with --stats-interval
+QUALITY = [
+    "producer_kbps",
+    "consumer_kbps",
+    "consumer_rtt_ms",
+    "consumer_loss_pct",
+    "consumer_score",
+]
+
+# Websocket or ICE outages per peer and the longest time to recover, with
+# --reconnect
+RECOVERY = ["recoveries", "recovery_ms"]
+
+# Data channel load per peer, with --data-size
+DATA = [
+    "data_sent_kbps",
+    "data_received_kbps",
+    "data_loss_pct",
+    "data_latency_ms",
+]
+
+
+def quality(summary: dict) -> dict:
+    # Means per kind (audio, video), as StatsSampler.summary() reports them
+    def means(group, field):
+        kinds = summary.get(group, {}).values()
+        return [kind[field]["mean"] for kind in kinds if field in kind]
+
+    def mean(group, field):
+        values = means(group, field)
+        return sum(values) / len(values) if values else None
+
+    def total(group, field):
+        values = means(group, field)
+        return sum(values) if values else None
+
+    def scaled(value, factor):
+        return None if value is None else value * factor
+
+    return {
+        "producer_kbps": scaled(total("producers", "bitrate"), 1 / 1000),
+        "consumer_kbps": scaled(total("consumers", "bitrate"), 1 / 1000),
+        "consumer_rtt_ms": mean("consumers", "roundTripTime"),
+        # mediasoup reports fractionLost as a fraction of 256
+        "consumer_loss_pct": scaled(mean("consumers", "fractionLost"), 100 / 256),
+        "consumer_score": mean("consumers", "score"),
+    }
+
+
+def data_load(summary: dict) -> dict:
+    sent, received = summary["sent"], summary["received"]
+    return {
+        "data_sent_kbps": sent["throughput_kbps"],
+        "data_received_kbps": received["throughput_kbps"] if received["consumers"] else None,
+        "data_loss_pct": received["loss_pct"] if received["consumers"] else None,
+        "data_latency_ms": received["latency_mean_ms"] if received["messages"] else None,
+    }
+
+
+def milestones(timings: dict) -> dict:
+    def end(name):
+        phase = timings.get(name)
+        if phase is None:
+            return None
+        return phase["start_ms"] + phase["duration_ms"]
+
+    def at(name):
+        mark = timings.get(name)
+        return mark["at_ms"] if mark else None
+
+    return {
+        "connect_ms": end("connect"),
+        "join_ms": end("join"),
+        "transport_connect_ms": at("transportConnect"),
+        "first_produce_ms": at("firstProducer"),
+        "first_consume_ms": at("firstConsumer"),
+    }
+
+
+def peer_uri(ws_url: str, room: str, peer_id: str) -> str:
+    separator = "&" if "?" in ws_url else "?"
+    return f"{ws_url}{separator}roomId={room}&peerId={peer_id}"
+
+
+async def run_peer(index: int, shard: int, options: dict) -> dict:
+    room = f"swarm-{index % options['rooms']}"
+    result = {"peer": index, "room": room, "shard": shard, "error": None}
+    demo = None
+    recorder = ReceiveSink() if options["receive"] == "measure" else MediaBlackhole()
+    try:
+        demo = Demo(
+            uri=peer_uri(options["ws_url"], room, f"swarm-peer-{index}"),
+            recorder=recorder,
+            time=options["timeout"],
+            fast_start=options["fast_start"],
+            linger=options["duration"],
+            capabilities_cache=options.get("capabilities_cache"),
+            stats_interval=options["stats_interval"],
+            simulcast=parse_layers(options["simulcast"]) if options["simulcast"] else None,
+            adaptive_encoding=options["adaptive"],
+            layer_control=options["layer_control"],
+            data_load=DataLoad(**options["data_load"]) if options["data_load"] else None,
+            reconnect=options["reconnect"],
+            # False unless --warm-pool, which run_shard replaces by the pool
+            warm_pool=options["warm_pool"] or None,
+        )
+        await demo.run()
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if demo is not None:
+            result.update(milestones(demo.timings.as_dict()))
+            if demo.stats is not None:
+                result.update(quality(demo.stats.summary()))
+            if demo.data is not None:
+                result.update(data_load(demo.data.summary()))
+            if options["reconnect"]:
+                result["recoveries"] = len(demo.recoveries)
+                result["recovery_ms"] = max(
+                    (item["seconds"] * 1000 for item in demo.recoveries), default=None
+                )
+            if isinstance(recorder, ReceiveSink):
+                totals = recorder.summary().values()
+                result["received_packets"] = sum(total["packets"] for total in totals)
+                result["received_bytes"] = sum(total["bytes"] for total in totals)
+                result["received_frames"] = sum(total["frames"] for total in totals)
+            try:
+                await demo.close()
+            except Exception:
+                pass
+    if result["error"] is None and demo is not None and any(
+        item["result"] == "failed" for item in demo.recoveries
+    ):
+        result["error"] = "recovery failed"
+    return result
+
+
+async def run_shard(indices: List[int], shard: int, options: dict) -> List[dict]:
+    if options["capabilities_ttl"] > 0:
+        # One cache per shard process, shared by all of its peers
+        options = {
+            **options,
+            "capabilities_cache": RouterCapabilitiesCache(ttl=options["capabilities_ttl"]),
+        }
+    if options["warm_pool"]:
+        # Warmed before the first peer of the shard starts
+        options = {**options, "warm_pool": WarmPool()}
+        await options["warm_pool"].warm()
+
+    async def delayed(index):
+        # Peers of every shard share one ramp schedule
+        delay = options["start_at"] + index / options["ramp"] - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return await run_peer(index, shard, options)
+
+    return list(await asyncio.gather(*(delayed(index) for index in indices)))
+
+
+def shard_main(indices: List[int], shard: int, options: dict) -> List[dict]:
+    if options["verbose"]:
+        return asyncio.run(run_shard(indices, shard, options))
+    # Demo logs every signaling message; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return asyncio.run(run_shard(indices, shard, options))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def report(results: List[dict], elapsed: float):
+    failed = [result for result in results if result["error"]]
+    print(
+        f"{len(results)} peers in {elapsed:.1f} s, {len(results) - len(failed)} ok,"
+        f" {len(failed)} errors"
+    )
+    print(f"{'milestone':>22} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for metric in METRICS + QUALITY + DATA + RECOVERY:
+        values = [result[metric] for result in results if result.get(metric) is not None]
+        if not values:
+            if metric in METRICS:
+                print(f"{metric:>22} {0:>6}")
+            continue
+        print(
+            f"{metric:>22} {len(values):>6}"
+            + "".join(f" {percentile(values, p):>9.1f}" for p in (50, 95, 99))
+            + f" {max(values):>9.1f}"
+        )
+    for error, count in Counter(result["error"] for result in failed).most_common(5):
+        print(f"{count:>6} x {error}")
+
+
+def write_results(results: List[dict], path: str):
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(
+                file,
+                fieldnames=["peer", "room", "shard", "error", *METRICS, *RECEIVED, *QUALITY, *DATA, *RECOVERY],
+                restval="",
+            )
+            writer.writeheader()
+            for result in results:
+                writer.writerow(result)
+    else:
+        with open(path, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+def main(args) -> Optional[int]:
+    server = None
+    ws_url = args.wsurl
+    if not ws_url:
+        server = start_in_thread(latency=args.latency, consumers=args.consumers)
+        ws_url = server.url
+
+    processes = args.processes if args.processes > 0 else os.cpu_count() or 1
+    options = {
+        "ws_url": ws_url,
+        "rooms": args.rooms,
+        "ramp": args.ramp,
+        "duration": args.duration,
+        "timeout": args.timeout,
+        "fast_start": args.fast_start,
+        "capabilities_ttl": args.capabilities_ttl,
+        "receive": args.receive,
+        "stats_interval": args.stats_interval,
+        "simulcast": args.simulcast,
+        "adaptive": args.adaptive,
+        "layer_control": args.layer_control,
+        "reconnect": args.reconnect,
+        "warm_pool": args.warm_pool,
+        # Plain values, so they pass to worker processes as is
+        "data_load": {
+            "size": args.data_size,
+            "rate": args.data_rate,
+            "ordered": not args.data_unordered,
+            "maxPacketLifeTime": args.data_lifetime,
+            "maxRetransmits": args.data_retransmits,
+        } if args.data_size else None,
+        "verbose": args.verbose,
+        # Leave time for worker processes to start before the first peer
+        "start_at": time.time() + (1 if processes > 1 else 0),
+    }
+    shards = [list(range(args.peers))[shard::processes] for shard in range(processes)]
+
+    started = time.monotonic()
+    if processes == 1:
+        results = shard_main(shards[0], 0, options)
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(processes, mp_context=context) as pool:
+            futures = [
+                pool.submit(shard_main, indices, shard, options)
+                for shard, indices in enumerate(shards)
+            ]
+            results = [result for future in futures for result in future.result()]
+    elapsed = time.monotonic() - started
+
+    results.sort(key=lambda result: result["peer"])
+    report(results, elapsed)
+    if args.output:
+        write_results(results, args.output)
+        print(f"Raw results written to {args.output}")
+    return 1 if any(result["error"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Swarm load generator built on Demo")
+    parser.add_argument("--peers", type=int, default=10, help="Number of peers")
+    parser.add_argument("--rooms", type=int, default=1, help="Number of rooms the peers are spread over")
+    parser.add_argument("--ramp", type=float, default=10, help="Peers started per second")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds each peer stays in its room")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes, -1 for one per core")
+    parser.add_argument("--timeout", type=float, default=30, help="Bring-up timeout per peer (s)")
+    parser.add_argument("--fast-start", action="store_true", help="Run independent bring-up steps concurrently.")
+    parser.add_argument("--capabilities-ttl", type=float, default=0, help="Cache router capabilities and a loaded Device for this many seconds")
+    parser.add_argument("--wsurl", help="protoo server URL; a local stand-in server is started if omitted")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stand-in per-request delay (s)")
+    parser.add_argument("--consumers", type=int, default=1, help="Stand-in newConsumer requests per join")
+    parser.add_argument("--receive", choices=["measure", "decode"], default="measure", help="Count received media without decoding it, or decode and discard it")
+    parser.add_argument("--stats-interval", type=float, default=0, help="Poll server media stats every this many seconds and report bitrate, RTT, loss and score")
+    parser.add_argument("--simulcast", help="Send video as simulcast layers, scale:maxBitrate per layer, lowest first")
+    parser.add_argument("--adaptive", action="store_true", help="Adapt video bitrate and resolution to the uplink")
+    parser.add_argument("--layer-control", action="store_true", help="Ask for lower consumer layers while overloaded")
+    parser.add_argument("--data-size", type=int, default=0, help="Send binary data channel messages of this many bytes; 0 disables")
+    parser.add_argument("--data-rate", type=float, default=0, help="Data channel messages per second, 0 for as fast as the channel drains")
+    parser.add_argument("--data-unordered", action="store_true", help="Send data channel messages unordered")
+    parser.add_argument("--data-lifetime", type=int, help="Give up on data channel messages after this many milliseconds")
+    parser.add_argument("--data-retransmits", type=int, help="Give up on data channel messages after this many retransmissions")
+    parser.add_argument("--reconnect", action="store_true", help="Reconnect and recover media when the websocket or ICE drops")
+    parser.add_argument("--warm-pool", action="store_true", help="Share pooled DTLS certificates and native capabilities between the peers of a shard")
+    parser.add_argument("--output", help="Write raw per-peer results to this .csv or .json file")
+    parser.add_argument("--verbose", action="store_true", help="Show Demo output")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,278 @@
+import time
+import asyncio
+import threading
+from fractions import Fraction
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from av import AudioFrame, VideoFrame
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = Fraction(1, VIDEO_CLOCK_RATE)
+# Audio is produced in 20 ms frames, the Opus frame size
+AUDIO_PTIME = 0.020
+
+# Every video frame carries its sequence number and send time (milliseconds,
+# modulo 2^32) as two rows of 32 black or white blocks in the top-left
+# corner, coarse enough to survive lossy encoding
+STAMP_BITS = 32
+STAMP_BLACK = 16
+STAMP_WHITE = 235
+
+# Frames in a video ring; the sweeping bar makes a full pass per ring
+VIDEO_RING_FRAMES = 10
+
+# 75% colour bars (white, yellow, cyan, green, magenta, red, blue) in YUV
+BARS = [
+    (180, 128, 128),
+    (162, 44, 142),
+    (131, 156, 44),
+    (112, 72, 58),
+    (84, 184, 198),
+    (65, 100, 212),
+    (35, 212, 114),
+]
+
+_rings: Dict[tuple, tuple] = {}
+_rings_lock = threading.Lock()
+
+
+def _stamp_block(width: int) -> int:
+    # Two rows of 32 blocks, even-sized so they align with the chroma planes
+    return max(4, (width // (STAMP_BITS + STAMP_BITS // 2)) & ~1)
+
+
+def _video_ring(width: int, height: int, frames: int, pattern: str) -> tuple:
+    key = ("video", width, height, frames, pattern)
+    with _rings_lock:
+        if key not in _rings:
+            ys = np.empty((frames, height, width), np.uint8)
+            us = np.empty((frames, height // 2, width // 2), np.uint8)
+            vs = np.empty((frames, height // 2, width // 2), np.uint8)
+            if pattern == "black":
+                ys[:] = STAMP_BLACK
+                us[:] = vs[:] = 128
+            else:
+                edges = np.linspace(0, width, len(BARS) + 1).astype(int)
+                for (y, u, v), start, end in zip(BARS, edges, edges[1:]):
+                    ys[:, :, start:end] = y
+                    us[:, :, start // 2 : end // 2] = u
+                    vs[:, :, start // 2 : end // 2] = v
+                # A white bar sweeping across the frame once per ring, so
+                # consecutive frames differ like real video
+                bar = max(2, width // 40) & ~1
+                for index in range(frames):
+                    x = (index * (width - bar) // max(frames - 1, 1)) & ~1
+                    ys[index, height * 3 // 4 :, x : x + bar] = 235
+                    us[index, height * 3 // 8 :, x // 2 : (x + bar) // 2] = 128
+                    vs[index, height * 3 // 8 :, x // 2 : (x + bar) // 2] = 128
+            # Neutral background behind the stamp
+            block = _stamp_block(width)
+            ys[:, : 2 * block, : STAMP_BITS * block] = STAMP_BLACK
+            us[:, :block, : STAMP_BITS * block // 2] = 128
+            vs[:, :block, : STAMP_BITS * block // 2] = 128
+            for ring in (ys, us, vs):
+                ring.setflags(write=False)
+            _rings[key] = (ys, us, vs)
+        return _rings[key]
+
+
+def _audio_ring(sample_rate: int, frequency: float, pattern: str) -> np.ndarray:
+    key = ("audio", sample_rate, frequency, pattern)
+    with _rings_lock:
+        if key not in _rings:
+            samples = int(sample_rate * AUDIO_PTIME)
+            # One second of audio, which holds a whole number of periods of any
+            # integer frequency, so the ring loops without a click
+            frames = int(round(1 / AUDIO_PTIME))
+            if pattern == "silence":
+                mono = np.zeros(frames * samples)
+            else:
+                t = np.arange(frames * samples) / sample_rate
+                mono = 0.25 * np.sin(2 * np.pi * frequency * t)
+            pcm = (mono * 32767).astype(np.int16)
+            # Interleaved stereo, one row per frame
+            ring = np.repeat(pcm, 2).reshape(frames, samples * 2)
+            ring.setflags(write=False)
+            _rings[key] = ring
+        return _rings[key]
+
+
+def _plane(frame, index: int, width: int, height: int) -> np.ndarray:
+    plane = frame.planes[index]
+    view = np.frombuffer(plane, np.uint8).reshape(height, plane.line_size)
+    return view[:, :width]
+
+
+def read_stamp(frame: VideoFrame) -> Optional[Tuple[int, int]]:
+    """
+    Returns the (sequence number, send time in ms modulo 2^32) stamped on a
+    frame sent by SyntheticVideoTrack, or None if the frame is too small.
+    """
+    frame = frame.reformat(format="yuv420p")
+    block = _stamp_block(frame.width)
+    if STAMP_BITS * block > frame.width or 2 * block > frame.height:
+        return None
+    y = _plane(frame, 0, frame.width, frame.height)
+    centres = np.arange(STAMP_BITS) * block + block // 2
+    values = []
+    for row in range(2):
+        bits = y[row * block + block // 2, centres] > (STAMP_BLACK + STAMP_WHITE) // 2
+        values.append(int(np.packbits(bits).view(">u4")[0]))
+    return values[0], values[1]
+
+
+class SyntheticVideoTrack(MediaStreamTrack):
+    """
+    Colour bars (or black) cycling through a ring of frames that is built
+    once per process and shared by every track with the same settings.
+
+    Each track reuses a small pool of frames; a frame is only handed out
+    again after the sender has moved on to the next one, so steady-state
+    sending allocates nothing. Every frame is stamped with its sequence
+    number and send time, see ``read_stamp``.
+    """
+
+    kind = "video"
+
+    def __init__(
+        self,
+        width: int = 640,
+        height: int = 480,
+        fps: int = 30,
+        pattern: str = "bars",
+        pool_size: int = 2,
+    ):
+        super().__init__()
+        self.width = width & ~1
+        self.height = height & ~1
+        self.fps = fps
+        self._ring = _video_ring(self.width, self.height, VIDEO_RING_FRAMES, pattern)
+        self._pool = [VideoFrame(self.width, self.height, "yuv420p") for _ in range(pool_size)]
+        self._views = [
+            (
+                _plane(frame, 0, self.width, self.height),
+                _plane(frame, 1, self.width // 2, self.height // 2),
+                _plane(frame, 2, self.width // 2, self.height // 2),
+            )
+            for frame in self._pool
+        ]
+        block = _stamp_block(self.width)
+        # The stamp area of each pooled frame as (row, block line, bit, block column)
+        self._stamps = [
+            y[: 2 * block, : STAMP_BITS * block].reshape(2, block, STAMP_BITS, block)
+            for y, _, _ in self._views
+        ]
+        self._shifts = np.arange(STAMP_BITS - 1, -1, -1, dtype=np.uint32)
+        self._values = np.zeros((2, 1), np.uint32)
+        self._levels = np.zeros((2, STAMP_BITS), np.uint8)
+        self._sequence = 0
+        self._start: Optional[float] = None
+
+    async def recv(self) -> VideoFrame:
+        if self.readyState != "live":
+            raise MediaStreamError
+
+        sequence = self._sequence
+        self._sequence += 1
+        if self._start is None:
+            self._start = time.time()
+        wait = self._start + sequence / self.fps - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        slot = sequence % len(self._pool)
+        frame = self._pool[slot]
+        y, u, v = self._views[slot]
+        index = sequence % len(self._ring[0])
+        np.copyto(y, self._ring[0][index])
+        np.copyto(u, self._ring[1][index])
+        np.copyto(v, self._ring[2][index])
+        self._stamp(self._stamps[slot], sequence, int(time.time() * 1000))
+
+        frame.pts = sequence * VIDEO_CLOCK_RATE // self.fps
+        frame.time_base = VIDEO_TIME_BASE
+        return frame
+
+    def _stamp(self, stamp: np.ndarray, sequence: int, sent_ms: int):
+        self._values[0, 0] = sequence & 0xFFFFFFFF
+        self._values[1, 0] = sent_ms & 0xFFFFFFFF
+        bits = (self._values >> self._shifts) & 1
+        np.copyto(self._levels, STAMP_BLACK + bits * (STAMP_WHITE - STAMP_BLACK), casting="unsafe")
+        stamp[...] = self._levels[:, None, :, None]
+
+
+class SyntheticAudioTrack(MediaStreamTrack):
+    """
+    A tone (or silence) as 20 ms stereo frames taken from a one-second ring
+    shared by every track with the same settings. The default 48 kHz stereo
+    s16 is what the Opus encoder takes, so nothing is resampled.
+    """
+
+    kind = "audio"
+
+    def __init__(
+        self,
+        sample_rate: int = 48000,
+        frequency: float = 440,
+        pattern: str = "tone",
+        pool_size: int = 2,
+    ):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self._samples = int(sample_rate * AUDIO_PTIME)
+        self._ring = _audio_ring(sample_rate, frequency, pattern)
+        self._pool = [
+            AudioFrame(format="s16", layout="stereo", samples=self._samples)
+            for _ in range(pool_size)
+        ]
+        for frame in self._pool:
+            frame.sample_rate = sample_rate
+            frame.time_base = Fraction(1, sample_rate)
+        self._views = [np.frombuffer(frame.planes[0], np.int16) for frame in self._pool]
+        self._sequence = 0
+        self._start: Optional[float] = None
+
+    async def recv(self) -> AudioFrame:
+        if self.readyState != "live":
+            raise MediaStreamError
+
+        sequence = self._sequence
+        self._sequence += 1
+        if self._start is None:
+            self._start = time.time()
+        wait = self._start + sequence * AUDIO_PTIME - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        frame = self._pool[sequence % len(self._pool)]
+        view = self._views[sequence % len(self._pool)]
+        np.copyto(view[: self._ring.shape[1]], self._ring[sequence % len(self._ring)])
+        frame.pts = sequence * self._samples
+        return frame
+
+
+class SyntheticSource:
+    """
+    Synthetic ``audio`` and ``video`` tracks, exposed like a MediaPlayer so
+    they can be handed to Demo directly.
+    """
+
+    def __init__(
+        self,
+        width: int = 640,
+        height: int = 480,
+        fps: int = 30,
+        pattern: str = "bars",
+        sample_rate: int = 48000,
+        frequency: float = 440,
+    ):
+        self.video = SyntheticVideoTrack(width, height, fps, pattern)
+        self.audio = SyntheticAudioTrack(
+            sample_rate, frequency, "silence" if pattern == "black" else "tone"
+        )
+
+    def close(self):
+        self.audio.stop()
+        self.video.stop()
@@ -0,0 +1,47 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+
+class PhaseTimer:
+    """
+    Records when each named phase of a session started and how long it took,
+    relative to the moment the timer was created. Phases may overlap.
+    ``on_phase`` is called with (name, seconds) as each phase ends, including
+    phases that raise.
+    """
+
+    def __init__(self, on_phase: Optional[Callable[[str, float], None]] = None):
+        self._on_phase = on_phase
+        self._origin = time.monotonic()
+        # name -> (start offset, duration) in seconds
+        self._phases: Dict[str, Tuple[float, float]] = {}
+        # name -> offset in seconds
+        self._marks: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            self._phases[name] = (start - self._origin, end - start)
+            if self._on_phase is not None:
+                self._on_phase(name, end - start)
+
+    def mark(self, name: str):
+        if name not in self._marks:
+            self._marks[name] = time.monotonic() - self._origin
+
+    def duration(self, name: str) -> float:
+        return self._phases[name][1]
+
+    def as_dict(self) -> dict:
+        result = {
+            name: {"start_ms": start * 1000, "duration_ms": duration * 1000}
+            for name, (start, duration) in self._phases.items()
+        }
+        for name, offset in self._marks.items():
+            result[name] = {"at_ms": offset * 1000}
+        return result
@@ -0,0 +1,172 @@
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+import aiortc.rtcpeerconnection
+from aiortc.rtcdtlstransport import RTCCertificate
+from pymediasoup import AiortcHandler
+from pymediasoup.rtp_parameters import RtpCapabilities
+
+# aiortc certificates are valid for 30 days from their creation
+MAX_CERTIFICATE_LIFETIME = 29 * 24 * 3600
+# Share of its lifetime after which a certificate's replacement is generated
+RENEW_AT = 0.9
+
+
+class PooledCertificate(RTCCertificate):
+    """
+    An RTCCertificate shared by many peer connections. Its fingerprints and
+    the DTLS context built from it are computed once instead of per
+    connection; OpenSSL contexts are shared by the connections made from them.
+    """
+
+    def __init__(self, key, cert):
+        super().__init__(key, cert)
+        self.created = time.monotonic()
+        self._fingerprints = None
+        self._contexts: Dict[Tuple, object] = {}
+
+    def getFingerprints(self):
+        if self._fingerprints is None:
+            self._fingerprints = super().getFingerprints()
+        return list(self._fingerprints)
+
+    def _create_ssl_context(self, srtp_profiles):
+        key = tuple(profile.openssl_profile for profile in srtp_profiles)
+        context = self._contexts.get(key)
+        if context is None:
+            context = self._contexts[key] = super()._create_ssl_context(srtp_profiles)
+        return context
+
+
+class WarmPool:
+    """
+    Keeps the parts of a peer connection that do not depend on the session
+    ready ahead of time, for every RTCPeerConnection of the process once
+    ``install`` was called:
+
+    - DTLS certificates. aiortc generates a key pair and a certificate per
+      peer connection; with the pool, connections share ``size`` certificates
+      that are replaced after ``lifetime`` seconds by ones generated in the
+      background shortly before.
+    - The native RTP capabilities a Device is loaded with. aiortc's handler
+      gets them by building a throwaway RTCPeerConnection with an offer per
+      Device; handlers from ``handlerFactory`` take them from the pool.
+    """
+
+    def __init__(self, lifetime: float = 3600, size: int = 1):
+        self.lifetime = min(lifetime, MAX_CERTIFICATE_LIFETIME)
+        self.size = size
+        self._certificates: List[PooledCertificate] = []
+        # Generated ahead to replace certificates about to expire
+        self._spares: List[PooledCertificate] = []
+        self._next = 0
+        self._renewing: Optional[asyncio.Future] = None
+        self._warming: Optional[asyncio.Future] = None
+        self._installed = False
+        self._nativeRtpCapabilities: Optional[RtpCapabilities] = None
+        self.generated = 0
+        self.handed_out = 0
+
+    def install(self):
+        """Makes every new RTCPeerConnection take its certificate from the pool."""
+        if self._installed:
+            return
+        self._installed = True
+        pool = self
+
+        class Certificate(RTCCertificate):
+            @classmethod
+            def generateCertificate(cls):
+                return pool.certificate()
+
+        aiortc.rtcpeerconnection.RTCCertificate = Certificate
+
+    async def warm(self):
+        """
+        Fills the pool and loads the native capabilities, off any session's
+        path. Sessions starting meanwhile wait for the same warm-up.
+        """
+        if self._warming is None:
+            self._warming = asyncio.ensure_future(self._warm())
+        await asyncio.shield(self._warming)
+
+    async def _warm(self):
+        loop = asyncio.get_running_loop()
+        while len(self._certificates) < self.size:
+            self._certificates.append(await loop.run_in_executor(None, self._generate))
+        await self.nativeRtpCapabilities()
+
+    def certificate(self) -> PooledCertificate:
+        now = time.monotonic()
+        self._certificates = [
+            certificate
+            for certificate in self._certificates
+            if now - certificate.created < self.lifetime
+        ]
+        self._spares = [spare for spare in self._spares if now - spare.created < self.lifetime]
+        while len(self._certificates) < self.size:
+            # Expired: the replacement generated ahead, otherwise (not warmed,
+            # or it is not ready yet) one generated on the spot
+            self._certificates.append(self._spares.pop(0) if self._spares else self._generate())
+        if any(
+            now - certificate.created > self.lifetime * RENEW_AT
+            for certificate in self._certificates
+        ):
+            self._renew()
+        certificate = self._certificates[self._next % len(self._certificates)]
+        self._next += 1
+        self.handed_out += 1
+        return certificate
+
+    def _generate(self) -> PooledCertificate:
+        self.generated += 1
+        return PooledCertificate.generateCertificate()
+
+    def _renew(self):
+        # Generates the replacement of a certificate close to expiring on a
+        # worker thread, one at a time
+        expiring = sum(
+            1
+            for certificate in self._certificates
+            if time.monotonic() - certificate.created > self.lifetime * RENEW_AT
+        )
+        if len(self._spares) >= expiring or self._renewing is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._renewing = loop.run_in_executor(None, self._generate)
+        self._renewing.add_done_callback(self._on_renewed)
+
+    def _on_renewed(self, future: asyncio.Future):
+        self._renewing = None
+        if not future.cancelled() and future.exception() is None:
+            self._spares.append(future.result())
+
+    async def nativeRtpCapabilities(self) -> RtpCapabilities:
+        if self._nativeRtpCapabilities is None:
+            # They only depend on the codecs aiortc supports
+            self._nativeRtpCapabilities = await AiortcHandler().getNativeRtpCapabilities()
+        return self._nativeRtpCapabilities.model_copy(deep=True)
+
+    def handlerFactory(self, tracks=None, loop=None):
+        return lambda: WarmHandler(self, tracks, loop)
+
+    def stats(self) -> dict:
+        return {
+            "certificates": len(self._certificates),
+            "spares": len(self._spares),
+            "generated": self.generated,
+            "handed_out": self.handed_out,
+        }
+
+
+class WarmHandler(AiortcHandler):
+    def __init__(self, pool: WarmPool, tracks=None, loop=None):
+        super().__init__(tracks, loop)
+        self._pool = pool
+
+    async def getNativeRtpCapabilities(self) -> RtpCapabilities:
+        return await self._pool.nativeRtpCapabilities()
@@ -0,0 +1,76 @@
+import os
+import sys
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc.contrib.media import MediaBlackhole  # noqa: E402
+
+from device_cache import RouterCapabilitiesCache  # noqa: E402
+from mediasoup import Demo  # noqa: E402
+from standin import StandInServer  # noqa: E402
+
+# Measures session bring-up against a local stand-in protoo server with an
+# artificial per-request latency, comparing the sequential path with
+# fast_start, and fast_start with a warm router capabilities cache.
+# "firstProducer" is the point where RTP would start flowing.
+
+PHASES = (
+    "connect",
+    "load",
+    "createSendTransport",
+    "createRecvTransport",
+    "join",
+    "produce",
+    "firstProducer",
+)
+
+
+async def bring_up(server, fast_start, capabilities_cache=None):
+    demo = Demo(
+        uri=server.url,
+        recorder=MediaBlackhole(),
+        fast_start=fast_start,
+        capabilities_cache=capabilities_cache,
+    )
+    try:
+        await demo.run()
+    finally:
+        await demo.close()
+    return demo.timings.as_dict()
+
+
+async def main(args):
+    server = StandInServer(latency=args.latency)
+    await server.start()
+    cache = RouterCapabilitiesCache()
+    # Fill the cache so every measured run hits it
+    await bring_up(server, True, cache)
+    variants = [
+        ("sequential", False, None),
+        ("fast_start", True, None),
+        ("fast_start + capabilities cache", True, cache),
+    ]
+    for label, fast_start, capabilities_cache in variants:
+        samples = [
+            await bring_up(server, fast_start, capabilities_cache) for _ in range(args.runs)
+        ]
+        print(f"{label} ({args.runs} runs, {args.latency * 1000:.0f} ms per request):")
+        for name in PHASES:
+            values = [
+                sample[name].get("duration_ms", sample[name].get("at_ms"))
+                for sample in samples
+                if name in sample
+            ]
+            if values:
+                print(f"  {name:>20}: {statistics.mean(values):8.1f} ms")
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Session bring-up benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.025)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.server
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import av
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from standin import StandInServer  # noqa: E402
+
+# Batch start: starts src/app.py, then launches --peers peers against a local
+# stand-in server once as that many concurrent /join-call requests and once
+# as one /join-calls batch, and reports how long the requests took, when the
+# peers joined (and the most joins within any 100 ms), the service's CPU time
+# and the callbacks it sent until every peer was done. Sessions leave after
+# SESSION_MAX_DURATION, since the stand-in routes no media.
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+class JoinClock(StandInServer):
+    # Records when each peer joins
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.joined = {}
+
+    def _on_join(self, peer, data):
+        self.joined[peer.peerId] = time.monotonic()
+        return super()._on_join(peer, data)
+
+
+def start_standin() -> JoinClock:
+    server = JoinClock()
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return server
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class CallbackHandler(http.server.BaseHTTPRequestHandler):
+    # Counts the callbacks PUT by the service
+    received = []
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        CallbackHandler.received.append(json.loads(body))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler) -> str:
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+def serve_clip(seconds: float) -> str:
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "clip.mp4")
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 320, 240, "yuv420p"
+        for _ in range(int(seconds * 30)):
+            frame = av.VideoFrame(width=320, height=240, format="yuv420p")
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode())
+    return serve(functools.partial(QuietHandler, directory=directory)) + "/clip.mp4"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, deadline: float):
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(url)
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def peak(times, window=0.1) -> int:
+    times = sorted(times)
+    most, start = 0, 0
+    for end, at in enumerate(times):
+        while at - times[start] > window:
+            start += 1
+        most = max(most, end - start + 1)
+    return most
+
+
+def individual(url, ws_urls, callback):
+    def post(ws_url):
+        requests.post(f"{url}/join-call", json={"ws_url": ws_url, "success_url": callback, "failure_url": callback})
+
+    with ThreadPoolExecutor(len(ws_urls)) as pool:
+        list(pool.map(post, ws_urls))
+    return len(ws_urls)
+
+
+def batch(url, ws_urls, callback, ramp):
+    requests.post(
+        f"{url}/join-calls",
+        json={"ws_urls": ws_urls, "ramp": ramp, "success_url": callback, "failure_url": callback},
+    )
+    return 1
+
+
+def run(label, number, standin, clip, callback, args):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "MAX_SESSIONS": str(args.peers),
+        "MAX_QUEUED_SESSIONS": str(args.peers),
+        "DEFAULT_VIDEO_SRC_URL": clip,
+        "MEDIA_CACHE_DIR": tempfile.mkdtemp(),
+        "SESSION_MAX_DURATION": str(args.duration),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "app.py"], cwd=SRC, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(f"{url}/ready", time.monotonic() + args.timeout)
+        peers = [f"{label}-{number}-{n}" for n in range(args.peers)]
+        ws_urls = [f"{standin.url}?roomId=batch&peerId={peer}" for peer in peers]
+        CallbackHandler.received.clear()
+        cpu = cpu_seconds(process.pid)
+        started = time.monotonic()
+        if label == "batch":
+            expected = batch(url, ws_urls, callback, args.ramp)
+        else:
+            expected = individual(url, ws_urls, callback)
+        posted = time.monotonic() - started
+        deadline = started + args.timeout
+        while len(CallbackHandler.received) < expected:
+            if time.monotonic() > deadline:
+                raise TimeoutError(label)
+            time.sleep(0.05)
+        done = time.monotonic() - started
+        cpu = cpu_seconds(process.pid) - cpu
+    finally:
+        process.terminate()
+        process.wait()
+    joins = [standin.joined[peer] for peer in peers if peer in standin.joined]
+    print(
+        f"{label:>10}: requests {posted * 1000:6.0f} ms, {len(joins)}/{args.peers} joined"
+        f" in {(max(joins) - min(joins)) * 1000:6.0f} ms (peak {peak(joins):3d} per 100 ms),"
+        f" done {done:5.1f} s, CPU {cpu:5.2f} s, {len(CallbackHandler.received)} callbacks"
+        f" ({', '.join(sorted({payload['status'] for payload in CallbackHandler.received}))})"
+    )
+
+
+def main(args):
+    standin = start_standin()
+    clip = serve_clip(args.clip)
+    callback = serve(CallbackHandler) + "/done"
+    for number in range(args.runs):
+        run("join-call", number, standin, clip, callback, args)
+        run("batch", number, standin, clip, callback, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch start benchmark")
+    parser.add_argument("--peers", type=int, default=50)
+    parser.add_argument("--ramp", type=float, default=25, help="Batch peers started per second")
+    parser.add_argument("--duration", type=float, default=2, help="SESSION_MAX_DURATION for the service")
+    parser.add_argument("--clip", type=float, default=2, help="Seconds of the default video")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120)
+    main(parser.parse_args())
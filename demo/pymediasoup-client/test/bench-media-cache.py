@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc.codecs.vpx import Vp8Encoder  # noqa: E402
+from aiortc.contrib.media import MediaPlayer  # noqa: E402
+from aiortc.mediastreams import MediaStreamError  # noqa: E402
+
+from media_cache import MediaCache, MediaSourceManager  # noqa: E402
+
+# CPU and memory per session with and without the media cache and shared
+# decode. Every simulated session pulls video frames from its source and
+# VP8-encodes them, which is what a sending Demo does. Each mode runs in its
+# own process so peak RSS is not shared between them.
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_directory(directory):
+    handler = partial(QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def session(track, duration):
+    encoder = Vp8Encoder()
+    deadline = time.monotonic() + duration
+    frames = 0
+    while time.monotonic() < deadline:
+        try:
+            frame = await track.recv()
+        except MediaStreamError:
+            break
+        encoder.encode(frame)
+        frames += 1
+    track.stop()
+    return frames
+
+
+async def run_mode(mode, url, sessions, duration):
+    manager = MediaSourceManager(MediaCache(tempfile.mkdtemp(prefix="media-cache-")))
+    loop = asyncio.get_running_loop()
+    cpu_start = time.process_time()
+    sources = []
+    tracks = []
+    for _ in range(sessions):
+        if mode == "shared":
+            source = await manager.open(url)
+        else:
+            source = await loop.run_in_executor(None, MediaPlayer, url)
+        sources.append(source)
+        tracks.append(source.video)
+    frames = await asyncio.gather(*(session(track, duration) for track in tracks))
+    for source in sources:
+        if mode == "shared":
+            source.close()
+    cpu = time.process_time() - cpu_start
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{mode:>8}: {sessions} sessions, {sum(frames)} frames encoded"
+        f" | cpu {cpu:.2f} s ({cpu / sessions:.3f} s/session)"
+        f" | peak rss {rss_mb:.0f} MB ({rss_mb / sessions:.1f} MB/session)"
+    )
+
+
+def main(args):
+    if args.mode:
+        asyncio.run(run_mode(args.mode, args.url, args.sessions, args.duration))
+        return
+
+    url = args.source
+    if not url.startswith("http"):
+        # Serve the local file over HTTP so the download path is exercised
+        server = serve_directory(os.path.dirname(os.path.abspath(url)))
+        url = f"http://127.0.0.1:{server.server_port}/{os.path.basename(url)}"
+
+    for mode in ("player", "shared"):
+        subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                args.source,
+                "--mode",
+                mode,
+                "--url",
+                url,
+                "--sessions",
+                str(args.sessions),
+                "--duration",
+                str(args.duration),
+            ],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Media cache and shared decode benchmark")
+    parser.add_argument("source", help="Media file path or URL")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--mode", choices=["player", "shared"], help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    main(parser.parse_args())
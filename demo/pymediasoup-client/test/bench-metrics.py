@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc.contrib.media import MediaBlackhole  # noqa: E402
+
+import metrics  # noqa: E402
+from mediasoup import Demo  # noqa: E402
+from standin import StandInServer  # noqa: E402
+
+# Overhead of the Prometheus session instrumentation: the cost of a single
+# observation, and CPU time per session bring-up against a local stand-in
+# server with and without the observer attached.
+
+
+def observation_cost(count):
+    start = time.perf_counter()
+    for _ in range(count):
+        metrics.observer.phase("join", 0.01)
+        metrics.observer.request("join", 0.01, None)
+    return (time.perf_counter() - start) / (2 * count)
+
+
+async def bring_up(server, observer):
+    demo = Demo(uri=server.url, recorder=MediaBlackhole(), observer=observer)
+    try:
+        await demo.run()
+    finally:
+        await demo.close()
+
+
+class CountingObserver:
+    def __init__(self):
+        self.count = 0
+
+    def phase(self, name, seconds):
+        self.count += 1
+        metrics.observer.phase(name, seconds)
+
+    def request(self, method, seconds, error):
+        self.count += 1
+        metrics.observer.request(method, seconds, error)
+
+
+async def cpu_per_session(server, runs):
+    # Alternate the two variants so drift affects both alike
+    samples = {False: [], True: []}
+    counter = CountingObserver()
+    for _ in range(runs):
+        for instrumented in (False, True):
+            start = time.process_time()
+            await bring_up(server, counter if instrumented else None)
+            samples[instrumented].append(time.process_time() - start)
+    return (
+        statistics.median(samples[False]),
+        statistics.median(samples[True]),
+        counter.count / runs,
+    )
+
+
+async def main(args):
+    cost = observation_cost(args.observations)
+    print(f"observation: {cost * 1e6:.2f} us")
+
+    server = StandInServer(consumers=args.consumers)
+    await server.start()
+    # Demo logs every signaling message; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # Warm up imports and codec setup before measuring
+        await bring_up(server, None)
+        off, on, observations = await cpu_per_session(server, args.runs)
+    await server.stop()
+    print(f"bring-up cpu without metrics: {off * 1000:.2f} ms")
+    print(f"bring-up cpu with metrics:    {on * 1000:.2f} ms ({(on - off) / off * 100:+.1f}%)")
+    print(
+        f"{observations:.0f} observations per session:"
+        f" {observations * cost * 1e6:.0f} us ({observations * cost / off * 100:.2f}% of bring-up cpu)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Instrumentation overhead benchmark")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--consumers", type=int, default=4)
+    parser.add_argument("--observations", type=int, default=100000)
+    asyncio.run(main(parser.parse_args()))
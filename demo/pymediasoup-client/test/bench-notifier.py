@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import json
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from notifier import WebhookNotifier  # noqa: E402
+
+# Session callback delivery against a local receiver that answers slowly and
+# fails a share of the requests with 503: a bare requests.put per callback in
+# a thread pool, as runner.py used to do, versus the pooled WebhookNotifier.
+
+
+class Receiver(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    fail_every = 0
+    lock = threading.Lock()
+    requests = 0
+    received = set()
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.delay)
+        with Receiver.lock:
+            Receiver.requests += 1
+            fail = self.fail_every and Receiver.requests % self.fail_every == 0
+            if not fail:
+                Receiver.received.add(json.loads(body)["session_id"])
+        self.send_response(503 if fail else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def reset():
+    Receiver.requests = 0
+    Receiver.received = set()
+
+
+def plain(url, count, workers):
+    # One new connection per callback, failures are not retried
+    calls = []
+    with ThreadPoolExecutor(workers) as pool:
+        for index in range(count):
+            start = time.perf_counter()
+            pool.submit(requests.put, url, json={"status": "success", "session_id": str(index)})
+            calls.append(time.perf_counter() - start)
+    return calls
+
+
+def pooled(url, count, workers):
+    notifier = WebhookNotifier(workers=workers, max_queue=count, backoff=0.05)
+    calls = []
+    for index in range(count):
+        start = time.perf_counter()
+        notifier.notify(url, {"status": "success", "session_id": str(index)})
+        calls.append(time.perf_counter() - start)
+    notifier.drain(timeout=120)
+    return calls, notifier.stats()
+
+
+def run(name, variant, url, count, workers):
+    reset()
+    start = time.perf_counter()
+    result = variant(url, count, workers)
+    elapsed = time.perf_counter() - start
+    calls, stats = result if isinstance(result, tuple) else (result, None)
+    print(
+        f"{name:>8}: {elapsed:6.2f} s, {len(Receiver.received)}/{count} delivered,"
+        f" {Receiver.requests} requests, call p50 {statistics.median(calls) * 1e6:.0f} us"
+        f" max {max(calls) * 1e6:.0f} us"
+    )
+    if stats:
+        print(f"{'':>10}{stats}")
+
+
+def main(args):
+    Receiver.delay = args.delay
+    Receiver.fail_every = args.fail_every
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/success"
+
+    run("plain", plain, url, args.notifications, args.workers)
+    run("pooled", pooled, url, args.notifications, args.workers)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Session callback delivery benchmark")
+    parser.add_argument("--notifications", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.005, help="Receiver delay per request (s)")
+    parser.add_argument("--fail-every", type=int, default=10, help="Answer every Nth request with 503, 0 never")
+    main(parser.parse_args())
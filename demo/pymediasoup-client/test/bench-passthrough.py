@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc.codecs import get_encoder  # noqa: E402
+from aiortc.contrib.media import MediaPlayer  # noqa: E402
+from aiortc.mediastreams import MediaStreamError  # noqa: E402
+from aiortc.rtcrtpparameters import RTCRtpCodecParameters  # noqa: E402
+from av import Packet  # noqa: E402
+
+from passthrough import EncodedSourceManager  # noqa: E402
+
+# CPU and memory per sending session with per-session transcoding versus
+# passthrough of pre-encoded packets. Every simulated session turns its video
+# into RTP payloads the way RTCRtpSender does: encoding decoded frames, or
+# packing encoded packets. Each mode runs in its own process.
+
+CODECS = {
+    "video/VP8": RTCRtpCodecParameters(mimeType="video/VP8", clockRate=90000, payloadType=96),
+    "video/H264": RTCRtpCodecParameters(
+        mimeType="video/H264",
+        clockRate=90000,
+        payloadType=97,
+        parameters={"packetization-mode": "1", "profile-level-id": "42e01f"},
+    ),
+}
+
+
+async def session(track, mimeType, duration):
+    encoder = get_encoder(CODECS[mimeType])
+    deadline = time.monotonic() + duration
+    payloads = 0
+    while time.monotonic() < deadline:
+        try:
+            data = await track.recv()
+        except MediaStreamError:
+            break
+        if isinstance(data, Packet):
+            packed, _ = encoder.pack(data)
+        else:
+            packed, _ = encoder.encode(data)
+        payloads += len(packed)
+    track.stop()
+    return payloads
+
+
+async def run_mode(mode, path, sessions, duration):
+    loop = asyncio.get_running_loop()
+    manager = EncodedSourceManager(tempfile.mkdtemp(prefix="encoded-media-"), loop=True)
+    # The one-off encode is not part of the per-session cost
+    await manager.open(path)
+
+    cpu_start = time.process_time()
+    jobs = []
+    for _ in range(sessions):
+        if mode == "passthrough":
+            source = await manager.open(path)
+            jobs.append(session(source.video, source.video.mimeType, duration))
+        else:
+            player = await loop.run_in_executor(None, MediaPlayer, path)
+            jobs.append(session(player.video, "video/VP8", duration))
+    payloads = await asyncio.gather(*jobs)
+    cpu = time.process_time() - cpu_start
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{mode:>11}: {sessions} sessions, {sum(payloads)} RTP payloads"
+        f" | cpu {cpu:.2f} s ({cpu / sessions:.3f} s/session)"
+        f" | peak rss {rss_mb:.0f} MB ({rss_mb / sessions:.1f} MB/session)"
+    )
+
+
+def main(args):
+    if args.mode:
+        asyncio.run(run_mode(args.mode, args.source, args.sessions, args.duration))
+        return
+
+    for mode in ("transcode", "passthrough"):
+        subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                args.source,
+                "--mode",
+                mode,
+                "--sessions",
+                str(args.sessions),
+                "--duration",
+                str(args.duration),
+            ],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Passthrough producer benchmark")
+    parser.add_argument("source", help="Media file path")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--mode", choices=["transcode", "passthrough"], help=argparse.SUPPRESS)
+    main(parser.parse_args())
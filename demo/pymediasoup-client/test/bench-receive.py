@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc import RTCPeerConnection  # noqa: E402
+from aiortc.contrib.media import MediaBlackhole  # noqa: E402
+
+from receive_sink import ReceiveSink  # noqa: E402
+from synthetic import SyntheticAudioTrack, SyntheticVideoTrack  # noqa: E402
+
+# Receive cost: sends synthetic audio and video over local peer connection
+# pairs and discards every received track with MediaBlackhole (decoding it)
+# or measures it with ReceiveSink (no decoding). Sender encoding runs in the
+# same process, so the numbers are the total CPU of both sides; the
+# difference between the variants is the receive-side decode cost.
+
+
+async def connect_pair(width, height):
+    sender, receiver = RTCPeerConnection(), RTCPeerConnection()
+    sender.addTrack(SyntheticVideoTrack(width=width, height=height))
+    sender.addTrack(SyntheticAudioTrack())
+    await sender.setLocalDescription(await sender.createOffer())
+    await receiver.setRemoteDescription(sender.localDescription)
+    await receiver.setLocalDescription(await receiver.createAnswer())
+    await sender.setRemoteDescription(receiver.localDescription)
+    return sender, receiver
+
+
+def as_consumer(transceiver, sender):
+    # The parts of a pymediasoup Consumer that ReceiveSink uses
+    ssrc = next(
+        item.sender._ssrc for item in sender.getTransceivers() if item.kind == transceiver.kind
+    )
+    return SimpleNamespace(
+        id=f"{transceiver.kind}-{id(transceiver)}",
+        kind=transceiver.kind,
+        rtpParameters=SimpleNamespace(
+            codecs=transceiver._codecs, encodings=[SimpleNamespace(ssrc=ssrc)]
+        ),
+        rtpReceiver=transceiver.receiver,
+        track=transceiver.receiver.track,
+    )
+
+
+async def loop_lag(stop, samples):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        samples.append(time.perf_counter() - start - 0.005)
+
+
+async def run(variant, args):
+    pairs = [await connect_pair(args.width, args.height) for _ in range(args.pairs)]
+    sinks = []
+    for sender, receiver in pairs:
+        if variant == "blackhole":
+            sink = MediaBlackhole()
+            for transceiver in receiver.getTransceivers():
+                sink.addTrack(transceiver.receiver.track)
+        else:
+            sink = ReceiveSink()
+            for transceiver in receiver.getTransceivers():
+                sink.addConsumer(as_consumer(transceiver, sender))
+        await sink.start()
+        sinks.append(sink)
+
+    stop = asyncio.Event()
+    samples = []
+    lag = asyncio.ensure_future(loop_lag(stop, samples))
+    cpu = time.process_time()
+    await asyncio.sleep(args.duration)
+    cpu = time.process_time() - cpu
+    stop.set()
+    await lag
+    for sink in sinks:
+        await sink.stop()
+    for sender, receiver in pairs:
+        await sender.close()
+        await receiver.close()
+
+    samples.sort()
+    line = (
+        f"{variant:>9}: loop lag p50 {statistics.median(samples) * 1000:6.2f} ms"
+        f" p99 {samples[int(len(samples) * 0.99)] * 1000:6.2f} ms,"
+        f" cpu {cpu / args.duration * 100:5.1f}%"
+        f" ({cpu / args.duration * 100 / (args.pairs * 2):4.1f}% per stream)"
+    )
+    if variant == "measure":
+        totals = [sink.summary() for sink in sinks]
+        video = [total["video"] for total in totals if "video" in total]
+        line += (
+            f", video {sum(item['frames'] for item in video)} frames"
+            f" {sum(item['keyframes'] for item in video)} keyframes"
+            f" {sum(item['lost'] for item in video)} lost,"
+            f" max jitter {max(item['max_jitter_ms'] for item in video):.1f} ms"
+        )
+    print(line)
+
+
+async def main(args):
+    for variant in args.variants:
+        await run(variant, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Receive sink benchmark")
+    parser.add_argument("--pairs", type=int, default=4, help="Peer connection pairs, each with audio and video")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument(
+        "--variants",
+        nargs="+",
+        default=["blackhole", "measure"],
+        choices=["blackhole", "measure"],
+    )
+    asyncio.run(main(parser.parse_args()))
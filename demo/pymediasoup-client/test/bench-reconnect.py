@@ -0,0 +1,100 @@
+import os
+import sys
+import asyncio
+import argparse
+import contextlib
+import statistics
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc.contrib.media import MediaBlackhole  # noqa: E402
+
+from mediasoup import Demo  # noqa: E402
+from standin import StandInServer  # noqa: E402
+
+# Reconnection: runs sessions against a local stand-in protoo server and
+# injects outages while they are in the room, then reports how each one was
+# recovered and how long it took. Variants:
+#   rejoin   the stand-in drops every websocket and, like the mediasoup
+#            server, the transports of the peer with it
+#   resume   the stand-in drops every websocket but keeps the peers'
+#            transports, so restartIce recovers them
+#   ice      the websockets stay up and each session's send transport
+#            reports ICE failure (simulated: the stand-in routes no media)
+# Exits with 1 when an outage was not recovered.
+
+
+def fail_ice(demo):
+    # What aiortc reports when consent checks stop being answered
+    handler = demo._sendTransport.handler
+    handler.emit("@connectionstatechange", "connected")
+    handler.emit("@connectionstatechange", "failed")
+
+
+async def run_sessions(variant, args):
+    server = StandInServer(consumers=args.consumers, keep_transports=variant == "resume")
+    await server.start()
+    demos = [
+        Demo(
+            uri=f"{server.url}?roomId=reconnect&peerId=peer-{n}",
+            recorder=MediaBlackhole(),
+            linger=args.outages * args.interval + args.interval,
+            reconnect=True,
+        )
+        for n in range(args.sessions)
+    ]
+    tasks = [asyncio.ensure_future(demo.run()) for demo in demos]
+    for _ in range(args.outages):
+        await asyncio.sleep(args.interval)
+        if variant == "ice":
+            for demo in demos:
+                fail_ice(demo)
+        else:
+            await server.drop_peers()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for demo in demos:
+        await demo.close()
+    await server.stop()
+    return demos, results
+
+
+async def run(variant, args):
+    # Demo logs every signaling message; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        demos, results = await run_sessions(variant, args)
+
+    recoveries = [item for demo in demos for item in demo.recoveries]
+    seconds = sorted(item["seconds"] * 1000 for item in recoveries)
+    outcomes = Counter(item["result"] for item in recoveries)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    expected = args.sessions * args.outages
+    line = f"{variant:>7}: {len(recoveries)}/{expected} outages, " + ", ".join(
+        f"{count} {result}" for result, count in sorted(outcomes.items())
+    )
+    if seconds:
+        line += (
+            f"; recovery p50 {statistics.median(seconds):6.1f} ms"
+            f" p95 {seconds[int(len(seconds) * 0.95)]:6.1f} ms max {seconds[-1]:6.1f} ms"
+        )
+    print(line)
+    for error in errors:
+        print(f"  session error: {type(error).__name__}: {error}")
+    return len(recoveries) == expected and outcomes["failed"] == 0 and not errors
+
+
+async def main(args):
+    ok = True
+    for variant in args.variants:
+        ok = await run(variant, args) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconnection test against a stand-in server")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--outages", type=int, default=3, help="Outages injected per session")
+    parser.add_argument("--interval", type=float, default=2, help="Seconds between outages")
+    parser.add_argument("--consumers", type=int, default=2, help="Stand-in newConsumer requests per join")
+    parser.add_argument("--variants", nargs="+", default=["rejoin", "resume", "ice"], choices=["rejoin", "resume", "ice"])
+    sys.exit(asyncio.run(main(parser.parse_args())))
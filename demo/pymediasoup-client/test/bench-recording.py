@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from types import SimpleNamespace
+
+import av
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc import RTCPeerConnection  # noqa: E402
+from aiortc.contrib.media import MediaRecorder  # noqa: E402
+
+from recording import SegmentedRecorder  # noqa: E402
+from synthetic import SyntheticAudioTrack, SyntheticVideoTrack  # noqa: E402
+
+# Recording cost on the event loop: receives synthetic audio and video over
+# local peer connection pairs and records every received track with aiortc's
+# MediaRecorder (decode, then encode on the loop), SegmentedRecorder decoding
+# and re-encoding on its writer thread, and SegmentedRecorder writing the
+# received VP8 and Opus as they are. Reports the lateness of a 5 ms timer on
+# the loop, which is what delays protoo responses, and the CPU time used.
+
+
+async def connect_pair():
+    sender, receiver = RTCPeerConnection(), RTCPeerConnection()
+    sender.addTrack(SyntheticVideoTrack(width=640, height=480))
+    sender.addTrack(SyntheticAudioTrack())
+    await sender.setLocalDescription(await sender.createOffer())
+    await receiver.setRemoteDescription(sender.localDescription)
+    await receiver.setLocalDescription(await receiver.createAnswer())
+    await sender.setRemoteDescription(receiver.localDescription)
+    return sender, receiver
+
+
+def as_consumer(transceiver, sender):
+    # The parts of a pymediasoup Consumer that SegmentedRecorder uses
+    ssrc = next(
+        item.sender._ssrc for item in sender.getTransceivers() if item.kind == transceiver.kind
+    )
+    return SimpleNamespace(
+        id=f"{transceiver.kind}-{id(transceiver)}",
+        kind=transceiver.kind,
+        rtpParameters=SimpleNamespace(
+            codecs=transceiver._codecs, encodings=[SimpleNamespace(ssrc=ssrc)]
+        ),
+        rtpReceiver=transceiver.receiver,
+        track=transceiver.receiver.track,
+    )
+
+
+async def record(variant, pairs, directory):
+    recorders = []
+    for index, (sender, receiver) in enumerate(pairs):
+        if variant == "mediarecorder":
+            recorder = MediaRecorder(os.path.join(directory, f"pair-{index}.webm"))
+            for transceiver in receiver.getTransceivers():
+                recorder.addTrack(transceiver.receiver.track)
+        else:
+            recorder = SegmentedRecorder(
+                os.path.join(directory, f"pair-{index}"),
+                segment_seconds=2,
+                remux=variant == "remux",
+            )
+            for transceiver in receiver.getTransceivers():
+                if variant == "remux":
+                    recorder.addConsumer(as_consumer(transceiver, sender))
+                else:
+                    recorder.addTrack(transceiver.receiver.track)
+        await recorder.start()
+        recorders.append(recorder)
+    return recorders
+
+
+async def loop_lag(stop, samples):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        samples.append(time.perf_counter() - start - 0.005)
+
+
+async def run(variant, args):
+    pairs = [await connect_pair() for _ in range(args.pairs)]
+    with tempfile.TemporaryDirectory() as directory:
+        recorders = await record(variant, pairs, directory)
+        stop = asyncio.Event()
+        samples = []
+        lag = asyncio.ensure_future(loop_lag(stop, samples))
+        cpu = time.process_time()
+        await asyncio.sleep(args.duration)
+        cpu = time.process_time() - cpu
+        stop.set()
+        await lag
+        for recorder in recorders:
+            await recorder.stop()
+        for sender, receiver in pairs:
+            await sender.close()
+            await receiver.close()
+
+        files = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(directory)
+            for name in names
+        ]
+        frames = 0
+        for path in files:
+            with av.open(path) as container:
+                frames += sum(1 for _ in container.demux() if _.size)
+        streams = [
+            stream
+            for recorder in recorders
+            if isinstance(recorder, SegmentedRecorder)
+            for stream in recorder.stats()["streams"].values()
+        ]
+        dropped = sum(stream["dropped"] for stream in streams)
+        skipped = sum(stream["skipped"] for stream in streams)
+
+    samples.sort()
+    print(
+        f"{variant:>14}: loop lag p50 {statistics.median(samples) * 1000:6.2f} ms"
+        f" p99 {samples[int(len(samples) * 0.99)] * 1000:6.2f} ms"
+        f" max {samples[-1] * 1000:6.2f} ms, cpu {cpu / args.duration * 100:5.1f}%,"
+        f" {len(files)} files, {frames} packets written, {dropped} dropped, {skipped} skipped"
+    )
+
+
+async def main(args):
+    for variant in args.variants:
+        await run(variant, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recording overhead benchmark")
+    parser.add_argument("--pairs", type=int, default=4, help="Peer connection pairs, each with audio and video")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument(
+        "--variants",
+        nargs="+",
+        default=["mediarecorder", "decode", "remux"],
+        choices=["mediarecorder", "decode", "remux"],
+    )
+    asyncio.run(main(parser.parse_args()))
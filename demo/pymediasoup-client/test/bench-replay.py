@@ -0,0 +1,86 @@
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc.contrib.media import MediaBlackhole  # noqa: E402
+
+from mediasoup import Demo  # noqa: E402
+from replay import ReplayServer  # noqa: E402
+from signaling_trace import read_trace  # noqa: E402
+from standin import StandInServer  # noqa: E402
+
+# Signaling replay: plays the server side of a trace back to a Demo client at
+# the recorded timing, compressed and without delays, and prints the session
+# phases of each run. Without --trace, a trace is first recorded against a
+# local stand-in server with --latency per request. Exits with 1 when the
+# client's exchange diverged from the trace, so it doubles as a regression
+# test for recorded production sessions.
+
+PHASES = ("connect", "load", "join", "produce", "firstProducer", "firstConsumer", "leaveRoom")
+
+
+async def session(uri, args, trace=None):
+    demo = Demo(uri=uri, recorder=MediaBlackhole(), fast_start=args.fast_start, trace=trace)
+    try:
+        await demo.run()
+    finally:
+        await demo.close()
+    return demo.timings.as_dict()
+
+
+def describe(timings):
+    return ", ".join(
+        f"{name} {phase.get('duration_ms', phase.get('at_ms')):.1f}"
+        for name, phase in ((name, timings.get(name)) for name in PHASES)
+        if phase
+    )
+
+
+async def record(path, args):
+    server = StandInServer(latency=args.latency, consumers=args.consumers)
+    await server.start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        timings = await session(f"{server.url}?roomId=replay&peerId=peer", args, trace=path)
+    await server.stop()
+    print(f"{'recorded':>9}: {describe(timings)} ms")
+
+
+async def replay(path, speed, args):
+    server = ReplayServer.from_file(path, speed=speed)
+    await server.start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        timings = await session(server.url, args)
+    await server.stop()
+    label = "fastest" if not speed else f"x{speed:g}"
+    print(f"{label:>9}: {describe(timings)} ms")
+    for divergence in server.divergences:
+        print(f"{'':>9}  {divergence}")
+    return not server.divergences
+
+
+async def main(args):
+    path = args.trace
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "standin.jsonl")
+        await record(path, args)
+    events = sum(len(connection) for connection in read_trace(path))
+    print(f"{path}: {events} events")
+    ok = True
+    for speed in args.speeds:
+        ok = await replay(path, speed, args) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a signaling trace to the client")
+    parser.add_argument("--trace", help="Trace to replay; recorded against a stand-in server if omitted")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[1, 10, 0], help="1 for the recorded timing, higher to compress it, 0 without delays")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in per-request delay (s) while recording")
+    parser.add_argument("--consumers", type=int, default=2, help="Stand-in newConsumer requests per join while recording")
+    parser.add_argument("--fast-start", action="store_true", help="Run independent bring-up steps concurrently")
+    sys.exit(asyncio.run(main(parser.parse_args())))
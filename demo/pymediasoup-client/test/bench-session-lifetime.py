@@ -0,0 +1,212 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import statistics
+from collections import Counter
+
+import av
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc.contrib.media import MediaBlackhole, MediaPlayer  # noqa: E402
+from aiortc.mediastreams import MediaStreamError  # noqa: E402
+
+from mediasoup import Demo  # noqa: E402
+from standin import StandInServer  # noqa: E402
+
+# Session lifetime: runs sessions that play a --clip seconds file against a
+# local stand-in server and measures how long each one holds its slot, from
+# run() until it has left the room. Variants:
+#   fixed     the former fixed timer: stay the clip's length plus 5 s
+#   ended     leave when the player's tracks end, with the same timer as cap
+#   peerLeft  like ended, but the stand-in announces after --peer-left
+#             seconds that the other peer left
+#   room      --room-peers peers in one room of a stand-in that announces
+#             peers like the mediasoup server, each staying --peer-left
+#             seconds longer than the previous one: every peer but the last
+#             must stay its own time, the last leaves with the one before it
+#   failed    the stand-in rejects join, sequentially and with fast_start:
+#             run() must raise either way
+# The stand-in routes no media, so the bench reads the produced tracks the
+# way the RTP senders would once DTLS is up. Exits with 1 when room or
+# failed did not behave as described.
+
+
+class PeerLeaves(StandInServer):
+    # Sends peerLeft to every peer this many seconds after its first produce
+    def __init__(self, after: float, **kwargs):
+        super().__init__(**kwargs)
+        self.after = after
+
+    def _on_produce(self, peer, data):
+        if not peer.producers:
+            asyncio.get_running_loop().call_later(
+                self.after,
+                lambda: asyncio.ensure_future(peer.notify("peerLeft", {"peerId": "other"})),
+            )
+        return super()._on_produce(peer, data)
+
+
+class RejectsJoin(StandInServer):
+    def _on_join(self, peer, data):
+        raise PermissionError("join rejected")
+
+
+def write_clip(seconds: float) -> str:
+    path = os.path.join(tempfile.mkdtemp(), "clip.mp4")
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 320, 240, "yuv420p"
+        for _ in range(int(seconds * 30)):
+            frame = av.VideoFrame(width=320, height=240, format="yuv420p")
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode())
+    return path
+
+
+async def drain(demo):
+    while not demo._producers:
+        await asyncio.sleep(0.01)
+    track = demo._videoTrack
+    try:
+        while True:
+            await track.recv()
+    except MediaStreamError:
+        pass
+
+
+async def session(uri, clip, variant, args):
+    player = MediaPlayer(clip)
+    demo = Demo(
+        uri=uri,
+        player=player,
+        recorder=MediaBlackhole(),
+        linger=args.clip + 5,
+        until_ended=variant != "fixed",
+    )
+    reader = asyncio.ensure_future(drain(demo))
+    started = time.monotonic()
+    try:
+        await demo.run()
+        held = time.monotonic() - started
+    finally:
+        reader.cancel()
+        await demo.close()
+        player.video.stop()
+    return held, demo.endReason
+
+
+async def room(args):
+    server = StandInServer(peer_events=True)
+    await server.start()
+
+    async def stay(demo):
+        started = time.monotonic()
+        try:
+            await demo.run()
+            return time.monotonic() - started
+        finally:
+            await demo.close()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        demos = [
+            Demo(
+                uri=f"{server.url}?roomId=room&peerId=room-{n}",
+                recorder=MediaBlackhole(),
+                linger=(n + 1) * args.peer_left,
+            )
+            for n in range(args.room_peers)
+        ]
+        held = await asyncio.gather(*(stay(demo) for demo in demos))
+    await server.stop()
+
+    reasons = [demo.endReason for demo in demos]
+    expected = ["linger"] * (args.room_peers - 1) + ["peerLeft"]
+    print(
+        f"{'room':>8}: "
+        + ", ".join(f"{seconds:4.2f} s {reason}" for seconds, reason in zip(held, reasons))
+    )
+    # The last peer leaves when the one before it does
+    return reasons == expected and abs(held[-1] - held[-2]) < args.peer_left / 2
+
+
+async def failed(args):
+    server = RejectsJoin()
+    await server.start()
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for fast_start in (False, True):
+            demo = Demo(
+                uri=f"{server.url}?roomId=failed&peerId=failed-{fast_start}",
+                recorder=MediaBlackhole(),
+                fast_start=fast_start,
+            )
+            try:
+                await demo.run()
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+            finally:
+                await demo.close()
+    await server.stop()
+    print(
+        f"{'failed':>8}: "
+        + ", ".join(
+            f"{mode} {type(error).__name__ if error else 'returned'}"
+            for mode, error in zip(("sequential", "fast_start"), results)
+        )
+    )
+    return all(results)
+
+
+async def run(variant, clip, args):
+    if variant == "peerLeft":
+        server = PeerLeaves(args.peer_left)
+    else:
+        server = StandInServer()
+    await server.start()
+    # Demo logs every signaling message; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = await asyncio.gather(
+            *(
+                session(f"{server.url}?roomId=lifetime&peerId={variant}-{n}", clip, variant, args)
+                for n in range(args.sessions)
+            )
+        )
+    await server.stop()
+
+    held = [seconds for seconds, _ in results]
+    reasons = Counter(reason for _, reason in results)
+    mean = statistics.mean(held)
+    print(
+        f"{variant:>8}: slot held mean {mean:5.2f} s max {max(held):5.2f} s,"
+        f" {3600 / mean:6.0f} sessions per slot-hour; "
+        + ", ".join(f"{count} {reason}" for reason, count in sorted(reasons.items()))
+    )
+
+
+async def main(args):
+    clip = write_clip(args.clip)
+    ok = True
+    for variant in args.variants:
+        if variant == "room":
+            ok = await room(args) and ok
+        elif variant == "failed":
+            ok = await failed(args) and ok
+        else:
+            await run(variant, clip, args)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Session lifetime benchmark")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--clip", type=float, default=3, help="Seconds of the played file")
+    parser.add_argument("--peer-left", type=float, default=1, help="Seconds after producing the stand-in sends peerLeft")
+    parser.add_argument("--room-peers", type=int, default=4, help="Peers of the room variant")
+    parser.add_argument("--variants", nargs="+", default=["fixed", "ended", "peerLeft", "room", "failed"])
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from protoo import Dispatcher  # noqa: E402
+from standin import StandInServer  # noqa: E402
+
+# Compares the original polling receive loop (sleep 0.5 s, recv, handle
+# newConsumer inline) with the event-driven Dispatcher against a local
+# stand-in protoo server. Reports per-request round-trip latency and the
+# time the server waits until N newConsumer requests have been answered.
+
+
+class LegacyLoop:
+    def __init__(self, websocket, consume_cost):
+        self._websocket = websocket
+        self._consume_cost = consume_cost
+        self._answers = {}
+
+    def expect(self, id):
+        self._answers[id] = asyncio.get_running_loop().create_future()
+        return self._answers[id]
+
+    async def send(self, message):
+        await self._websocket.send(json.dumps(message))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(0.5)
+            try:
+                message = json.loads(await self._websocket.recv())
+            except websockets.ConnectionClosed:
+                break
+            if message.get("response"):
+                self._answers[message["id"]].set_result(message)
+            elif message.get("request"):
+                await asyncio.sleep(self._consume_cost)
+                await self.send(
+                    {"response": True, "id": message["id"], "ok": True, "data": {}}
+                )
+
+
+def make_dispatcher(websocket, consume_cost, concurrency):
+    dispatcher = Dispatcher(websocket)
+
+    async def on_new_consumer(data):
+        await asyncio.sleep(consume_cost)
+
+    dispatcher.on_request("newConsumer", on_new_consumer, concurrency=concurrency)
+    return dispatcher
+
+
+async def bench(kind, args):
+    server = StandInServer(consumers=args.consumers)
+    await server.start()
+    websocket = await websockets.connect(server.url, subprotocols=["protoo"])
+    if kind == "legacy":
+        client = LegacyLoop(websocket, args.consume_cost)
+    else:
+        client = make_dispatcher(websocket, args.consume_cost, args.concurrency)
+    recv_task = asyncio.ensure_future(client.run())
+
+    async def request(id, method):
+        fut = client.expect(id)
+        await client.send({"request": True, "id": id, "method": method, "data": {}})
+        return await asyncio.wait_for(fut, timeout=60)
+
+    rtts = []
+    for id in range(args.requests):
+        start = time.monotonic()
+        await request(id, "getRouterRtpCapabilities")
+        rtts.append(time.monotonic() - start)
+
+    await request(args.requests, "join")
+    while not server.consumeTimes:
+        await asyncio.sleep(0.01)
+
+    await websocket.close()
+    await recv_task
+    await server.stop()
+
+    return {
+        "rtt_mean_ms": statistics.mean(rtts) * 1000,
+        "rtt_max_ms": max(rtts) * 1000,
+        "consume_all_s": server.consumeTimes[0],
+    }
+
+
+async def main(args):
+    for kind in ("legacy", "dispatcher"):
+        result = await bench(kind, args)
+        print(
+            f"{kind:>10}: rtt mean {result['rtt_mean_ms']:8.2f} ms"
+            f" | rtt max {result['rtt_max_ms']:8.2f} ms"
+            f" | {args.consumers} consumers in {result['consume_all_s']:.3f} s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Protoo dispatcher benchmark")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--consumers", type=int, default=20)
+    parser.add_argument("--consume-cost", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
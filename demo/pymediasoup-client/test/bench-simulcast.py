@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc import RTCPeerConnection  # noqa: E402
+from aiortc.codecs.vpx import vp8_depayload  # noqa: E402
+
+from simulcast import (  # noqa: E402
+    AdaptiveEncoder,
+    EncodingControl,
+    ScaledVideoTrack,
+    SimulcastLayers,
+    parse_layers,
+)
+from synthetic import SyntheticVideoTrack  # noqa: E402
+
+# Simulcast and adaptive encoding over a local peer connection pair: sends
+# synthetic video either as one encoding or as simulcast layers (the
+# transceiver's sender plus one extra sender per lower layer, as Demo does),
+# and counts what arrives per SSRC at the receiving end: bitrate and the
+# resolution of the last keyframe. With --loss the receiver drops that share
+# of packets, so its receiver reports show loss, and --adaptive shows the
+# steps the adaptive encoder takes in response.
+
+
+def parse_vp8_size(payload):
+    data = vp8_depayload(payload)
+    # Keyframe start code, then 14-bit width and height
+    if len(data) >= 10 and not data[0] & 1 and data[3:6] == b"\x9d\x01\x2a":
+        return (
+            int.from_bytes(data[6:8], "little") & 0x3FFF,
+            int.from_bytes(data[8:10], "little") & 0x3FFF,
+        )
+    return None
+
+
+async def run(variant, args):
+    source = SyntheticVideoTrack(width=args.width, height=args.height)
+    sender, receiver = RTCPeerConnection(), RTCPeerConnection()
+    layers = None
+    if variant == "simulcast":
+        layers = SimulcastLayers(source, parse_layers(args.layers))
+        track = layers.track
+    else:
+        track = ScaledVideoTrack(source)
+    transceiver = sender.addTransceiver(track, direction="sendonly")
+    if layers is not None:
+        # What SimulcastLayers.produce() does once pymediasoup created the
+        # transceiver
+        transceiver.sender._ssrc, transceiver.sender._rtx_ssrc = layers.ssrcs[-1]
+        layers._transceiver = transceiver
+        layers.controls.append(EncodingControl(transceiver.sender, layers.layers[-1][1]))
+    await sender.setLocalDescription(await sender.createOffer())
+    await receiver.setRemoteDescription(sender.localDescription)
+    await receiver.setLocalDescription(await receiver.createAnswer())
+    await sender.setRemoteDescription(receiver.localDescription)
+
+    counts = defaultdict(lambda: {"bytes": 0, "size": None})
+    rtp_receiver = receiver.getTransceivers()[0].receiver
+    handle = rtp_receiver._handle_rtp_packet
+
+    async def on_rtp_packet(packet, arrival_time_ms):
+        if args.loss and random.random() < args.loss:
+            return
+        count = counts[packet.ssrc]
+        count["bytes"] += len(packet.payload)
+        size = parse_vp8_size(packet.payload)
+        if size is not None:
+            count["size"] = size
+        if packet.ssrc == transceiver.sender._ssrc:
+            await handle(packet, arrival_time_ms=arrival_time_ms)
+
+    rtp_receiver._handle_rtp_packet = on_rtp_packet
+    drain = asyncio.ensure_future(_drain(rtp_receiver.track))
+
+    tasks = []
+    adaptive = None
+    if layers is not None:
+        producer = SimpleNamespace(
+            rtpSender=transceiver.sender,
+            rtpParameters=SimpleNamespace(rtcp=SimpleNamespace(cname="bench")),
+        )
+        tasks.append(asyncio.ensure_future(layers.run(producer)))
+    if args.adaptive:
+        control = layers.controls[-1] if layers is not None else EncodingControl(transceiver.sender)
+        adaptive = AdaptiveEncoder(control, track, interval=1, recover=2)
+        tasks.append(asyncio.ensure_future(adaptive.run()))
+
+    cpu = time.process_time()
+    started = time.monotonic()
+    await asyncio.sleep(args.duration)
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if layers is not None:
+        await layers.stop()
+    await sender.close()
+    await receiver.close()
+    drain.cancel()
+    source.stop()
+
+    print(f"{variant}: cpu {cpu / elapsed * 100:5.1f}%")
+    names = {transceiver.sender._ssrc: "video", transceiver.sender._rtx_ssrc: "rtx"}
+    if layers is not None:
+        for index, ((scale, _), (ssrc, rtxSsrc)) in enumerate(zip(layers.layers, layers.ssrcs)):
+            names[ssrc] = f"layer {index} (1/{scale})"
+            names[rtxSsrc] = f"layer {index} rtx"
+    for ssrc, count in sorted(counts.items(), key=lambda item: item[1]["bytes"]):
+        size = "x".join(map(str, count["size"])) if count["size"] else "?"
+        print(
+            f"  {names.get(ssrc, ssrc)!s:>18}: {count['bytes'] * 8 / elapsed / 1000:7.0f} kbps,"
+            f" last keyframe {size}"
+        )
+    if adaptive is not None:
+        for at, action in adaptive.changes:
+            print(f"  +{at - started:5.1f} s adaptive: {action}")
+
+
+async def _drain(track):
+    try:
+        while True:
+            await track.recv()
+    except Exception:
+        pass
+
+
+async def main(args):
+    for variant in args.variants:
+        await run(variant, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulcast and adaptive encoding benchmark")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--layers", default="4:150000,2:500000,1:1500000", help="scale:maxBitrate per layer, lowest first")
+    parser.add_argument("--loss", type=float, default=0, help="Share of packets the receiver drops")
+    parser.add_argument("--adaptive", action="store_true", help="Run the adaptive encoder on the top layer")
+    parser.add_argument("--variants", nargs="+", default=["single", "simulcast"], choices=["single", "simulcast"])
+    asyncio.run(main(parser.parse_args()))
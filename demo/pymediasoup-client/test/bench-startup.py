@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.server
+import functools
+
+import av
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from standin import StandInServer  # noqa: E402
+
+# Service start-up: starts src/app.py as a fresh process with an empty media
+# cache, without (WARMUP=0) and with the background warm-up, and measures
+# the time until it answers HTTP, until /ready turns green and, from then,
+# how long the first and second /join-call take to reach their first produce
+# request on a local stand-in server. The default video is a short clip served
+# over local HTTP, so the media download is part of the first session too.
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+class ProduceClock(StandInServer):
+    # Records when each peer's first produce request arrives
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.produced = {}
+
+    def _on_produce(self, peer, data):
+        self.produced.setdefault(peer.peerId, time.monotonic())
+        return super()._on_produce(peer, data)
+
+
+def start_standin() -> ProduceClock:
+    server = ProduceClock()
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return server
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_clip(seconds: float) -> str:
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "clip.mp4")
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 320, 240, "yuv420p"
+        for _ in range(int(seconds * 30)):
+            frame = av.VideoFrame(width=320, height=240, format="yuv420p")
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode())
+    handler = functools.partial(QuietHandler, directory=directory)
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_address[1]}/clip.mp4"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, deadline: float, status: int = 200) -> float:
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == status:
+                return time.monotonic()
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+
+def first_produce(url: str, standin: ProduceClock, peer: str, deadline: float) -> float:
+    started = time.monotonic()
+    requests.post(f"{url}/join-call", json={"ws_url": f"{standin.url}?roomId=startup&peerId={peer}"})
+    while peer not in standin.produced:
+        if time.monotonic() > deadline:
+            raise TimeoutError(peer)
+        time.sleep(0.005)
+    return standin.produced[peer] - started
+
+
+def run(label: str, number: int, warmup: bool, clip: str, standin: ProduceClock, args):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "WARMUP": "1" if warmup else "0",
+        "WORKERS": str(args.workers),
+        "DEFAULT_VIDEO_SRC_URL": clip,
+        "MEDIA_CACHE_DIR": tempfile.mkdtemp(),
+        "ENCODED_MEDIA_DIR": tempfile.mkdtemp(),
+    }
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "app.py"], cwd=SRC, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + args.timeout
+        http = wait_for(f"{url}/status", deadline) - started
+        ready = wait_for(f"{url}/ready", deadline) - started
+        first = first_produce(url, standin, f"{label}-{number}-1", deadline)
+        second = first_produce(url, standin, f"{label}-{number}-2", deadline)
+    finally:
+        process.terminate()
+        process.wait()
+    print(
+        f"{label:>7}: HTTP {http * 1000:7.0f} ms, ready {ready * 1000:7.0f} ms,"
+        f" first session {first * 1000:6.0f} ms, second session {second * 1000:6.0f} ms,"
+        f" ready + first {(ready + first) * 1000:7.0f} ms"
+    )
+
+
+def main(args):
+    standin = start_standin()
+    clip = serve_clip(args.clip)
+    for number in range(args.runs):
+        run("lazy", number, False, clip, standin, args)
+        run("warm-up", number, True, clip, standin, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Service start-up benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0, help="WORKERS for the service")
+    parser.add_argument("--clip", type=float, default=2, help="Seconds of the default video")
+    parser.add_argument("--timeout", type=float, default=60)
+    main(parser.parse_args())
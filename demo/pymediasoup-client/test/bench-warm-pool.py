@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc.contrib.media import MediaBlackhole  # noqa: E402
+
+from mediasoup import Demo  # noqa: E402
+from standin import StandInServer  # noqa: E402
+from warm_pool import WarmPool  # noqa: E402
+
+# Session start rate: brings sessions up against a local stand-in protoo
+# server, --concurrency at a time, without and then with a WarmPool, and
+# prints sessions started per second, CPU time per session and the "load"
+# phase (Device loading). The pool patches aiortc for the whole process, so
+# the run without it goes first.
+
+
+async def bring_up(server, index, warm_pool=None):
+    demo = Demo(
+        uri=f"{server.url}?roomId=warm-pool&peerId=peer-{index}",
+        recorder=MediaBlackhole(),
+        fast_start=True,
+        warm_pool=warm_pool,
+    )
+    try:
+        await demo.run()
+    finally:
+        await demo.close()
+    return demo.timings.as_dict()
+
+
+async def run(server, label, args, warm_pool=None):
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(index):
+        async with semaphore:
+            return await bring_up(server, index, warm_pool)
+
+    started, cpu = time.monotonic(), time.process_time()
+    # Demo logs every signaling message; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        samples = await asyncio.gather(*(limited(index) for index in range(args.sessions)))
+    elapsed, cpu = time.monotonic() - started, time.process_time() - cpu
+
+    load = [sample["load"]["duration_ms"] for sample in samples if "load" in sample]
+    first = [sample["firstProducer"]["at_ms"] for sample in samples if "firstProducer" in sample]
+    print(
+        f"{label:>9}: {args.sessions / elapsed:6.1f} sessions/s, {cpu / args.sessions * 1000:6.1f} ms CPU"
+        f" per session, load {statistics.mean(load):6.1f} ms,"
+        f" firstProducer p50 {statistics.median(first):6.1f} ms"
+    )
+    if warm_pool is not None:
+        print(f"{'':>9}  pool: {warm_pool.stats()}")
+
+
+async def main(args):
+    server = StandInServer(latency=args.latency)
+    await server.start()
+    await run(server, "cold", args)
+    warm_pool = WarmPool(lifetime=args.lifetime)
+    await warm_pool.warm()
+    await run(server, "warm pool", args, warm_pool)
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Session start rate with and without a warm pool")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stand-in per-request delay (s)")
+    parser.add_argument("--lifetime", type=float, default=3600, help="Pooled certificate lifetime (s)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from standin import start_in_thread  # noqa: E402
+
+# Load test for a running service (python3 src/app.py). Fires /join-call
+# requests concurrently at sessions started on a local stand-in protoo
+# server, then reports handler latency percentiles, how many requests were
+# rejected with 429 and the peak number of concurrent sessions per core.
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main(args):
+    if args.ws_url:
+        ws_url = args.ws_url
+    else:
+        server = start_in_thread(host="0.0.0.0", port=args.standin_port)
+        ws_url = f"ws://{args.standin_host}:{server.port}/"
+
+    session = requests.Session()
+    latencies = []
+    codes = {}
+
+    def join_call(n):
+        start = time.monotonic()
+        response = session.post(
+            f"{args.url}/join-call",
+            json={"ws_url": f"{ws_url}?roomId=load&peerId=peer{n}"},
+        )
+        latencies.append(time.monotonic() - start)
+        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+
+    peak_active = 0
+    done = threading.Event()
+
+    def watch():
+        nonlocal peak_active
+        while not done.is_set():
+            status = session.get(f"{args.url}/status").json()
+            peak_active = max(peak_active, status["active"])
+            time.sleep(0.1)
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(join_call, range(args.requests)))
+
+    # Let the accepted sessions run for a while to observe the peak
+    time.sleep(args.settle)
+    done.set()
+    watcher.join()
+
+    cores = os.cpu_count() or 1
+    print(f"requests: {args.requests} | responses: {codes}")
+    print(
+        f"handler latency p50 {percentile(latencies, 50) * 1000:.1f} ms"
+        f" | p99 {percentile(latencies, 99) * 1000:.1f} ms"
+        f" | max {max(latencies) * 1000:.1f} ms"
+    )
+    print(f"peak concurrent sessions: {peak_active} ({peak_active / cores:.2f} per core)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/join-call load test")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--ws-url", help="Use this protoo server instead of a stand-in")
+    parser.add_argument("--standin-host", default="127.0.0.1")
+    parser.add_argument("--standin-port", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--settle", type=float, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from aiortc.contrib.media import MediaBlackhole  # noqa: E402
+
+from engine import EngineFull, SessionEngine  # noqa: E402
+from mediasoup import Demo  # noqa: E402
+from standin import start_in_thread  # noqa: E402
+
+# Soak test for session teardown: runs thousands of sessions through a
+# SessionEngine against a local stand-in protoo server, cancelling some of
+# them mid-session as DELETE /sessions/<id> does, and samples resident
+# memory, open file descriptors, threads and loop tasks along the way. Once
+# every session ended they should be back where they were after warm-up; the
+# script exits with 1 when they are not.
+
+
+async def session(session_id, url, linger):
+    demo = Demo(uri=f"{url}?roomId=soak&peerId={session_id}", recorder=MediaBlackhole(), linger=linger)
+    try:
+        await demo.run()
+    finally:
+        await demo.close()
+
+
+def rss_mb():
+    with open("/proc/self/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def sample(engine, done):
+    tasks = asyncio.run_coroutine_threadsafe(_count_tasks(), engine.loop).result()
+    return {
+        "sessions": done,
+        "rss_mb": rss_mb(),
+        "fds": len(os.listdir("/proc/self/fd")),
+        "threads": threading.active_count(),
+        "tasks": tasks,
+    }
+
+
+async def _count_tasks():
+    return len(asyncio.all_tasks())
+
+
+def run_batch(engine, url, count, args, samples):
+    """Runs ``count`` more sessions and waits until all of them ended."""
+    stats = engine.stats()
+    first = stats["completed"] + stats["failed"] + stats["cancelled"]
+    submitted = 0
+    while True:
+        stats = engine.stats()
+        done = stats["completed"] + stats["failed"] + stats["cancelled"] - first
+        if done >= count:
+            break
+        if samples is not None and done >= len(samples) * args.sample_every:
+            samples.append(sample(engine, done))
+        if submitted == count:
+            time.sleep(0.01)
+            continue
+        try:
+            session_id = engine.submit(session, url, args.linger)
+        except EngineFull:
+            time.sleep(0.01)
+            continue
+        submitted += 1
+        if args.cancel_every and submitted % args.cancel_every == 0:
+            # Cancel while it is bringing up or lingering
+            threading.Timer(args.linger / 2, engine.cancel, (session_id,)).start()
+    # Let the last sessions' timers and sockets settle
+    time.sleep(1)
+
+
+def main(args):
+    server = start_in_thread(consumers=args.consumers)
+    engine = SessionEngine(max_sessions=args.concurrency, max_queue=args.concurrency)
+
+    samples = []
+    # Demo logs every signaling message; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # Imports, codec setup and allocator pools settle during warm-up
+        run_batch(engine, server.url, args.warmup, args, None)
+        idle_before = sample(engine, 0)
+        run_batch(engine, server.url, args.sessions, args, samples)
+        idle_after = sample(engine, args.sessions)
+    samples.append(idle_after)
+    engine.shutdown()
+
+    stats = engine.stats()
+    print(
+        f"{args.warmup} + {args.sessions} sessions: {stats['completed']} completed,"
+        f" {stats['failed']} failed, {stats['cancelled']} cancelled"
+    )
+    print(f"{'sessions':>9} {'rss MB':>8} {'fds':>6} {'threads':>8} {'tasks':>6}")
+    for row in [idle_before, *samples]:
+        print(
+            f"{row['sessions']:>9} {row['rss_mb']:>8.1f} {row['fds']:>6}"
+            f" {row['threads']:>8} {row['tasks']:>6}"
+        )
+
+    # Idle after warm-up versus idle after the run
+    growth = {
+        key: idle_after[key] - idle_before[key]
+        for key in ("rss_mb", "fds", "threads", "tasks")
+    }
+    print(
+        f"growth while idle: {growth['rss_mb']:+.1f} MB, {growth['fds']:+d} fds,"
+        f" {growth['threads']:+d} threads, {growth['tasks']:+d} tasks"
+    )
+    leaked = (
+        growth["rss_mb"] > args.max_rss_growth
+        or growth["fds"] > 0
+        or growth["threads"] > 0
+        or growth["tasks"] > 0
+    )
+    return 1 if leaked else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Session teardown soak test")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--linger", type=float, default=0.2, help="Seconds each session stays in the room")
+    parser.add_argument("--consumers", type=int, default=2, help="Stand-in newConsumer requests per join")
+    parser.add_argument("--cancel-every", type=int, default=10, help="Cancel every Nth session, 0 never")
+    parser.add_argument("--sample-every", type=int, default=200, help="Sessions between samples")
+    parser.add_argument("--warmup", type=int, default=100, help="Sessions run before the baseline sample")
+    parser.add_argument("--max-rss-growth", type=float, default=20, help="Tolerated RSS growth after warm-up (MB)")
+    sys.exit(main(parser.parse_args()))